@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import bench
+
+
+class BenchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.ws = bench.Workspace(cls.directory, scale=0.1).build()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_fixtures(self):
+        wd = self.ws.weather_data()
+        zipMap = wd.zipMap()
+        self.assertEqual(len(zipMap), self.ws.zips)
+        zip5 = self.ws.sample_zips(1)[0]
+        np.testing.assert_allclose(zipMap[zip5], self.ws.zipMap[zip5], atol=0.01)
+        self.assertEqual(len(wd.stationList(zip5, bench.YEAR, bench.MONTH, n=3)), 3)
+        frame = wd.hourlyFrame(bench.YEAR, bench.MONTH, self.ws.wbans[:2], quality=True)
+        self.assertEqual(sorted(frame["WBAN"].unique()), self.ws.wbans[:2])
+        self.assertGreater(frame["DryBulbFarenheit"].notna().mean(), 0.9)
+        self.assertEqual(len(wd.dailyData(bench.YEAR, bench.MONTH, skip=1)), 31 * self.ws.stations)
+        X, y = bench._weather_set(self.ws, "train")
+        self.assertEqual(X.shape, (int(0.8 * self.ws.rows), 8))
+        self.assertTrue((y >= 0).all())
+
+    def test_measure(self):
+        result = bench.run_isolated("pca_fit", self.ws, repeats=2)
+        self.assertEqual(result["status"], "ok")
+        self.assertEqual(result["items"], int(0.8 * self.ws.rows))
+        self.assertGreater(result["throughput"], 0)
+        self.assertGreater(result["peak_rss_mb"], 0)
+        self.assertIn(bench.measure("lstm_epoch", self.ws, 1)["status"], ("ok", "skipped"))
+
+    def test_compare(self):
+        baseline = {"cases": {"a": {"status": "ok", "median_s": 1.0, "peak_rss_mb": 100.0},
+                              "b": {"status": "ok", "median_s": 1.0, "peak_rss_mb": None},
+                              "c": {"status": "skipped"},
+                              "e": {"status": "ok", "median_s": 3.8e-5, "peak_rss_mb": 50.0}}}
+        results = {"cases": {"a": {"status": "ok", "median_s": 1.2, "peak_rss_mb": 200.0},
+                             "b": {"status": "ok", "median_s": 2.0, "peak_rss_mb": 50.0},
+                             "c": {"status": "ok", "median_s": 9.0, "peak_rss_mb": 9.0},
+                             "d": {"status": "ok", "median_s": 9.0, "peak_rss_mb": 9.0},
+                             "e": {"status": "ok", "median_s": 5.6e-5, "peak_rss_mb": 53.0}}}
+        self.assertEqual(bench.compare(results, baseline, tolerance=0.25),
+                         [("a", "peak_rss_mb", 100.0, 200.0), ("b", "median_s", 1.0, 2.0)])
+        self.assertEqual(bench.compare(results, baseline, tolerance=1.5), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,391 @@
+"""Benchmarks of the ingestion and model hot paths on synthetic fixtures.
+
+The fixtures (see ``fixtures.py``) are generated once per run at the chosen
+scale: a QCLCD month with 50 x scale stations, 1000 x scale zip codes and
+7500 x scale rows of ``weather_*.csv``. Every case is then run in a child
+process of its own, so that its peak resident set size is not hidden by the
+cases before it: the fixture is set up (not timed), run ``repeats`` times and
+the best and median wall-clock times, the throughput at the median and the
+peak RSS of the child are recorded.
+
+Results are printed and can be written to a JSON file; given a baseline (an
+earlier results file) every case is compared with it and the run fails when
+one is slower, or uses more memory, by more than the tolerance (and by more
+than 1 ms or 4 MB).
+
+    python bench.py [-s <scale>] [-r <repeats>] [-k <case name filter>] [-o <results json>]
+                    [-b <baseline json>] [-t <tolerance>] [-d <fixture directory>] [-i]
+
+-i runs the cases in this process (peak RSS is then that of the whole run).
+"""
+import datetime
+import getopt
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # not on Windows: no peak RSS
+    resource = None
+
+import fixtures
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for folder in (os.path.join("Data Processing", "getWeatherDataStanford"), "Datasets", "Principal Components Analysis",
+               "Weighted Linear Regression", "Recurrent Neural Network"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+YEAR, MONTH = 2013, 3
+REPEATS = 3
+TOLERANCE = 0.25  # allowed relative slowdown (and memory growth) against the baseline
+# smallest slowdown and memory growth that count as a regression, whatever the relative change:
+# sub-millisecond cases vary by far more than the tolerance from one run to the next
+MIN_DELTA = {"median_s": 1e-3, "peak_rss_mb": 4.0}
+PCA_K = 4
+LOOKBACK = 24
+
+
+class Skip(Exception):
+    """A case that cannot run here (e.g. an optional dependency is missing)."""
+
+
+class Workspace:
+    """The fixture files of one run."""
+
+    def __init__(self, directory, scale=1.0, seed=0):
+        self.directory = directory
+        self.scale = scale
+        self.stations = max(2, int(50 * scale))
+        self.zips = max(10, int(1000 * scale))
+        self.rows = max(100, int(7500 * scale))
+        self.seed = seed
+
+    def build(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.archive, self.wbans = fixtures.qclcd_month(self.directory, YEAR, MONTH, self.stations, seed=self.seed)
+        self.zipMap = fixtures.zip_sources(self.directory, self.zips, seed=self.seed)
+        self.sets = fixtures.weather_sets(self.directory, self.rows, seed=self.seed)
+        return self
+
+    def weather_data(self, **kwargs):
+        import WeatherData
+        return WeatherData.WeatherData(self.directory, **kwargs)
+
+    def member(self, kind):
+        return f"{YEAR}{MONTH:02d}{kind}.txt"
+
+    def sample_zips(self, count):
+        zips = sorted(self.zipMap)
+        return [zips[i] for i in np.linspace(0, len(zips) - 1, min(count, len(zips))).astype(int)]
+
+
+# Every case takes the workspace and returns (function to time, items per call, unit)
+
+def case_zippedData(ws):
+    wd = ws.weather_data()
+    rows = len(wd.zippedData(ws.archive, ws.member("hourly"), skip=1))
+    keep = ws.wbans[::5]
+    return lambda: wd.zippedData(ws.archive, ws.member("hourly"), colVal=(0, keep), skip=1), rows, "rows"
+
+
+def case_csvDump(ws):
+    import io
+    import zipfile
+    wd = ws.weather_data()
+    with zipfile.ZipFile(ws.archive) as zf:
+        text = zf.read(ws.member("hourly")).decode("latin-1")
+    rows = text.count("\n") - 1
+    return lambda: wd.csvDump(io.StringIO(text, newline=""), ",", skip=1), rows, "rows"
+
+
+def case_hourlyChunks(ws):
+    import qclcdReader
+    wd = ws.weather_data()
+    keep = ws.wbans[::5]
+    rows = len(qclcdReader.concat(wd.hourlyChunks(YEAR, MONTH)))
+    return lambda: qclcdReader.concat(wd.hourlyChunks(YEAR, MONTH, keep)), rows, "rows"
+
+
+def case_zipMap_build(ws):
+    import zipCache
+    wd = ws.weather_data()
+    return lambda: zipCache.ZipCache.fromMap(wd.buildZipMap()), ws.zips, "zips"
+
+
+def case_zipMap_load(ws):
+    ws.weather_data().zipMap()  # writes the cache
+
+    def run():
+        wd = ws.weather_data()
+        return wd.zipMap().lookup(ws.sample_zips(ws.zips))
+    return run, ws.zips, "zips"
+
+
+def case_stationList(ws):
+    wd = ws.weather_data()
+    wd.zipMap()
+    wd.stationData(YEAR, MONTH, skip=1)
+    zips = sorted(ws.zipMap)
+
+    def run():
+        wd.STATION_INDEX.clear()  # rebuild the index from the parsed station file every time
+        return wd.stationLists(zips, YEAR, MONTH, n=3)
+    return run, len(zips), "zips"
+
+
+def case_weatherMonth_combineStacks(ws):
+    zips = ws.sample_zips(max(5, ws.zips // 20))
+    ws.weather_data().zipMap()
+
+    def run():
+        wd = ws.weather_data()  # cold month cache
+        stations = wd.stationLists(zips, YEAR, MONTH, n=3)
+        stack = wd.weatherMonth(zips, YEAR, MONTH, hourly=True, n=3, stackData=True)
+        return [wd.combineStacks(stack, wbans=[s[0] for s in stations[z]], addValues=[("zip5", z)]) for z in zips]
+    return run, len(zips), "zips"
+
+
+def _weather_set(ws, name):
+    import wlr
+    return wlr.import_data(ws.sets[("train", "dev", "test").index(name)])
+
+
+def case_pca_fit(ws):
+    import pca
+    X, _ = _weather_set(ws, "train")
+    return lambda: pca.PCA().fit(X), len(X), "rows"
+
+
+def case_pca_transform(ws):
+    import pca
+    X, _ = _weather_set(ws, "train")
+    model = pca.PCA().fit(X)
+    return lambda: model.transform(X, PCA_K, normalize=True), len(X), "rows"
+
+
+def case_wlr_predict(ws):
+    import wlr
+    X, y = _weather_set(ws, "train")
+    Xq, _ = _weather_set(ws, "test")
+    model = wlr.WeightedLinearRegression(X, y)
+    return lambda: model.predict(Xq, wlr.BEST_TAU), len(Xq), "rows"
+
+
+def case_wlr_predict_local(ws):
+    import wlr
+    X, y = _weather_set(ws, "train")
+    Xq, _ = _weather_set(ws, "test")
+    model = wlr.WeightedLinearRegression(X, y)
+    model.build_index()
+    return lambda: model.predict_local(Xq, wlr.BEST_TAU), len(Xq), "rows"
+
+
+def _windows(ws):
+    import windows
+    data = fixtures.weather_rows(ws.rows, ws.seed)
+    X = (data[:, :-1] - data[:, :-1].min(axis=0)) / np.ptp(data[:, :-1], axis=0)
+    return windows.make_windows(X, data[:, -1], LOOKBACK)
+
+
+def case_lstm_epoch(ws):
+    try:
+        import rnn
+    except ImportError as e:
+        raise Skip(f"rnn.py needs {e.name}")
+    Xw, Yw = _windows(ws)
+    model = rnn.build_lstm_model((LOOKBACK, Xw.shape[2]))
+    config = rnn.TrainingConfig(stages=[(1, 64, 1e-3)], verbose=0)
+    return lambda: rnn.fit_model(model, Xw, Yw, config), len(Xw), "windows"
+
+
+def case_lstm_predict(ws):
+    import predict
+    Xw, _ = _windows(ws)
+    rng = np.random.default_rng(ws.seed)
+    features, units = Xw.shape[2], 64
+
+    def weights(*shape):
+        return (rng.normal(0, 0.1, shape)).astype("float32")
+    layers = [("LSTM", {"kernel": weights(features, 4 * units), "recurrent_kernel": weights(units, 4 * units),
+                        "bias": weights(4 * units), "return_sequences": True}),
+              ("LSTM", {"kernel": weights(units, 4 * units), "recurrent_kernel": weights(units, 4 * units),
+                        "bias": weights(4 * units), "return_sequences": False}),
+              ("Dense", {"kernel": weights(units, 1), "bias": weights(1), "activation": "relu"})]
+    predictor = predict.LstmPredictor(layers, np.zeros(features, "float32"), np.ones(features, "float32"), LOOKBACK)
+    return lambda: predictor.predict(Xw), len(Xw), "windows"
+
+
+CASES = {
+    "zippedData": case_zippedData,
+    "csvDump": case_csvDump,
+    "hourlyChunks": case_hourlyChunks,
+    "zipMap_build": case_zipMap_build,
+    "zipMap_load": case_zipMap_load,
+    "stationList": case_stationList,
+    "weatherMonth_combineStacks": case_weatherMonth_combineStacks,
+    "pca_fit": case_pca_fit,
+    "pca_transform": case_pca_transform,
+    "wlr_predict": case_wlr_predict,
+    "wlr_predict_local": case_wlr_predict_local,
+    "lstm_epoch": case_lstm_epoch,
+    "lstm_predict": case_lstm_predict,
+}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB elsewhere
+
+
+def measure(name, ws, repeats=REPEATS):
+    """Set up and time one case; returns its result record."""
+    try:
+        run, items, unit = CASES[name](ws)
+    except Skip as e:
+        return {"status": "skipped", "reason": str(e)}
+    times = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - tic)
+    median = float(np.median(times))
+    return {"status": "ok", "items": items, "unit": unit, "repeats": repeats, "best_s": min(times), "median_s": median,
+            "throughput": items / median if median > 0 else None, "peak_rss_mb": peak_rss_mb()}
+
+
+def _child(conn, name, ws, repeats):
+    try:
+        conn.send(measure(name, ws, repeats))
+    except Exception:
+        conn.send({"status": "error", "reason": traceback.format_exc(limit=3)})
+    conn.close()
+
+
+def run_isolated(name, ws, repeats=REPEATS):
+    """measure in a forked child, so that the peak RSS is the case's own."""
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return measure(name, ws, repeats)
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(child, name, ws, repeats))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {"status": "error", "reason": f"the process of the case exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def run(ws, names, repeats=REPEATS, isolated=True):
+    cases = {}
+    for name in names:
+        cases[name] = run_isolated(name, ws, repeats) if isolated else measure(name, ws, repeats)
+        report(name, cases[name])
+    return {"meta": {"date": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                     "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(),
+                     "scale": ws.scale, "repeats": repeats, "isolated": isolated},
+            "cases": cases}
+
+
+def report(name, result):
+    if result["status"] != "ok":
+        print(f"{name:28s} {result['status']}: {result['reason'].strip().splitlines()[-1]}")
+        return
+    rss = "" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:8.1f} MB"
+    print(f"{name:28s} {result['median_s'] * 1000:10.1f} ms {result['throughput']:14,.0f} {result['unit']}/s {rss}")
+
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA):
+    """Cases slower (median time) or bigger (peak RSS) than in the baseline by more than tolerance.
+
+    A change must also exceed the absolute min_delta of the metric to count.
+
+    Returns a list of (case, metric, baseline value, value); cases missing from
+    either side or not run successfully are left out.
+    """
+    regressions = []
+    for name, result in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if result.get("status") != "ok" or not base or base.get("status") != "ok":
+            continue
+        for metric in ("median_s", "peak_rss_mb"):
+            if result.get(metric) is None or base.get(metric) is None:
+                continue
+            if result[metric] > base[metric] * (1 + tolerance) and result[metric] - base[metric] > min_delta[metric]:
+                regressions.append((name, metric, base[metric], result[metric]))
+    return regressions
+
+
+def main(argv):
+    instruction = (f"Usage: python {sys.argv[0]} [-s <scale>] [-r <repeats>] [-k <case name filter>] "
+                   "[-o <results json>] [-b <baseline json>] [-t <tolerance>] [-d <fixture directory>] [-i]")
+    try:
+        opts, args = getopt.getopt(argv, "hs:r:k:o:b:t:d:i")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    scale, repeats, pattern, out_path, baseline_path, tolerance, directory, isolated = \
+        1.0, REPEATS, None, None, None, TOLERANCE, None, True
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-s":
+            scale = float(arg)
+        elif opt == "-r":
+            repeats = int(arg)
+        elif opt == "-k":
+            pattern = arg
+        elif opt == "-o":
+            out_path = arg
+        elif opt == "-b":
+            baseline_path = arg
+        elif opt == "-t":
+            tolerance = float(arg)
+        elif opt == "-d":
+            directory = arg
+        elif opt == "-i":
+            isolated = False
+
+    names = [name for name in CASES if pattern is None or pattern in name]
+    temporary = directory is None
+    directory = directory or tempfile.mkdtemp(prefix="bench")
+    try:
+        tic = time.perf_counter()
+        ws = Workspace(directory, scale).build()
+        print(f"Fixtures: {ws.stations} stations, {ws.zips} zips, {ws.rows} weather rows "
+              f"({time.perf_counter() - tic:.1f} s)")
+        results = run(ws, names, repeats, isolated)
+    finally:
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if out_path:
+        with open(out_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), tolerance)
+        for name, metric, before, after in regressions:
+            print(f"REGRESSION {name} {metric}: {before:.4g} -> {after:.4g} ({after / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {tolerance:.0%} against {baseline_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,190 @@
+"""Synthetic inputs for the benchmarks, at a configurable scale.
+
+``qclcd_month`` writes a ``QCLCD{yyyymm}.zip`` archive with the station,
+hourly and daily members laid out like the NOAA ones (same headers, column
+positions and value codes: 'M' missing, 'T' trace, 's' suspect, 'VR' variable
+wind, blank fields), so that every reader of ``WeatherData`` can run on it
+without the real archives. ``zip_sources`` writes the three zip code files
+merged by ``WeatherData.zipMap`` and ``weather_sets`` the ``weather_*.csv``
+files read by the WLR, PCA and RNN scripts.
+
+Everything is drawn from a seeded generator, so two runs at the same scale
+benchmark the same bytes.
+"""
+import calendar
+import io
+import os
+import zipfile
+
+import numpy as np
+
+STATION_COLUMNS = ["WBAN", "WMO", "CallSign", "ClimateDivisionCode", "ClimateDivisionStateCode",
+                   "ClimateDivisionStationCode", "Name", "State", "Location", "Latitude", "Longitude", "GroundHeight",
+                   "StationHeight", "Barometer", "TimeZone"]
+HOURLY_COLUMNS = ["WBAN", "Date", "Time", "StationType", "SkyCondition", "SkyConditionFlag", "Visibility",
+                  "VisibilityFlag", "WeatherType", "WeatherTypeFlag", "DryBulbFarenheit", "DryBulbFarenheitFlag",
+                  "DryBulbCelsius", "DryBulbCelsiusFlag", "WetBulbFarenheit", "WetBulbFarenheitFlag", "WetBulbCelsius",
+                  "WetBulbCelsiusFlag", "DewPointFarenheit", "DewPointFarenheitFlag", "DewPointCelsius",
+                  "DewPointCelsiusFlag", "RelativeHumidity", "RelativeHumidityFlag", "WindSpeed", "WindSpeedFlag",
+                  "WindDirection", "WindDirectionFlag", "ValueForWindCharacter", "ValueForWindCharacterFlag",
+                  "StationPressure", "StationPressureFlag", "PressureTendency", "PressureTendencyFlag",
+                  "PressureChange", "PressureChangeFlag", "SeaLevelPressure", "SeaLevelPressureFlag", "RecordType",
+                  "RecordTypeFlag", "HourlyPrecip", "HourlyPrecipFlag", "Altimeter", "AltimeterFlag"]
+DAILY_COLUMNS = ["WBAN", "YearMonthDay", "Tmax", "TmaxFlag", "Tmin", "TminFlag", "Tavg", "TavgFlag", "Depart",
+                 "DepartFlag", "DewPoint", "DewPointFlag", "WetBulb", "WetBulbFlag", "Heat", "HeatFlag", "Cool",
+                 "CoolFlag", "Sunrise", "SunriseFlag", "Sunset", "SunsetFlag", "CodeSum", "CodeSumFlag", "Depth",
+                 "DepthFlag", "Water1", "Water1Flag", "SnowFall", "SnowFallFlag", "PrecipTotal", "PrecipTotalFlag",
+                 "StnPressure", "StnPressureFlag", "SeaLevel", "SeaLevelFlag", "ResultSpeed", "ResultSpeedFlag",
+                 "ResultDir", "ResultDirFlag", "AvgSpeed", "AvgSpeedFlag", "Max5Speed", "Max5SpeedFlag", "Max5Dir",
+                 "Max5DirFlag", "Max2Speed", "Max2SpeedFlag", "Max2Dir", "Max2DirFlag"]
+
+# continental US box the stations and zip codes are drawn in
+LAT_RANGE = (25.0, 49.0)
+LON_RANGE = (-124.0, -67.0)
+SKY = np.array(["CLR", "FEW018", "SCT025 BKN070", "BKN012 OVC030", "OVC008", "M"])
+
+
+def wbans(count):
+    """The WBAN of each synthetic station: 5 digits, from 00001."""
+    return [f"{i + 1:05d}" for i in range(count)]
+
+
+def _coded(values, rng, missing=0.05, suspect=0.02, fmt="{:.0f}"):
+    # numbers with a share of 'M' and of suspect 's' values
+    out = np.array([fmt.format(v) for v in values], dtype=object)
+    draw = rng.random(len(out))
+    out[draw < missing] = "M"
+    flagged = (draw >= missing) & (draw < missing + suspect)
+    out[flagged] = out[flagged] + "s"
+    return out
+
+
+def station_text(stations, rng):
+    lat = rng.uniform(*LAT_RANGE, len(stations))
+    lon = rng.uniform(*LON_RANGE, len(stations))
+    lines = ["|".join(STATION_COLUMNS)]
+    for wban, la, lo in zip(stations, lat, lon):
+        lines.append("|".join([wban, "", f"K{wban[-3:]}", "", "", "", f"STATION {wban}", "XX", "SOMEWHERE",
+                               f"{la:.4f}", f"{lo:.4f}", "100", "110", "", "-6"]))
+    return "\r\n".join(lines) + "\r\n"
+
+
+def hourly_text(stations, year, month, days, rng, extra=0.1):
+    """Hourly member: one report at :53 of every hour, and a special report in a share of the hours."""
+    hours = np.arange(days * 24)
+    columns = []
+    for wban in stations:
+        times = np.sort(np.concatenate([hours * 60 + 53, hours[rng.random(len(hours)) < extra] * 60 + 20]))
+        n = len(times)
+        temp = 50 + 20 * np.sin(2 * np.pi * times / 1440.0) + rng.normal(0, 3, n)
+        dew = temp - rng.uniform(2, 20, n)
+        block = np.full((n, len(HOURLY_COLUMNS)), "", dtype=object)
+        block[:, 0] = wban
+        block[:, 1] = [f"{year}{month:02d}{d:02d}" for d in times // 1440 + 1]
+        block[:, 2] = [f"{h:02d}{m:02d}" for h, m in zip((times % 1440) // 60, times % 60)]
+        block[:, 3] = "0"
+        block[:, 4] = SKY[rng.integers(0, len(SKY), n)]
+        block[:, 6] = _coded(rng.uniform(0, 10, n), rng, fmt="{:.2f}")
+        block[:, 10] = _coded(temp, rng)
+        block[:, 12] = _coded((temp - 32) / 1.8, rng, fmt="{:.1f}")
+        block[:, 18] = _coded(dew, rng)
+        block[:, 20] = _coded((dew - 32) / 1.8, rng, fmt="{:.1f}")
+        block[:, 22] = _coded(rng.uniform(20, 100, n), rng)
+        wind = _coded(rng.integers(0, 25, n), rng)
+        wind[rng.random(n) < 0.03] = "VR"
+        block[:, 24] = wind
+        block[:, 26] = _coded(rng.integers(0, 36, n) * 10, rng)
+        block[:, 30] = _coded(rng.uniform(28.5, 30.5, n), rng, fmt="{:.2f}")
+        block[:, 36] = _coded(rng.uniform(29.5, 30.5, n), rng, fmt="{:.2f}")
+        rain = rng.random(n)
+        block[:, 40] = np.where(rain < 0.05, "T", np.where(rain < 0.1, [f"{v:.2f}" for v in rain], " "))
+        block[:, 42] = _coded(rng.uniform(29.5, 30.5, n), rng, fmt="{:.2f}")
+        columns.append(block)
+    rows = np.concatenate(columns) if columns else np.empty((0, len(HOURLY_COLUMNS)), dtype=object)
+    out = io.StringIO()
+    out.write(",".join(HOURLY_COLUMNS) + "\r\n")
+    out.writelines(",".join(row) + "\r\n" for row in rows.tolist())
+    return out.getvalue()
+
+
+def daily_text(stations, year, month, days, rng):
+    lines = [",".join(DAILY_COLUMNS)]
+    for wban in stations:
+        tmax = rng.uniform(50, 90, days)
+        tmin = tmax - rng.uniform(5, 25, days)
+        values = {2: _coded(tmax, rng), 4: _coded(tmin, rng), 6: _coded((tmax + tmin) / 2, rng),
+                  10: _coded(tmin - 5, rng), 30: _coded(rng.exponential(0.1, days), rng, fmt="{:.2f}"),
+                  40: _coded(rng.uniform(0, 20, days), rng, fmt="{:.1f}")}
+        for d in range(days):
+            row = [""] * len(DAILY_COLUMNS)
+            row[0], row[1] = wban, f"{year}{month:02d}{d + 1:02d}"
+            for i, column in values.items():
+                row[i] = column[d]
+            lines.append(",".join(row))
+    return "\r\n".join(lines) + "\r\n"
+
+
+def qclcd_month(data_dir, year, month, stations=50, days=None, seed=0):
+    """Write QCLCD{yyyymm}.zip in data_dir for the given number of stations; returns its path and the WBANs."""
+    rng = np.random.default_rng(seed)
+    days = days or calendar.monthrange(year, month)[1]
+    codes = wbans(stations)
+    path = os.path.join(data_dir, f"QCLCD{year}{month:02d}.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr(f"{year}{month:02d}station.txt", station_text(codes, rng))
+        zf.writestr(f"{year}{month:02d}hourly.txt", hourly_text(codes, year, month, days, rng))
+        zf.writestr(f"{year}{month:02d}daily.txt", daily_text(codes, year, month, days, rng))
+    return path, codes
+
+
+def zip_sources(data_dir, zips=1000, seed=0):
+    """Write the zip code sources of WeatherData.zipMap (overlapping, as the real ones); returns {zip5: (lat, lon)}."""
+    rng = np.random.default_rng(seed)
+    codes = np.sort(rng.choice(np.arange(501, 99951), size=zips, replace=False))
+    lat = rng.uniform(*LAT_RANGE, zips)
+    lon = rng.uniform(*LON_RANGE, zips)
+    thirds = np.array_split(np.arange(zips), 3)
+    with open(os.path.join(data_dir, "Erle_zipcodes.csv"), "w", encoding="utf-8") as f:
+        f.write("zip,city,state,latitude,longitude,timezone,dst\n")
+        for i in np.concatenate([thirds[0], thirds[1]]):
+            f.write(f"{codes[i]:05d},CITY,XX,{lat[i]:.6f},{lon[i]:.6f},-6,1\n")
+    with zipfile.ZipFile(os.path.join(data_dir, "2015_Gaz_zcta_national.zip"), "w") as zf:
+        lines = ["GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG"]
+        lines += [f"{codes[i]:05d}\t0\t0\t0\t0\t{lat[i]:.6f}\t{lon[i]:.6f}" for i in np.concatenate([thirds[1], thirds[2]])]
+        zf.writestr("2015_Gaz_zcta_national.txt", "\n".join(lines) + "\n")
+    with zipfile.ZipFile(os.path.join(data_dir, "free-zipcode-database-Primary.zip"), "w") as zf:
+        lines = ["Zipcode,ZipCodeType,City,State,LocationType,Lat,Long"]
+        lines += [f"{codes[i]:05d},STANDARD,CITY,XX,PRIMARY,{lat[i]:.2f},{lon[i]:.2f}" for i in thirds[2]]
+        lines.append("00000,MILITARY,APO,AE,PRIMARY,,")  # no location, skipped by buildZipMap
+        zf.writestr("free-zipcode-database-Primary.csv", "\n".join(lines) + "\n")
+    return {int(c): (float(a), float(o)) for c, a, o in zip(codes, lat, lon)}
+
+
+def weather_rows(rows, seed=0):
+    """(rows x 10) float32 array in the layout of weather_*.csv: hour, the 8 weather features, energy."""
+    rng = np.random.default_rng(seed)
+    hour = rng.integers(1, 25, rows)
+    cloud = rng.uniform(0, 1, rows)
+    visibility = rng.uniform(0, 10, rows)
+    temperature = rng.normal(12, 10, rows)
+    dew = temperature - rng.uniform(0, 15, rows)
+    humidity = rng.uniform(20, 100, rows)
+    wind = rng.gamma(2, 5, rows)
+    pressure = rng.normal(29.2, 0.2, rows)
+    altimeter = pressure + 0.8 + rng.normal(0, 0.02, rows)
+    sun = np.clip(np.sin(np.pi * (hour - 6) / 14), 0, None)
+    energy = np.clip(4000 * sun * (1 - 0.7 * cloud) + 20 * temperature + rng.normal(0, 150, rows), 0, None)
+    return np.column_stack([hour, cloud, visibility, temperature, dew, humidity, wind, pressure, altimeter,
+                            energy]).astype("float32")
+
+
+def weather_sets(out_dir, rows=7500, seed=0, fractions=(0.8, 0.1, 0.1)):
+    """Write weather_{train,dev,test}.csv (';' separated, no header) to out_dir; returns their paths."""
+    data = weather_rows(rows, seed)
+    bounds = (np.concatenate([[0], np.cumsum(fractions)]) / np.sum(fractions) * rows).round().astype(int)
+    paths = []
+    for name, start, stop in zip(("train", "dev", "test"), bounds[:-1], bounds[1:]):
+        path = os.path.join(out_dir, f"weather_{name}.csv")
+        np.savetxt(path, data[start:stop], fmt="%.6g", delimiter=";")
+        paths.append(path)
+    return paths
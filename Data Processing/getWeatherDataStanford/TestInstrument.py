@@ -0,0 +1,76 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import instrument
+import qclcdReader
+from TestQclcdReader import hourlyText
+
+
+class InstrumentTest(unittest.TestCase):
+
+    def tearDown(self):
+        instrument.disable()
+
+    def test_disabled(self):
+        self.assertFalse(instrument.enabled())
+        self.assertIs(instrument.span('a'), instrument.span('b', x=1))
+        with instrument.span('a'):
+            instrument.count('rows', 10)
+        self.assertIsNone(instrument.current())
+
+    def test_spans(self):
+        profile = instrument.enable()
+        with instrument.span('month'):
+            with instrument.span('parse'):
+                time.sleep(0.02)
+                instrument.count('rows', 5)
+            with instrument.span('parse'):
+                instrument.count('rows', 7)
+            time.sleep(0.01)
+        summary = profile.summary()
+        self.assertEqual(summary['counters'], {'rows': 12})
+        self.assertEqual(summary['spans']['parse']['calls'], 2)
+        month = summary['spans']['month']
+        self.assertGreaterEqual(month['seconds'], 0.03)
+        self.assertAlmostEqual(month['selfSeconds'], month['seconds'] - summary['spans']['parse']['seconds'], places=6)
+        self.assertLess(month['selfSeconds'], 0.02)
+        self.assertEqual(summary['spans']['parse']['seconds'], summary['spans']['parse']['selfSeconds'])
+
+        worker = instrument.Profile()
+        with worker.span('parse'):
+            worker.count('rows', 1)
+        profile.merge(worker.dump())
+        self.assertEqual(profile.summary()['spans']['parse']['calls'], 3)
+        self.assertEqual(profile.counters['rows'], 13)
+
+        directory = tempfile.mkdtemp()
+        try:
+            trace = profile.save(os.path.join(directory, 'run.trace.json'))
+            with open(trace) as f:
+                events = json.load(f)['traceEvents']
+            self.assertEqual(sorted(e['name'] for e in events if e['ph'] == 'X'), ['month', 'parse', 'parse', 'parse'])
+            self.assertEqual(min(e['ts'] for e in events), 0)
+            self.assertEqual([e['args']['rows'] for e in events if e['ph'] == 'C'], [5, 12, 1])
+            with open(profile.save(os.path.join(directory, 'run.json'))) as f:
+                self.assertEqual(json.load(f)['counters'], {'rows': 13})
+        finally:
+            shutil.rmtree(directory)
+
+    def test_reader(self):
+        profile = instrument.enable()
+        data = hourlyText(['03013', '14732', '94728'])
+        frame = qclcdReader.readFrame(io.BytesIO(data), wbans=['14732'], blockSize=1000)
+        self.assertEqual(profile.counters['qclcd.rowsRead'], 3 * 72)
+        self.assertEqual(profile.counters['qclcd.rowsKept'], len(frame))
+        spans = profile.summary()['spans']
+        self.assertEqual(spans['parse']['calls'], 1)
+        self.assertGreater(spans['unzip']['calls'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+import WeatherData as weather
+import monthCache
+from TestQclcdReader import hourlyText
+
+
+class MonthCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataDir = tempfile.mkdtemp()
+        with zipfile.ZipFile(os.path.join(self.dataDir, 'QCLCD201303.zip'), 'w') as zf:
+            zf.writestr('201303hourly.txt', hourlyText(['03013', '14732', '94728', '23234']))
+            zf.writestr('201303station.txt', 'WBAN|WMO|CallSign\n03013|1|A\n14732|2|B\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dataDir)
+
+    def frame(self, rows):
+        return pd.DataFrame({'WBAN': [f'{i % 4:05d}' for i in range(rows)], 'Value': np.arange(rows, dtype=np.float32)})
+
+    def test_lru(self):
+        cache = monthCache.MonthCache(maxBytes=3 * monthCache.sizeOf(self.frame(100)) + 10)
+        loads = []
+        for m in [1, 2, 3, 1, 4, 2]:
+            cache.get(2013, m, 'hourly', None, lambda: loads.append(m) or self.frame(100))
+        # 1 stays ahead of 2 once it is used again, so 2 is the one evicted by 4
+        self.assertEqual(loads, [1, 2, 3, 4, 2])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 5)
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertLessEqual(cache.bytes, cache.maxBytes)
+
+        # a subset of the stations of a cached frame is filtered from it
+        subset = cache.get(2013, 2, 'hourly', [1, '00003'], lambda: self.fail('reloaded'))
+        self.assertEqual(sorted(subset['WBAN'].unique()), ['00001', '00003'])
+        self.assertEqual(len(subset), 50)
+        self.assertEqual(cache.stats()['supersetHits'], 1)
+
+    def test_spill(self):
+        spillDir = os.path.join(self.dataDir, 'spill')
+        cache = monthCache.MonthCache(maxBytes=monthCache.sizeOf(self.frame(100)) + 10, spillDir=spillDir)
+        first = cache.get(2013, 1, 'hourly', ['00001'], lambda: self.frame(100))
+        cache.get(2013, 2, 'hourly', None, lambda: self.frame(100))
+        self.assertEqual(len(os.listdir(spillDir)), 1)
+        again = cache.get(2013, 1, 'hourly', ['00001'], lambda: self.fail('reloaded'))
+        assert_frame_equal(first, again)
+        self.assertEqual(cache.stats()['spillHits'], 1)
+        cache.clear()
+        self.assertEqual(os.listdir(spillDir), [])
+
+    def test_weatherData(self):
+        wd = weather.WeatherData(self.dataDir)
+        east = wd.hourlyFrame(2013, 3, wbans=['03013', '14732'], usecols=[0, 1, 2, 12])
+        stations = wd.stationData(2013, 3, skip=1)
+        # the archive is not read again: everything below comes from the cache
+        wd.hourlyChunks = wd.zippedData = lambda *args: self.fail('archive read')
+        assert_frame_equal(east, wd.hourlyFrame(2013, 3, wbans=['03013', '14732'], usecols=[0, 1, 2, 12]))
+        self.assertEqual(len(wd.hourlyFrame(2013, 3, wbans=[3013], usecols=[0, 1, 2, 12])), 72)
+        self.assertEqual(wd.stationData(2013, 3, skip=1), stations)
+        self.assertEqual(wd.MONTH_CACHE.stats()['misses'], 2)
+
+        # callers get copies
+        wd.stationData(2013, 3, skip=1)[0][0] = 'changed'
+        frame = wd.hourlyFrame(2013, 3, wbans=['03013', '14732'], usecols=[0, 1, 2, 12])
+        frame.iloc[0, 0] = 'changed'
+        self.assertEqual(wd.stationData(2013, 3, skip=1), stations)
+        assert_frame_equal(east, wd.hourlyFrame(2013, 3, wbans=['03013', '14732'], usecols=[0, 1, 2, 12]))
+
+    def test_archiveVersion(self):
+        wd = weather.WeatherData(self.dataDir)
+        self.assertEqual(len(wd.stationData(2013, 3, skip=1)), 2)
+        # an archive downloaded again replaces the entries of the old one
+        path = os.path.join(self.dataDir, 'QCLCD201303.zip')
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('201303station.txt', 'WBAN|WMO|CallSign\n03013|1|A\n14732|2|B\n94728|3|C\n')
+        self.assertEqual(len(wd.stationData(2013, 3, skip=1)), 3)
+        self.assertEqual(wd.MONTH_CACHE.stats()['misses'], 2)
+        self.assertEqual(wd.MONTH_CACHE.stats()['entries'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+import WeatherData as weather
+import qclcdReader
+
+HOURLY_COLUMNS = ['WBAN', 'Date', 'Time', 'StationType', 'SkyCondition', 'SkyConditionFlag', 'Visibility',
+                  'VisibilityFlag', 'WeatherType', 'WeatherTypeFlag', 'DryBulbFarenheit', 'DryBulbFarenheitFlag',
+                  'DryBulbCelsius', 'DryBulbCelsiusFlag', 'WetBulbFarenheit', 'WetBulbFarenheitFlag', 'WetBulbCelsius',
+                  'WetBulbCelsiusFlag', 'DewPointFarenheit', 'DewPointFarenheitFlag', 'DewPointCelsius',
+                  'DewPointCelsiusFlag', 'RelativeHumidity', 'RelativeHumidityFlag', 'WindSpeed', 'WindSpeedFlag',
+                  'WindDirection', 'WindDirectionFlag', 'ValueForWindCharacter', 'ValueForWindCharacterFlag',
+                  'StationPressure', 'StationPressureFlag', 'PressureTendency', 'PressureTendencyFlag', 'PressureChange',
+                  'PressureChangeFlag', 'SeaLevelPressure', 'SeaLevelPressureFlag', 'RecordType', 'RecordTypeFlag',
+                  'HourlyPrecip', 'HourlyPrecipFlag', 'Altimeter', 'AltimeterFlag']
+
+
+def hourlyText(wbans, days=3):
+    lines = [','.join(HOURLY_COLUMNS)]
+    for wban in wbans:
+        for day in range(1, days + 1):
+            for hour in range(24):
+                row = [''] * len(HOURLY_COLUMNS)
+                row[:3] = [wban, f'201303{day:02d}', f'{hour:02d}53']
+                row[3] = '0'
+                row[4] = 'FEW018 BKN070'
+                row[6] = '10.00'
+                row[12] = 'M' if hour == 5 else f'{hour / 2:.1f}'
+                row[20] = f'-{hour / 4:.1f}'
+                row[22] = str(50 + hour)
+                row[24] = '5'
+                row[30] = '29.85'
+                row[40] = 'T' if hour == 7 else ' '
+                row[42] = '30.02'
+                lines.append(','.join(row))
+    return ('\r\n'.join(lines) + '\r\n').encode()
+
+
+class QclcdReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.wbans = ['03013', '14732', '94728', '23234', '00102', '7321']
+        self.data = hourlyText(self.wbans)
+        self.wd = weather.WeatherData(tempfile.gettempdir())
+
+    def expected(self, keep, subset):
+        return self.wd.csvDump(io.StringIO(self.data.decode(), newline=''), ',', (0, keep), subset, skip=1)
+
+    def test_filterProject(self):
+        subset = [0, 1, 2, 4, 12, 22, 40]
+        for keep in [['14732'], ['03013', '7321', '99999'], []]:
+            for blockSize in [1 << 20, 1000, 37]:
+                frame = qclcdReader.readFrame(io.BytesIO(self.data), wbans=keep, usecols=subset, raw=True,
+                                              blockSize=blockSize, chunkRows=50)
+                self.assertEqual(list(frame.columns), [HOURLY_COLUMNS[i] for i in subset])
+                self.assertEqual(frame.values.tolist(), [[v.strip() for v in row] for row in self.expected(set(keep), subset)])
+
+    def test_types(self):
+        chunks = list(qclcdReader.readChunks(io.BytesIO(self.data), wbans=[3013, '7321'],
+                                             usecols=['WBAN', 'Date', 'Time', 'SkyCondition', 'DryBulbCelsius', 'HourlyPrecip'],
+                                             quality=True, chunkRows=24, blockSize=512))
+        self.assertGreater(len(chunks), 1)
+        frame = qclcdReader.concat(chunks)
+        self.assertEqual(len(frame), 2 * 72)
+        self.assertEqual(sorted(frame['WBAN'].unique()), ['03013', '7321'])
+        self.assertEqual(frame['Date'].dtype, np.int32)
+        self.assertEqual(frame['Time'].dtype, np.int16)
+        self.assertEqual(frame['DryBulbCelsius'].dtype, np.float32)
+        self.assertEqual(frame['SkyCondition'].dtype, np.float32)
+        self.assertEqual(frame['SkyCondition'][0], 7)  # oktas of the broken layer
+        self.assertEqual(frame['SkyConditionQuality'][0], 0)
+        self.assertEqual(frame['Date'][0], 20130301)
+        self.assertTrue(np.isnan(frame['DryBulbCelsius'][5]))
+        self.assertAlmostEqual(frame['DryBulbCelsius'][6], 3.0)
+        self.assertEqual(frame['HourlyPrecip'].tolist().count(0), 6)  # the daily 'T' trace of each station
+
+    def test_hourlyFrame(self):
+        dataDir = tempfile.mkdtemp()
+        try:
+            with zipfile.ZipFile(os.path.join(dataDir, 'QCLCD201303.zip'), 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('201303hourly.txt', self.data)
+                zf.writestr('201303daily.txt', 'WBAN,YearMonthDay,Tmax,Tmin\n03013,20130301,54,30\n14732,20130301,40,M\n')
+            wd = weather.WeatherData(dataDir)
+            frame = wd.hourlyFrame(2013, 3, wbans=['94728'], usecols=[0, 1, 2, 12])
+            self.assertEqual(len(frame), 72)
+            self.assertEqual(frame.shape[1], 4)
+            daily = wd.dailyFrame(2013, 3, wbans=['14732'])
+            self.assertEqual(daily['YearMonthDay'].tolist(), [20130301])
+            self.assertTrue(np.isnan(daily['Tmin'][0]))
+            self.assertEqual(len(wd.dailyData(2013, 3, colVal=(0, ['03013']), skip=1)), 1)
+            self.assertEqual(len(wd.hourlyFrame(2013, 3, wbans=['12345'])), 0)
+        finally:
+            shutil.rmtree(dataDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+import WeatherData as weather
+import stationIndex
+import zipCache
+
+
+def stationRows(count, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(count):
+        lat, lon = rng.uniform(25, 49), rng.uniform(-124, -67)
+        rows.append([f'{i:05d}', '', '', '', '', '', f'STATION {i}', 'XX', f'LOCATION {i}', f'{lat:.4f}', f'{lon:.4f}', '100'])
+    rows.append(['99999', '', '', '', '', '', 'NO LOCATION', 'XX', 'NOWHERE', '', '', ''])
+    return rows
+
+
+class StationIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = stationRows(500)
+        self.index = stationIndex.StationIndex(self.rows, useTree=False)
+        rng = np.random.default_rng(1)
+        self.lat = rng.uniform(30, 45, 40)
+        self.lon = rng.uniform(-120, -70, 40)
+        self.wd = weather.WeatherData(tempfile.gettempdir())
+
+    def bruteForce(self, lat, lon):
+        dist = [(self.wd.distLatLon(lat, lon, float(r[9]), float(r[10])), r[0]) for r in self.rows[:-1]]
+        return sorted(dist)
+
+    def test_nearest(self):
+        self.assertEqual(len(self.index), 500)
+        found = self.index.query(self.lat, self.lon, n=5)
+        for lat, lon, stations in zip(self.lat, self.lon, found):
+            expected = self.bruteForce(lat, lon)[:5]
+            self.assertEqual([s[0] for s in stations], [e[1] for e in expected])
+            np.testing.assert_allclose([s[1] for s in stations], [e[0] for e in expected], rtol=1e-9)
+            self.assertEqual(stations[0][7], self.rows[int(stations[0][0])][6])
+
+    def test_within(self):
+        found = self.index.query(self.lat, self.lon, n=0, preferredDistKm=150)
+        for lat, lon, stations in zip(self.lat, self.lon, found):
+            expected = [e for e in self.bruteForce(lat, lon) if e[0] <= 150]
+            self.assertEqual([s[0] for s in stations], [e[1] for e in expected])
+
+    @unittest.skipIf(stationIndex.BallTree is None, 'scikit-learn is not installed')
+    def test_ballTree(self):
+        tree = stationIndex.StationIndex(self.rows, useTree=True)
+        self.assertEqual(tree.query(self.lat, self.lon, n=5), self.index.query(self.lat, self.lon, n=5))
+        self.assertEqual([[s[0] for s in found] for found in tree.query(self.lat, self.lon, n=0, preferredDistKm=150)],
+                         [[s[0] for s in found] for found in self.index.query(self.lat, self.lon, n=0, preferredDistKm=150)])
+
+    def test_stationList(self):
+        dataDir = tempfile.mkdtemp()
+        try:
+            with zipfile.ZipFile(os.path.join(dataDir, 'QCLCD201303.zip'), 'w') as zf:
+                zf.writestr('201303station.txt', '\n'.join('|'.join(r) for r in [['WBAN'] + [''] * 11] + self.rows))
+            wd = weather.WeatherData(dataDir)
+            wd.ZIP_MAP = zipCache.ZipCache.fromMap({12601: (41.7, -73.9), 94305: (37.4, -122.2)})
+            closest = wd.stationList(12601, 2013, 3, n=3)
+            self.assertEqual([s[0] for s in closest], [e[1] for e in self.bruteForce(41.7, -73.9)[:3]])
+            print(wd.summarizeStation(closest[0]))
+            both = wd.stationLists(['12601', 94305], 2013, 3, n=0, preferredDistKm=200)
+            self.assertEqual(sorted(both), [12601, 94305])
+            self.assertEqual(both[12601], wd.stationList(12601, 2013, 3, n=0, preferredDistKm=200))
+            with self.assertRaises(KeyError):
+                wd.stationList(999, 2013, 3)
+        finally:
+            shutil.rmtree(dataDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import WeatherData as weather
+import weatherCombine
+import zipCache
+from TestQclcdReader import HOURLY_COLUMNS
+
+STATIONS = {'03013': (41.70, -73.90), '14732': (41.75, -73.80), '94728': (41.60, -74.10), '23234': (37.40, -122.20),
+            '00102': (37.50, -122.10)}
+ZIPS = {12601: (41.70, -73.92), 94305: (37.42, -122.17)}
+
+
+def hourlyText(seed=0, days=4):
+    rng = np.random.default_rng(seed)
+    lines = [','.join(HOURLY_COLUMNS)]
+    for wban in STATIONS:
+        for day in range(1, days + 1):
+            for hour in range(24):
+                if rng.random() < 0.1:
+                    continue  # no report that hour
+                for minute in (['53', '20'] if rng.random() < 0.2 else ['53']):
+                    row = [''] * len(HOURLY_COLUMNS)
+                    row[:3] = [wban, f'201303{day:02d}', f'{hour:02d}{minute}']
+                    row[10] = 'M' if rng.random() < 0.15 else f'{rng.integers(20, 80)}'
+                    row[18] = f'{rng.integers(0, 40)}s'
+                    row[22] = str(rng.integers(20, 100))
+                    row[24] = 'VR' if rng.random() < 0.1 else str(rng.integers(0, 20))
+                    row[30] = f'{rng.uniform(29, 31):.2f}'
+                    row[40] = 'T' if rng.random() < 0.1 else ' '
+                    lines.append(','.join(row))
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def stationText():
+    rows = [['WBAN'] + [''] * 11]
+    for wban, (lat, lon) in STATIONS.items():
+        rows.append([wban, '', '', '', '', '', f'STATION {wban}', 'XX', 'LOCATION', str(lat), str(lon), '100'])
+    return '\n'.join('|'.join(r) for r in rows)
+
+
+class WeatherCombineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataDir = tempfile.mkdtemp()
+        with zipfile.ZipFile(os.path.join(cls.dataDir, 'QCLCD201303.zip'), 'w') as zf:
+            zf.writestr('201303station.txt', stationText())
+            zf.writestr('201303hourly.txt', hourlyText())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dataDir)
+
+    def setUp(self):
+        self.wd = weather.WeatherData(self.dataDir)
+        self.wd.ZIP_MAP = zipCache.ZipCache.fromMap(ZIPS)
+
+    def stationMeans(self, rows, wbans):
+        # the original stackHourlyWeatherData: hour of HHMM floored, values that are not plain numbers are NaN,
+        # duplicate hours of a station averaged and every station reindexed on all the hours of the rows
+        names = ['Tmean', 'DewPoint', 'Pressure', 'WindSpeed', 'RH', 'HourlyPrecip']
+        wdf = pd.DataFrame([[r[i] for i in (0, 1, 2, 10, 18, 30, 24, 22, 40)] for r in rows],
+                           columns=['WBAN', 'dateStr', 'hrStr'] + names)
+        wdf['date'] = pd.to_datetime(wdf['dateStr'] + wdf['hrStr'].str[0:2], format='%Y%m%d%H')
+        hrs = pd.date_range(wdf['date'].min(), wdf['date'].max(), freq='h')
+        for name in names:
+            wdf[name] = pd.to_numeric(wdf[name], errors='coerce')
+        return [wdf[wdf['WBAN'] == w].groupby('date')[names].mean().reindex(hrs) for w in wbans]
+
+    def original(self, rows, wbans, removeBlanks=True):
+        # the original combineStacks: mean of the stations, skipping NaN, and the rows without Tmean removed
+        combined = pd.concat(self.stationMeans(rows, wbans)).groupby(level=0).mean()
+        if removeBlanks:
+            combined = combined[np.isfinite(combined['Tmean'])]
+        return combined
+
+    def assertFrameValues(self, flat, expected):
+        self.assertEqual(list(flat.columns[:len(expected.columns)]), list(expected.columns))
+        np.testing.assert_array_equal(flat.index.to_numpy().astype('datetime64[m]'),
+                                      expected.index.to_numpy().astype('datetime64[m]'))
+        np.testing.assert_allclose(flat[expected.columns].to_numpy(dtype=np.float64), expected.to_numpy(), rtol=1e-5)
+
+    def test_combineZips(self):
+        stations = self.wd.stationLists(ZIPS, 2013, 3, n=2)
+        stack = self.wd.weatherMonth(list(ZIPS), 2013, 3, hourly=True, n=2, stackData=True)
+        rows = self.wd.weatherMonth(list(ZIPS), 2013, 3, hourly=True, n=2)
+        combined = self.wd.combineZips(stack, stations)
+        blanks = self.wd.combineZips(stack, stations, removeBlanks=False)
+        weighted = self.wd.combineZips(stack, stations, removeBlanks=False, weighted=True)
+        for zip5, found in stations.items():
+            wbans = [s[0] for s in found]
+            flat = combined[zip5]
+            self.assertEqual(list(flat.columns), ['Tmean', 'DewPoint', 'Pressure', 'WindSpeed', 'RH', 'HourlyPrecip',
+                                                  'zip5'])
+            self.assertTrue((flat['zip5'] == zip5).all())
+            self.assertFrameValues(flat, self.original(rows, wbans))
+            self.assertFrameValues(blanks[zip5], self.original(rows, wbans, removeBlanks=False))
+
+            w = np.array([1.0 / max(s[1], weatherCombine.MIN_DIST_KM) for s in found])
+            v = np.stack([f.to_numpy() for f in self.stationMeans(rows, wbans)])
+            valid = ~np.isnan(v)
+            with np.errstate(invalid='ignore'):
+                expected = np.einsum('s,stf->tf', w, np.where(valid, v, 0)) / np.einsum('s,stf->tf', w, valid)
+            np.testing.assert_allclose(weighted[zip5].iloc[:, :-1].to_numpy(dtype=np.float64), expected, rtol=1e-5)
+
+    def test_rowsAndStack(self):
+        rows = self.wd.weatherMonth(12601, 2013, 3, hourly=True)
+        stack = self.wd.weatherMonth(12601, 2013, 3, hourly=True, stackData=True)
+        wbans = [s[0] for s in self.wd.stationList(12601, 2013, 3, n=5, preferredDistKm=15)]
+        pd.testing.assert_frame_equal(self.wd.combineStacks(self.wd.stackHourlyWeatherData(rows), addValues=[('zip5', 12601)]),
+                                      self.wd.combineStacks(stack, wbans=wbans, addValues=[('zip5', 12601)]))
+        with self.assertRaises(KeyError):
+            self.wd.weatherMonth(999, 2013, 3)
+
+    def test_flooredHours(self):
+        self.assertEqual(weatherCombine.timestamps([20130331], [2353])[0],
+                         np.datetime64('2013-03-31T23:00').astype('datetime64[m]').astype(np.int64))
+        flat = self.wd.combineHourlyWeatherData(self.wd.weatherMonth(12601, 2013, 3, hourly=True), removeBlanks=False)
+        self.assertEqual(flat.index.max(), pd.Timestamp(2013, 3, 4, 23))
+        self.assertEqual(flat.index.min(), pd.Timestamp(2013, 3, 1, 0))
+
+    def test_removeBlanks(self):
+        rows = self.wd.weatherMonth(94305, 2013, 3, hourly=True, n=1)
+        flat = self.wd.combineHourlyWeatherData(rows, removeBlanks=False)
+        self.assertEqual(len(flat), 4 * 24)
+        self.assertTrue(flat['Tmean'].isnull().any())
+        removed = self.wd.combineHourlyWeatherData(rows)
+        pd.testing.assert_frame_equal(removed, flat[flat['Tmean'].notna()])
+        stack = self.wd.stackHourlyWeatherData(rows)
+        filled = self.wd.combineStacks(stack, maxGap=weatherCombine.MAX_GAP[True])
+        self.assertGreater(len(filled), len(removed))
+        np.testing.assert_array_equal(filled['Tmean'].reindex(removed.index), removed['Tmean'])
+
+        times = np.array([0, 60, 120, 600, 660], dtype=np.int64)
+        values = np.array([1, np.nan, 3, np.nan, 5], dtype=np.float32)
+        np.testing.assert_array_equal(weatherCombine.interpolate(times, values, 360), [1, 2, 3, np.nan, 5])
+        self.assertAlmostEqual(weatherCombine.interpolate(times, values, 600)[3], 3 + 2 * 480 / 540, places=5)
+
+    def test_flattenedWeatherMonths(self):
+        start, end = datetime.datetime(2013, 3, 2), datetime.datetime(2013, 3, 3)
+        flat = self.wd.flattenedWeatherMonths(12601, start, end, hourly=True)
+        rows = self.wd.weatherMonths(12601, start, end, hourly=True)
+        wbans = sorted({r[0].strip() for r in rows})
+        self.assertFrameValues(flat, self.original(rows, wbans))
+
+
+if __name__ == '__main__':
+    unittest.main()
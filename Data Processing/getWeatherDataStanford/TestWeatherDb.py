@@ -0,0 +1,86 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import weatherDb
+
+
+def monthCsv(zip5, day, hours, temp=50.0):
+    return ''.join(f'2013-03-{day:02d} {h:02d}:00:00,{temp + h},30.5,29.9,5.0,,0.0,{zip5}\n' for h in hours)
+
+
+class WeatherDbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataDir = tempfile.mkdtemp()
+        self.db = weatherDb.WeatherDb(os.path.join(self.dataDir, 'weather.sqlite'))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dataDir)
+
+    def count(self):
+        return self.db.conn.execute('SELECT COUNT(*) FROM local_weather').fetchone()[0]
+
+    def test_incremental(self):
+        during = datetime.datetime(2013, 3, 2, 12)
+        header = 'date,TemperatureF,DewpointF,Pressure,WindSpeed,Humidity,HourlyPrecip,zip5\n'
+        sent = self.db.loadCsv(header + monthCsv(94305, 1, range(24)) + monthCsv(12601, 1, range(24)), 2013, 3,
+                               skip=1, batchSize=10, now=during)
+        self.assertEqual(sent, 48)
+        self.assertEqual(self.count(), 48)
+        self.assertFalse(self.db.isComplete(94305, 2013, 3))
+        self.assertEqual(self.db.pendingZips(['94305', '12601'], 2013, 3), ['94305', '12601'])
+
+        # the next refresh only sends the new hours
+        sent = self.db.loadCsv(monthCsv(94305, 1, range(24)) + monthCsv(94305, 2, range(12)), 2013, 3, now=during)
+        self.assertEqual(sent, 12)
+        self.assertEqual(self.count(), 60)
+
+        # reloading after the month is final upserts the whole (revised) month and completes it
+        final = datetime.datetime(2013, 4, 8)
+        sent = self.db.loadMonth(2013, 3, [('2013-03-02 11:00:00', 1, 2, 3, 4, 5, 6, 94305),
+                                           ('2013-03-02 12:00:00', 1, 2, 3, 4, 5, 6, 94305)], now=final)
+        self.assertEqual(sent, 2)
+        self.assertEqual(self.count(), 61)
+        revised = self.db.conn.execute('SELECT TemperatureF FROM local_weather WHERE zip5 = 94305 AND date = ?',
+                                       ('2013-03-02 11:00:00',)).fetchone()
+        self.assertEqual(revised, (1.0,))
+        self.assertTrue(self.db.isComplete(94305, 2013, 3))
+        self.assertEqual(self.db.pendingZips([94305, 12601], 2013, 3), [12601])
+        rows = self.db.conn.execute('SELECT rows, lastDate FROM loaded_months WHERE zip5 = 94305').fetchone()
+        self.assertEqual(rows, (37, '2013-03-02 12:00:00'))
+        # a complete month is not sent again
+        self.assertEqual(self.db.loadCsv(monthCsv(94305, 1, range(24)), 2013, 3, now=final), 0)
+        self.db.loadMonth(2013, 3, [('2013-03-01 05:00:00', 1, 2, 3, 4, None, 6, 12601)], now=during)
+        row = self.db.conn.execute('SELECT TemperatureF, Humidity, HourlyPrecip FROM local_weather '
+                                   'WHERE zip5 = 12601 AND date = ?', ('2013-03-01 05:00:00',)).fetchone()
+        self.assertEqual(row, (55.0, None, 0.0))  # not newer than the last loaded hour: left as it was
+        self.assertEqual(self.count(), 61)
+
+    def test_emptyMonth(self):
+        ended = datetime.datetime(2013, 4, 8)
+        self.assertEqual(self.db.loadCsv(monthCsv(94305, 1, range(3)), 2013, 3, now=ended, zips=['94305', '12601']), 3)
+        self.assertTrue(self.db.isComplete(12601, 2013, 3))
+        self.assertEqual(self.db.pendingZips(['94305', '12601', '60601'], 2013, 3), ['60601'])
+        row = self.db.conn.execute('SELECT rows, lastDate FROM loaded_months WHERE zip5 = 12601').fetchone()
+        self.assertEqual(row, (0, None))
+
+    def test_upsert(self):
+        self.db.loadCsv(monthCsv(94305, 1, range(3)), 2013, 3)
+        # without the bookkeeping (e.g. lost in a crash) every row is sent again and replaces the stored one
+        self.db.conn.execute('DELETE FROM loaded_months')
+        self.assertEqual(self.db.loadCsv(monthCsv(94305, 1, range(3), temp=60.0), 2013, 3), 3)
+        self.assertEqual(self.count(), 3)
+        temps = [r[0] for r in self.db.conn.execute('SELECT TemperatureF FROM local_weather ORDER BY date')]
+        self.assertEqual(temps, [60.0, 61.0, 62.0])
+
+    def test_monthEnded(self):
+        self.assertFalse(weatherDb.monthEnded(2013, 12, datetime.datetime(2014, 1, 6)))
+        self.assertTrue(weatherDb.monthEnded(2013, 12, datetime.datetime(2014, 1, 7)))
+
+
+if __name__ == '__main__':
+    unittest.main()
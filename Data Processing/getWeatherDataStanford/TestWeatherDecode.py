@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import WeatherData as weather
+import weatherDecode as wdec
+
+
+class WeatherDecodeTest(unittest.TestCase):
+
+    def test_decode(self):
+        values, flags = wdec.decode(['12.5', ' -3 ', 'M', '', '29.85s', 'VR', '10V', '*', '4*', 'T', 'abc', '0.01'])
+        np.testing.assert_array_equal(values[[0, 1, 4, 6, 8, 9, 11]], np.float32([12.5, -3, 29.85, 10, 4, 0, 0.01]))
+        self.assertTrue(np.isnan(values[[2, 3, 5, 7, 10]]).all())
+        self.assertEqual(values.dtype, np.float32)
+        self.assertEqual(flags.tolist(), [0, 0, wdec.MISSING, wdec.BLANK, wdec.SUSPECT, wdec.VARIABLE, wdec.VARIABLE,
+                                          wdec.STAR | wdec.INVALID, wdec.STAR, wdec.TRACE, wdec.INVALID, 0])
+
+        # bytes and Series give the same result
+        raw = np.array([b'12.5', b'M', b'29.85s'])
+        for column in (raw, pd.Series(['12.5', 'M', '29.85s'], index=[7, 8, 9])):
+            v, f = wdec.decode(column)
+            np.testing.assert_array_equal(v, np.float32([12.5, np.nan, 29.85]))
+            self.assertEqual(f.tolist(), [0, wdec.MISSING, wdec.SUSPECT])
+
+        wd = weather.WeatherData('weather')
+        self.assertEqual(wd.float_parse('29.85'), 29.85)
+        self.assertEqual(wd.float_parse('M', fail=-1), -1)
+        self.assertTrue(np.isnan(wd.float_parse('29.85s')))
+        self.assertTrue(np.isnan(wd.float_parse('T')))
+        values, flags = wd.floatColumn(['29.85s', 'T'])
+        np.testing.assert_array_equal(values, np.float32([29.85, 0]))
+
+    def test_skyCover(self):
+        cover, flags = wdec.skyCover(['CLR', 'FEW018 BKN070', 'SCT020 OVC100', 'VV002', 'BKN:07 70', 'M', '', 'xyz'])
+        np.testing.assert_array_equal(cover[:5], [0, 7, 8, 8, 7])
+        self.assertTrue(np.isnan(cover[5:]).all())
+        self.assertEqual(flags.tolist(), [0, 0, 0, 0, 0, wdec.MISSING, wdec.BLANK, wdec.INVALID])
+
+    def test_decodeFrame(self):
+        frame = pd.DataFrame({'SkyCondition': ['FEW018', 'M'], 'DryBulbCelsius': ['3.5', '4.0s'], 'Time': [53, 153]})
+        out = wdec.decodeFrame(frame, ['SkyCondition', 'DryBulbCelsius'], quality=True)
+        self.assertEqual(out['SkyCondition'].tolist()[0], 2)
+        self.assertEqual(out['DryBulbCelsiusQuality'].tolist(), [0, wdec.SUSPECT])
+        self.assertEqual(out['Time'].tolist(), [53, 153])
+
+
+if __name__ == '__main__':
+    unittest.main()
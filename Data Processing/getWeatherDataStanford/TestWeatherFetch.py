@@ -0,0 +1,145 @@
+import datetime
+import hashlib
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+
+import WeatherData as weather
+import weatherFetch
+
+
+def archive(name, size=200000):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr(name, os.urandom(size))
+    return buf.getvalue()
+
+
+class ArchiveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    files = {}
+    ranges = []
+    truncate = False
+
+    def do_GET(self):
+        body = self.files.get(self.path.rsplit('/', 1)[-1])
+        if body is None:
+            self.send_error(404)
+            return
+        start = 0
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        rangeHeader = self.headers.get('Range')
+        self.ranges.append(rangeHeader)
+        if self.headers.get('If-Range', etag) != etag:
+            rangeHeader = None  # the archive changed: send all of it
+        if rangeHeader:
+            start = int(rangeHeader.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        if self.truncate:
+            self.wfile.write(body[start:start + 1000])
+            self.close_connection = True
+        else:
+            self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class WeatherFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        ArchiveHandler.files = {f'QCLCD2013{m:02d}.zip': archive(f'2013{m:02d}hourly.txt') for m in range(1, 7)}
+        ArchiveHandler.ranges = []
+        ArchiveHandler.truncate = False
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.baseUrl = f'http://127.0.0.1:{self.server.server_port}/qclcd/'
+        self.dataDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dataDir)
+
+    def test_prefetchMonths(self):
+        wd = weather.WeatherData(self.dataDir, baseUrl=self.baseUrl, fetchWorkers=3)
+        paths = wd.prefetchMonths(datetime.datetime(2013, 2, 15), datetime.datetime(2013, 5, 3))
+        self.assertEqual([os.path.basename(p) for p in paths], [f'QCLCD2013{m:02d}.zip' for m in range(2, 6)])
+        for p in paths:
+            with open(p, 'rb') as f:
+                self.assertEqual(f.read(), ArchiveHandler.files[os.path.basename(p)])
+        self.assertEqual(wd.fetcher.bytesDownloaded, sum(len(ArchiveHandler.files[os.path.basename(p)]) for p in paths))
+        self.assertEqual(sorted(os.listdir(self.dataDir)), sorted(os.path.basename(p) for p in paths))
+        self.assertEqual(wd.fetcher._connections, [])
+
+    def test_resume(self):
+        name = 'QCLCD201303.zip'
+        body = ArchiveHandler.files[name]
+        ArchiveHandler.truncate = True
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir) as fetcher:
+            partFile = os.path.join(self.dataDir, name + '.part')
+            fetcher._download(self.baseUrl + name, partFile)  # interrupted after 1000 bytes
+        self.assertEqual(os.path.getsize(partFile), 1000)
+        ArchiveHandler.truncate = False
+        ArchiveHandler.ranges = []
+        checksums = {name: hashlib.sha256(body).hexdigest()}
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir, checksums=checksums) as fetcher:
+            path = fetcher.fetch(name)
+        self.assertEqual(ArchiveHandler.ranges, ['bytes=1000-'])
+        self.assertEqual(fetcher.bytesDownloaded, len(body) - 1000)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), body)
+        self.assertEqual(os.listdir(self.dataDir), [name])
+
+    def test_refreshedArchive(self):
+        name = 'QCLCD201304.zip'
+        old = ArchiveHandler.files[name]
+        ArchiveHandler.truncate = True
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir) as fetcher:
+            partFile = os.path.join(self.dataDir, name + '.part')
+            fetcher._download(self.baseUrl + name, partFile)
+        ArchiveHandler.truncate = False
+        new = ArchiveHandler.files[name] = archive('201304hourly.txt')
+        self.assertEqual(len(new), len(old))
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir) as fetcher:
+            with open(fetcher.fetch(name), 'rb') as f:
+                self.assertEqual(f.read(), new)
+            self.assertEqual(fetcher.bytesDownloaded, len(new))
+
+        # a part file without its validator cannot be resumed
+        with open(partFile, 'wb') as f:
+            f.write(old[:5000])
+        ArchiveHandler.ranges = []
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir) as fetcher:
+            fetcher.fetch(name)
+        self.assertEqual(ArchiveHandler.ranges, [None])
+
+    def test_verification(self):
+        ArchiveHandler.truncate = True
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir, retries=1) as fetcher:
+            with self.assertRaises(weatherFetch.FetchError):
+                fetcher.fetch('QCLCD201301.zip')
+        self.assertEqual(os.listdir(self.dataDir), [])
+
+        ArchiveHandler.truncate = False
+        with weatherFetch.ArchiveFetcher(self.baseUrl, self.dataDir, checksums={'QCLCD201301.zip': '00'}) as fetcher:
+            with self.assertRaises(weatherFetch.FetchError):
+                fetcher.fetch('QCLCD201301.zip')
+            with self.assertRaises(weatherFetch.FetchError):
+                fetcher.fetch('QCLCD209901.zip')
+        self.assertEqual(os.listdir(self.dataDir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
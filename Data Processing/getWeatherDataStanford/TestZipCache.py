@@ -0,0 +1,68 @@
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+import WeatherData as weather
+import zipCache
+
+
+class ZipCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataDir = tempfile.mkdtemp()
+        self.wd = weather.WeatherData(self.dataDir)
+        with open(self.wd.ZIP5_FILE, 'w', encoding='utf-8') as f:
+            f.write('"zip","city","state","latitude","longitude","timezone","dst"\n')
+            f.write('"12601","Poughkeepsie","NY","41.702","-73.921","-5","1"\n')
+            f.write('"94305","Stanford","CA","37.417","-122.167","-8","1"\n')
+        with zipfile.ZipFile(self.wd.GAZ_ZCTA_FILE, 'w') as zf:
+            zf.writestr(self.wd.GAZ_INNER_FILE, 'GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG\n'
+                                                '94305\t1\t0\t1\t0\t10.0\t10.0\n'
+                                                '00601\t1\t0\t1\t0\t18.180555\t-66.749961\n')
+        with zipfile.ZipFile(self.wd.ZCDB_2012_FILE, 'w') as zf:
+            zf.writestr(self.wd.ZCDB_2012_INNER_FILE, '"Zipcode","ZipCodeType","City","State","LocationType","Lat","Long"\n'
+                                                      '"99501","STANDARD","ANCHORAGE","AK","PRIMARY","61.21","-149.87"\n'
+                                                      '"00501","UNIQUE","HOLTSVILLE","NY","PRIMARY","",""\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dataDir)
+
+    def test_lookup(self):
+        cache = zipCache.ZipCache.fromMap({94305: (37.417, -122.167), 601: (18.18, -66.75), 12601: (41.702, -73.921)})
+        self.assertEqual(list(cache), [601, 12601, 94305])
+        self.assertIn('12601', cache)
+        self.assertNotIn(12600, cache)
+        self.assertAlmostEqual(cache[94305][0], 37.417, places=5)
+        self.assertIsNone(cache.get(99999))
+        with self.assertRaises(KeyError):
+            cache[99999]
+        np.testing.assert_allclose(cache.lookup([12601, 601]), [[41.702, -73.921], [18.18, -66.75]], rtol=1e-6)
+        with self.assertRaises(KeyError):
+            cache.lookup([12601, 99999])
+
+    def test_zipMap(self):
+        expected = {12601: (41.702, -73.921), 94305: (37.417, -122.167), 601: (18.180555, -66.749961), 99501: (61.21, -149.87)}
+        zips = self.wd.zipMap()
+        self.assertEqual(sorted(zips), sorted(expected))
+        for z, latLon in expected.items():
+            np.testing.assert_allclose(zips[z], latLon, rtol=1e-6)
+
+        # a new process loads the saved arrays instead of parsing the sources
+        wd = weather.WeatherData(self.dataDir)
+        wd.buildZipMap = None
+        self.assertIsInstance(wd.zipMap().zips, np.memmap)
+        self.assertEqual(wd.zipMap()[601], zips[601])
+
+        # until a source changes
+        with open(self.wd.ZIP5_FILE, 'a', encoding='utf-8') as f:
+            f.write('"00210","Portsmouth","NH","43.005895","-71.013202","-5","1"\n')
+        wd = weather.WeatherData(self.dataDir)
+        self.assertIn(210, wd.zipMap())
+        self.assertIn(210, weather.WeatherData(self.dataDir).zipMap())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,16 +11,29 @@
 #    also from these: http://cdo.ncdc.noaa.gov/qclcd_ascii/
 #    Note that the wclcd files are monthly and therefore requests will span several.
 import csv
+import io
 import os
-import urllib
 import zipfile
 import numpy as np
+import pandas as pd
 import datetime
 import math
+from dateutil import rrule
+import weatherFetch
+import stationIndex
+import zipCache
+import qclcdReader
+import monthCache
+import weatherDecode
+import weatherCombine
+import instrument
 
 class WeatherData(object):
-    def __init__(self, dataDir):
+    def __init__(self, dataDir, baseUrl=None, fetchWorkers=4, cacheBytes=monthCache.DEFAULT_MAX_BYTES, spillDir=None):
         self.ZIP_MAP = None  # Lazy initialization of zip map later
+        self.STATION_INDEX = {}  # (year, month) -> stationIndex.StationIndex
+        # parsed months, so that repeated queries do not reopen the archives
+        self.MONTH_CACHE = monthCache.MonthCache(cacheBytes, spillDir)
         self.DATA_DIR = dataDir
         self.WBAN_FILE = os.path.join(dataDir, 'WBAN.TXT')
         self.ZIP5_FILE = os.path.join(dataDir, 'Erle_zipcodes.csv')
@@ -28,28 +41,44 @@ class WeatherData(object):
         self.GAZ_INNER_FILE = '2015_Gaz_zcta_national.txt'
         self.ZCDB_2012_FILE = os.path.join(dataDir, 'free-zipcode-database-Primary.zip')
         self.ZCDB_2012_INNER_FILE = 'free-zipcode-database-Primary.csv'
-        self.NOAA_QCLCD_DATA_DIR = 'http://www.ncdc.noaa.gov/orders/qclcd/'
+        # point baseUrl at a local mirror or a test server to avoid NOAA
+        self.NOAA_QCLCD_DATA_DIR = baseUrl or 'http://www.ncdc.noaa.gov/orders/qclcd/'
+        self.fetcher = weatherFetch.ArchiveFetcher(self.NOAA_QCLCD_DATA_DIR, dataDir, workers=fetchWorkers)
+
+    def close(self):
+        """Close the connections kept open by the archive downloads."""
+        self.fetcher.close()
 
     def zipMap(self):
+        # merged once from the source files, then loaded from the compact cache
+        # in DATA_DIR until one of them changes
         if self.ZIP_MAP is None:
-            zipList = self.csvData(self.ZIP5_FILE, skip=1)
-            self.ZIP_MAP = {}
-            for zipRow in zipList:
-                self.ZIP_MAP[int(zipRow[0])] = (float(zipRow[3]), float(zipRow[4]))
-
-            gazZCTA = self.zippedData(self.GAZ_ZCTA_FILE, self.GAZ_INNER_FILE, delim='\t', skip=1)
-            for gazRow in gazZCTA:
-                self.ZIP_MAP.setdefault(int(gazRow[0].strip()), (float(gazRow[5].strip()), float(gazRow[6].strip())))
-
-            zcdb = self.zippedData(self.ZCDB_2012_FILE, self.ZCDB_2012_INNER_FILE, delim=',', skip=1)
-            for zc in zcdb:
-                try:
-                    self.ZIP_MAP.setdefault(int(zc[0].strip()), (float(zc[5].strip()), float(zc[6].strip())))
-                except ValueError:
-                    pass
-            print(f'Zip to lat/long lookup initialized with {len(self.ZIP_MAP)} entries')
+            sources = [self.ZIP5_FILE, self.GAZ_ZCTA_FILE, self.ZCDB_2012_FILE]
+            self.ZIP_MAP = zipCache.ZipCache.load(self.DATA_DIR, sources)
+            if self.ZIP_MAP is None:
+                self.ZIP_MAP = zipCache.ZipCache.fromMap(self.buildZipMap())
+                self.ZIP_MAP.save(self.DATA_DIR, sources)
+                print(f'Zip to lat/long lookup initialized with {len(self.ZIP_MAP)} entries')
         return self.ZIP_MAP
 
+    def buildZipMap(self):
+        zipMap = {}
+        zipList = self.csvData(self.ZIP5_FILE, skip=1)
+        for zipRow in zipList:
+            zipMap[int(zipRow[0])] = (float(zipRow[3]), float(zipRow[4]))
+
+        gazZCTA = self.zippedData(self.GAZ_ZCTA_FILE, self.GAZ_INNER_FILE, delim='\t', skip=1)
+        for gazRow in gazZCTA:
+            zipMap.setdefault(int(gazRow[0].strip()), (float(gazRow[5].strip()), float(gazRow[6].strip())))
+
+        zcdb = self.zippedData(self.ZCDB_2012_FILE, self.ZCDB_2012_INNER_FILE, delim=',', skip=1)
+        for zc in zcdb:
+            try:
+                zipMap.setdefault(int(zc[0].strip()), (float(zc[5].strip()), float(zc[6].strip())))
+            except ValueError:
+                pass
+        return zipMap
+
     def weatherUrl(self, year, month):
         return f'{self.NOAA_QCLCD_DATA_DIR}QCLCD{year}{month:02d}.zip'
 
@@ -60,7 +89,7 @@ class WeatherData(object):
         return f'{year}{month:02d}hourly.txt'
 
     def dailyFile(self, year, month):
-        return f'{year}{month:02ddaily.txt}'
+        return f'{year}{month:02d}daily.txt'
 
     def stationFile(self, year, month):
         return f'{year}{month:02d}station.txt'
@@ -68,31 +97,47 @@ class WeatherData(object):
     def summarizeStation(self, stationData):
         return f"{stationData[0]}, {stationData[1]:06.2f}, {stationData[9]}"
 
-    def confirmedWeatherZip(self, year, month):
-        retrieveFile = False
+    def needsDownload(self, year, month):
+        # missing, or saved before the month's archive was final (7 days into
+        # the next month) and not already refreshed today
         filePath = self.weatherZip(year, month)
-        if os.path.isfile(filePath):
-            now = datetime.datetime.now()
-            postYear = year
-            postMonth = (month + 1) % 13
-            if postMonth == 0:
-                postYear += 1
-                postMonth = 1
-            postDate = datetime.datetime(postYear, postMonth, 7)
-            modTime = datetime.datetime.fromtimestamp(os.path.getmtime(filePath))
-            if postDate >= modTime:
-                if now.date() != modTime.date():
-                    retrieveFile = True
-        else:
-            retrieveFile = True
+        if not os.path.isfile(filePath):
+            return True
+        postYear = year
+        postMonth = (month + 1) % 13
+        if postMonth == 0:
+            postYear += 1
+            postMonth = 1
+        postDate = datetime.datetime(postYear, postMonth, 7)
+        modTime = datetime.datetime.fromtimestamp(os.path.getmtime(filePath))
+        return postDate >= modTime and datetime.datetime.now().date() != modTime.date()
 
-        if retrieveFile:
+    def archiveVersion(self, year, month):
+        # the month cache keeps the entries of the current archive only, so
+        # download it first if it is missing or out of date
+        return monthCache.archiveVersion(self.confirmedWeatherZip(year, month))
+
+    def confirmedWeatherZip(self, year, month):
+        filePath = self.weatherZip(year, month)
+        if self.needsDownload(year, month):
             url = self.weatherUrl(year, month)
             print(f'{filePath} not found. Attempting download at {url}')
-            urllib.request.urlretrieve(url, filePath)
-
+            self.fetcher.fetch(os.path.basename(filePath))
         return filePath
 
+    def prefetchMonths(self, start, end):
+        """Download the archives of every month from start to end (datetimes) concurrently."""
+        months = self.months(start, end)
+        wanted = [os.path.basename(self.weatherZip(y, m)) for (y, m) in months if self.needsDownload(y, m)]
+        if wanted:
+            print(f'Downloading {len(wanted)} monthly archives from {self.NOAA_QCLCD_DATA_DIR}')
+        with instrument.span('download', archives=len(wanted)):
+            results = self.fetcher.fetchAll(wanted)
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                print(f'  {name} failed: {result}')
+        return [self.weatherZip(y, m) for (y, m) in months]
+
     def csvData(self, filePath, delim=',', colVal=None, subset=None, skip=0):
         with open(filePath, 'r', encoding='utf-8') as f:
             return self.csvDump(f, delim, colVal, subset, skip)
@@ -104,7 +149,7 @@ class WeatherData(object):
         out = []
         if colVal:
             filterColIdx = colVal[0]
-            filterValues = list(colVal[1])
+            filterValues = set(colVal[1])
 
             if subset is None:
                 out = [row for row in fReader if len(row) > 0 and row[filterColIdx] in filterValues]
@@ -116,16 +161,49 @@ class WeatherData(object):
 
     def zippedData(self, filePath, innerFile, delim=',', colVal=None, subset=None, skip=0):
         with zipfile.ZipFile(filePath, 'r') as zf:
-            return self.csvDump(zf.open(innerFile), delim, colVal, subset, skip)
+            with io.TextIOWrapper(zf.open(innerFile), encoding='latin-1', newline='') as f:
+                with instrument.span('csvDump', file=innerFile):
+                    rows = self.csvDump(f, delim, colVal, subset, skip)
+        instrument.count('csv.rowsKept', len(rows))
+        return rows
+
+    def cachedData(self, y, m, kind, fileName, delim, colVal=None, subset=None, skip=0):
+        # csvDump rows of a monthly file, through the month cache
+        filterKey = None if colVal is None else (colVal[0], tuple(sorted(set(colVal[1]))))
+        columns = (filterKey, tuple(subset) if subset is not None else None, skip)
+        return self.MONTH_CACHE.get(y, m, kind + 'Rows', None, columns=columns, version=self.archiveVersion(y, m),
+                                    load=lambda: self.zippedData(self.weatherZip(y, m), fileName, delim, colVal,
+                                                                 subset, skip))
 
     def stationData(self, y, m, colVal=None, subset=None, skip=0):
-        return self.zippedData(self.confirmedWeatherZip(y, m), self.stationFile(y, m), '|', colVal, subset, skip)
+        return self.cachedData(y, m, 'station', self.stationFile(y, m), '|', colVal, subset, skip)
 
     def dailyData(self, y, m, colVal=None, subset=None, skip=0):
-        return self.zippedData(self.confirmedWeatherZip(y, m), self.dailyFile(y, m), ',', colVal, subset, skip)
+        return self.cachedData(y, m, 'daily', self.dailyFile(y, m), ',', colVal, subset, skip)
 
     def hourlyData(self, y, m, colVal=None, subset=None, skip=0):
-        return self.zippedData(self.confirmedWeatherZip(y, m), self.hourlyFile(y, m), ',', colVal, subset, skip)
+        return self.cachedData(y, m, 'hourly', self.hourlyFile(y, m), ',', colVal, subset, skip)
+
+    # typed, streaming counterparts of dailyData and hourlyData: only the rows of
+    # wbans (None for every station) and the usecols columns (indices or names)
+    # are ever parsed
+    def dailyChunks(self, y, m, wbans=None, usecols=None, raw=False, quality=False):
+        return qclcdReader.zippedChunks(self.confirmedWeatherZip(y, m), self.dailyFile(y, m), wbans, usecols, ',', raw,
+                                        quality)
+
+    def hourlyChunks(self, y, m, wbans=None, usecols=None, raw=False, quality=False):
+        return qclcdReader.zippedChunks(self.confirmedWeatherZip(y, m), self.hourlyFile(y, m), wbans, usecols, ',', raw,
+                                        quality)
+
+    def dailyFrame(self, y, m, wbans=None, usecols=None, raw=False, quality=False):
+        return self.MONTH_CACHE.get(y, m, 'daily', wbans, columns=(tuple(usecols) if usecols else None, raw, quality),
+                                    version=self.archiveVersion(y, m),
+                                    load=lambda: qclcdReader.concat(self.dailyChunks(y, m, wbans, usecols, raw, quality)))
+
+    def hourlyFrame(self, y, m, wbans=None, usecols=None, raw=False, quality=False):
+        return self.MONTH_CACHE.get(y, m, 'hourly', wbans, columns=(tuple(usecols) if usecols else None, raw, quality),
+                                    version=self.archiveVersion(y, m),
+                                    load=lambda: qclcdReader.concat(self.hourlyChunks(y, m, wbans, usecols, raw, quality)))
 
     def distLatLon(self, lat1, lon1, lat2, lon2):
         lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
@@ -139,10 +217,89 @@ class WeatherData(object):
   # find the WBAN of the weather station closest to the zip code in question
   # using the zip5 lat/lon and the station lat/lon
   # this is potentially diferent every month. Bummer.
-class WeatherData:
-    def __init__(self, data_dir):
-        self.data_dir = data_dir
-        # Initialize any other data or attributes needed for WeatherData class
+    def stationIndex(self, y, m):
+        key = (y, m)
+        if key not in self.STATION_INDEX:
+            stations = self.stationData(y, m, skip=1)
+            with instrument.span('stationIndex', stations=len(stations)):
+                self.STATION_INDEX[key] = stationIndex.StationIndex(stations)
+        return self.STATION_INDEX[key]
+
+    def stationList(self, zip5, y, m, n=3, preferredDistKm=30):
+        """Stations as [WBAN, dist km, ...station row] for zip5: the n closest, or all within preferredDistKm if n == 0."""
+        return self.stationLists([zip5], y, m, n, preferredDistKm)[int(zip5)]
+
+    def stationLists(self, zips, y, m, n=3, preferredDistKm=30):
+        """stationList of every zip code in one query: {zip5: stations}."""
+        zips = list(dict.fromkeys(int(z) for z in zips))
+        latLon = self.zipMap().lookup(zips).reshape(-1, 2)
+        found = self.stationIndex(y, m).query(latLon[:, 0], latLon[:, 1], n, preferredDistKm)
+        return dict(zip(zips, found))
+
+    def weatherMonth(self, zips, y, m, hourly=False, subset=None, n=5, preferredDistKm=15, stackData=False):
+        """Data of the stations of one or more zips for a month: the rows of the QCLCD file, or a WeatherStack."""
+        if isinstance(zips, (int, str)):
+            zips = [zips]
+        stations = self.stationLists(zips, y, m, n, preferredDistKm)
+        wbans = sorted({s[0] for found in stations.values() for s in found})
+        if stackData:
+            frame = (self.hourlyFrame if hourly else self.dailyFrame)(y, m, wbans=wbans, quality=True,
+                                                                      usecols=weatherCombine.usecols(hourly))
+            return weatherCombine.stackFrame(frame, hourly)
+        data = self.hourlyData if hourly else self.dailyData
+        return data(y, m, colVal=(0, wbans), subset=subset, skip=1)
+
+    def weatherMonths(self, zip5, start, end, hourly=False, subset=None, n=5, preferredDistKm=15):
+        """weatherMonth rows of every month from start to end."""
+        out = []
+        for y, m in self.months(start, end):
+            out.extend(self.weatherMonth(zip5, y, m, hourly, subset, n, preferredDistKm))
+        return out
+
+    def months(self, start, end):
+        return [(d.year, d.month) for d in rrule.rrule(rrule.MONTHLY, dtstart=datetime.datetime(start.year, start.month, 1),
+                                                       until=datetime.datetime(end.year, end.month, 1))]
+
+    def stackDailyWeatherData(self, rows):
+        return weatherCombine.stackRows(rows, hourly=False)
+
+    def stackHourlyWeatherData(self, rows):
+        return weatherCombine.stackRows(rows, hourly=True)
+
+    def combineStacks(self, stack, wbans=None, removeBlanks=True, addValues=None, distances=None, maxGap=None):
+        """Mean of the stations (wbans, or all those of the stack) at each hour (or day) of the stack, as a DataFrame.
+
+        removeBlanks : drop the rows without a Tmean
+        addValues : [(column, value), ...] appended as constant columns
+        distances : {wban: km} to weigh the stations by inverse distance instead of equally
+        maxGap : fill the gaps of at most maxGap minutes by linear interpolation first
+        """
+        wbans = stack.wbans if wbans is None else [str(w) for w in wbans]
+        site = [(w, None if distances is None else distances[w]) for w in wbans]
+        return weatherCombine.frames(stack, [site], [addValues or []], removeBlanks, maxGap)[0]
+
+    def combineHourlyWeatherData(self, data, removeBlanks=True):
+        """combineStacks of hourly rows (or a stack)."""
+        stack = data if isinstance(data, weatherCombine.WeatherStack) else self.stackHourlyWeatherData(data)
+        return self.combineStacks(stack, removeBlanks=removeBlanks)
+
+    def combineZips(self, stack, stations, removeBlanks=True, weighted=False, maxGap=None):
+        """{zip5: combineStacks with a zip5 column} for every zip of stationLists, in one pass over the stack.
+
+        weighted : weigh the stations of each zip by the inverse of their distance to it
+        """
+        zips = list(stations)
+        sites = [[(s[0], s[1] if weighted else None) for s in stations[z]] for z in zips]
+        frames = weatherCombine.frames(stack, sites, [[('zip5', z)] for z in zips], removeBlanks, maxGap)
+        return dict(zip(zips, frames))
+
+    def flattenedWeatherMonths(self, zip5, start, end, hourly=False, subset=None, n=5, preferredDistKm=15):
+        """combineStacks of the stations of zip5 over the months of start to end."""
+        stack = weatherCombine.concat([self.weatherMonth(zip5, y, m, hourly, subset, n, preferredDistKm, stackData=True)
+                                       for y, m in self.months(start, end)])
+        if stack is None:
+            return pd.DataFrame(columns=[c for c, _, _ in weatherCombine.features(hourly)])
+        return self.combineStacks(stack)
 
     def zip_map(self):
         # Example method to return a map of zip codes
@@ -150,22 +307,20 @@ class WeatherData:
         return {12601: "Poughkeepsie, NY", 90210: "Beverly Hills, CA"}  # Example mapping
     
     def match_dates(self, dates, wDates):
-        """Find the indices for each list where they share the same values."""
-        j = 0  # Index of wDates
-        wIdx = []  # List to store indices for wDates
-        dIdx = []  # List to store indices for dates
-        
-        try:
-            for i, d in enumerate(dates):
-                while j < len(wDates) and wDates[j] < d:
-                    j += 1
-                if j < len(wDates) and wDates[j] == d:
-                    wIdx.append(j)
-                    dIdx.append(i)
-        except IndexError:
-            pass  # If we run out of wDates, the loop should end
-        
-        return dIdx, wIdx  # Return the matching indices
+        """Find the indices for each list where they share the same values (wDates sorted)."""
+        # binary search of every date among the weather dates, on int64 timestamps
+        dates, wDates = self.int64Dates(dates), self.int64Dates(wDates)
+        if len(dates) == 0 or len(wDates) == 0:
+            return [], []
+        j = np.minimum(np.searchsorted(wDates, dates), len(wDates) - 1)
+        dIdx = np.flatnonzero(wDates[j] == dates)
+        return dIdx.tolist(), j[dIdx].tolist()  # Return the matching indices
+
+    def int64Dates(self, dates):
+        dates = np.asarray(dates)
+        if dates.dtype == object or dates.dtype.kind == 'M':
+            dates = dates.astype('datetime64[us]')
+        return dates.astype(np.int64)
 
     def float_parse(self, string, fail=np.nan):
         """Attempts to convert a string to float, returns fail if it fails."""
@@ -174,6 +329,13 @@ class WeatherData:
         except ValueError:
             return fail
 
+    def floatColumn(self, strings):
+        """Decode a whole column at once: float32 values and weatherDecode quality flags.
+
+        Unlike float_parse, flagged numbers ('12s') keep their value and a trace ('T') is 0.
+        """
+        return weatherDecode.decode(strings)
+
     def weather_range(self, zip_code, start, end, hourly=False):
         """Example method to fetch weather data between start and end dates."""
         # For simplicity, we'll generate dummy weather data.
@@ -198,22 +360,8 @@ class WeatherData:
         end = datetime.datetime(year, month, 1) + datetime.timedelta(days=30)
         return self.weather_range(None, start, end)  # Fetch data using weather_range
 
-class Timer:
-    """Context manager for measuring elapsed time."""
-    
-    def __init__(self, label):
-        self.label = label
-        self.start_time = None
-    
-    def __enter__(self):
-        self.start_time = datetime.datetime.now()
-        return self
-    
-    def __exit__(self, exc_type, exc_value, traceback):
-        elapsed_time = datetime.datetime.now() - self.start_time
-        print(f"{self.label} took {elapsed_time.total_seconds():.2f} seconds")
-
 if __name__ == '__main__':
+    profile = instrument.enable()
     # Create a WeatherData object with a dummy data directory
     wd = WeatherData('weather')
     
@@ -222,7 +370,7 @@ if __name__ == '__main__':
     print(f"Weather data for zip code {zip5}: {zips.get(zip5, 'Unknown zip code')}")
     
     # Measure the time taken to fetch weather data for a date range
-    with Timer('weather data fetch'):
+    with instrument.span('weather data fetch'):
         start = datetime.datetime(2013, 3, 1)
         end = datetime.datetime(2013, 4, 21)
         weather = wd.weather_range(zip5, start, end, hourly=True)
@@ -233,11 +381,13 @@ if __name__ == '__main__':
             print(f"Date: {record['date']}, Temperature: {record['temperature']}°F, Humidity: {record['humidity']}%")
     
     # Fetch and filter data for a specific WBAN (weather station)
-    with Timer('filtered weather data'):
+    with instrument.span('filtered weather data'):
         weather_wban = wd.daily_data(2013, 3, col_val=(0, '03013'))
         print(f"Weather data for WBAN 03013: {weather_wban}")
     
     # Example of subsetting data (selecting specific columns, e.g., temperature and humidity)
-    with Timer('subsetting data'):
+    with instrument.span('subsetting data'):
         weather_sub = wd.daily_data(2013, 3, subset=[0, 1, 2, 4, 6])
-        print(f"Subsetted weather data: {weather_sub}")
\ No newline at end of file
+        print(f"Subsetted weather data: {weather_sub}")
+
+    print('\n'.join(profile.report()))
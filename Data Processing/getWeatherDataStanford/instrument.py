@@ -0,0 +1,172 @@
+# Spans and counters for the hot paths of the weather pipeline.
+#
+# Code marks its phases with `with instrument.span('parse'):` and counts what
+# went through them with instrument.count('qclcd.rowsKept', n). Both do nothing
+# but test one global until a Profile is enabled, so they can stay in the hot
+# paths. An enabled Profile records every span (nested spans are those running
+# inside another one on the same thread) with its start and duration, and the
+# running total of every counter. A run's profile is summarised per span name
+# (calls, total and self time, i.e. without the nested spans) and saved as
+# JSON, or as a Chrome trace (chrome://tracing, Perfetto) when the file name
+# ends with .trace.json. Profiles of worker processes are merged with dump/merge.
+import json
+import os
+import threading
+import time
+
+TRACE_SUFFIX = '.trace.json'
+
+_profile = None  # the enabled Profile, None when instrumentation is off
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, profile, name, args):
+        self.profile = profile
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        end = time.perf_counter_ns()
+        self.profile._add((self.name, self.start, end - self.start, os.getpid(), threading.get_ident(), self.args))
+        return False
+
+
+class Profile(object):
+    def __init__(self):
+        self.spans = []  # (name, start ns, duration ns, pid, thread id, args)
+        self.counters = {}
+        self.samples = []  # (time ns, pid, counter, running total)
+        self._lock = threading.Lock()
+
+    def span(self, name, args=None):
+        return _Span(self, name, args)
+
+    def _add(self, record):
+        with self._lock:
+            self.spans.append(record)
+
+    def count(self, name, value=1):
+        now = time.perf_counter_ns()
+        with self._lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+            self.samples.append((now, os.getpid(), name, total))
+
+    def dump(self):
+        """The recorded data, as a picklable dict (to send to the parent process)."""
+        with self._lock:
+            return {'spans': list(self.spans), 'counters': dict(self.counters), 'samples': list(self.samples)}
+
+    def merge(self, data):
+        """Add the dump of another (worker) profile."""
+        with self._lock:
+            self.spans.extend(tuple(s) for s in data['spans'])
+            self.samples.extend(tuple(s) for s in data['samples'])
+            for name, value in data['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """{'spans': {name: calls, seconds, selfSeconds, maxSeconds}, 'counters': {name: total}}."""
+        stats = {}
+        selfNs = [d for _, _, d, _, _, _ in self.spans]
+        # a span is nested in the innermost span of its thread that contains it
+        order = sorted(range(len(self.spans)), key=lambda i: (self.spans[i][3], self.spans[i][4], self.spans[i][1],
+                                                               -self.spans[i][2]))
+        stack = []
+        for i in order:
+            _, start, duration, pid, tid, _ = self.spans[i]
+            while stack and (self.spans[stack[-1]][3:5] != (pid, tid) or
+                             self.spans[stack[-1]][1] + self.spans[stack[-1]][2] <= start):
+                stack.pop()
+            if stack:
+                selfNs[stack[-1]] -= duration
+            stack.append(i)
+        for (name, _, duration, _, _, _), own in zip(self.spans, selfNs):
+            s = stats.setdefault(name, {'calls': 0, 'seconds': 0.0, 'selfSeconds': 0.0, 'maxSeconds': 0.0})
+            s['calls'] += 1
+            s['seconds'] += duration / 1e9
+            s['selfSeconds'] += own / 1e9
+            s['maxSeconds'] = max(s['maxSeconds'], duration / 1e9)
+        return {'spans': stats, 'counters': dict(self.counters)}
+
+    def report(self):
+        """Lines of the summary, the spans by decreasing self time."""
+        summary = self.summary()
+        lines = [f'{"span":32s} {"calls":>7s} {"total s":>9s} {"self s":>9s} {"max s":>8s}']
+        for name, s in sorted(summary['spans'].items(), key=lambda item: -item[1]['selfSeconds']):
+            lines.append(f'{name:32s} {s["calls"]:7d} {s["seconds"]:9.3f} {s["selfSeconds"]:9.3f} {s["maxSeconds"]:8.3f}')
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'{name:32s} {value:>7,}')
+        return lines
+
+    def chromeTrace(self):
+        """Trace Event Format: a complete ('X') event per span and a counter ('C') event per count."""
+        origin = min([s[1] for s in self.spans] + [s[0] for s in self.samples], default=0)
+        events = [{'name': name, 'ph': 'X', 'ts': (start - origin) / 1e3, 'dur': duration / 1e3, 'pid': pid,
+                   'tid': tid, 'args': args or {}}
+                  for name, start, duration, pid, tid, args in self.spans]
+        events += [{'name': name, 'ph': 'C', 'ts': (t - origin) / 1e3, 'pid': pid, 'args': {name: total}}
+                   for t, pid, name, total in self.samples]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path):
+        """Write the Chrome trace (path ending with .trace.json) or the JSON summary and spans."""
+        if path.endswith(TRACE_SUFFIX):
+            data = self.chromeTrace()
+        else:
+            data = dict(self.summary(), events=[{'name': name, 'start': start, 'duration': duration, 'pid': pid,
+                                                 'tid': tid, 'args': args or {}}
+                                                for name, start, duration, pid, tid, args in self.spans])
+        with open(path, 'w') as f:
+            json.dump(data, f, default=str)
+        return path
+
+
+def enable(profile=None):
+    """Start recording into profile (a new one by default); returns it."""
+    global _profile
+    _profile = profile or Profile()
+    return _profile
+
+
+def disable():
+    """Stop recording; returns the profile that was enabled, if any."""
+    global _profile
+    profile, _profile = _profile, None
+    return profile
+
+
+def enabled():
+    return _profile is not None
+
+
+def current():
+    return _profile
+
+
+def span(name, **args):
+    """Context manager timing the enclosed block as the span name (a no-op when disabled)."""
+    if _profile is None:
+        return _NULL_SPAN
+    return _profile.span(name, args)
+
+
+def count(name, value=1):
+    """Add value to the counter name (a no-op when disabled)."""
+    if _profile is not None:
+        _profile.count(name, value)
@@ -0,0 +1,176 @@
+# In-memory LRU cache of parsed monthly QCLCD data.
+#
+# Entries are keyed by (year, month, kind, columns, stations, version) and
+# evicted least recently used first once their total size passes maxBytes. The
+# version identifies the archive the entry was parsed from (its size and
+# modification time): once the archive is downloaded again, the entries of the
+# old one are dropped. A request for a set of stations is also served from a
+# cached frame of a superset of them (or of every station) by filtering on its
+# WBAN column. With a spillDir, evicted frames are written there as one .npz
+# file of columns and read back on the next request instead of going back to
+# the zip archive. Callers get their own copy of an entry: a frame that shares
+# the cached data until it is written to (with pandas' copy on write), or a
+# copy of the rows.
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+DEFAULT_MAX_BYTES = 256 << 20
+# pandas >= 3 always copies on write, so shallow copies of a frame cannot write to the cached one
+COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3
+
+
+def stationKey(wbans):
+    """Normalised station set: None for every station, else a frozenset of 5 digit WBAN strings."""
+    if wbans is None:
+        return None
+    if isinstance(wbans, (str, int)):
+        wbans = [wbans]
+    return frozenset(str(w).strip().zfill(5) if str(w).strip().isdigit() else str(w).strip() for w in wbans)
+
+
+def archiveVersion(path):
+    """(size, modification time) of a file, None if it is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def handOut(value):
+    """A copy of a cached value for the caller, which cannot change the cached one."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=not COPY_ON_WRITE)
+    if isinstance(value, list):
+        return [list(row) for row in value]
+    return value
+
+
+def sizeOf(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, list):
+        # rows of strings, as returned by csvDump
+        return sys.getsizeof(value) + sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in value)
+    return sys.getsizeof(value)
+
+
+class MonthCache(object):
+    def __init__(self, maxBytes=DEFAULT_MAX_BYTES, spillDir=None):
+        self.maxBytes = maxBytes
+        self.spillDir = spillDir
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.spilled = {}  # key -> .npz path
+        self.bytes = 0
+        self.hits = 0
+        self.supersetHits = 0
+        self.spillHits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'supersetHits': self.supersetHits, 'spillHits': self.spillHits,
+                'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.bytes}
+
+    def get(self, y, m, kind, wbans, load, columns=None, version=None):
+        """Copy of the cached value for the key, or of load() on a miss (and cached).
+
+        version : of the archive the value is parsed from, e.g. archiveVersion(path)
+        """
+        stations = stationKey(wbans)
+        key = (y, m, kind, tuple(columns) if columns is not None else None, stations, version)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            instrument.count('cache.hits')
+            return handOut(self.entries[key][0])
+        self._dropStale(y, m, version)
+        value = self._fromSuperset(key)
+        if value is not None:
+            self.supersetHits += 1
+            instrument.count('cache.supersetHits')
+        elif key in self.spilled:
+            with instrument.span('cache.readSpill', kind=kind):
+                value = self._readSpill(self.spilled.pop(key))
+            self.spillHits += 1
+            instrument.count('cache.spillHits')
+        else:
+            with instrument.span('cache.load', kind=kind, year=y, month=m):
+                value = load()
+            self.misses += 1
+            instrument.count('cache.misses')
+        self.put(key, value)
+        return handOut(value)
+
+    def _dropStale(self, y, m, version):
+        # entries of the month parsed from another version of its archive
+        for key in [k for k in self.entries if k[:2] == (y, m) and k[5] != version]:
+            self.bytes -= self.entries.pop(key)[1]
+        for key in [k for k in self.spilled if k[:2] == (y, m) and k[5] != version]:
+            path = self.spilled.pop(key)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _fromSuperset(self, key):
+        y, m, kind, columns, stations, version = key
+        if stations is None:
+            return None
+        for key2, (value, _) in reversed(self.entries.items()):
+            y2, m2, kind2, columns2, stations2, version2 = key2
+            if (y2, m2, kind2, columns2, version2) != (y, m, kind, columns, version) or not isinstance(value, pd.DataFrame):
+                continue
+            if 'WBAN' in value.columns and (stations2 is None or stations2 >= stations):
+                self.entries.move_to_end(key2)
+                return value[value['WBAN'].isin(stations)].reset_index(drop=True)
+        return None
+
+    def put(self, key, value):
+        size = sizeOf(value)
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.maxBytes and self.entries:
+            oldKey, (oldValue, oldSize) = self.entries.popitem(last=False)
+            self.bytes -= oldSize
+            self.evictions += 1
+            instrument.count('cache.evictions')
+            if self.spillDir is not None and isinstance(oldValue, pd.DataFrame):
+                self.spilled[oldKey] = self._writeSpill(oldKey, oldValue)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        for path in self.spilled.values():
+            if os.path.isfile(path):
+                os.remove(path)
+        self.spilled.clear()
+
+    def _writeSpill(self, key, frame):
+        os.makedirs(self.spillDir, exist_ok=True)
+        y, m, kind = key[:3]
+        digest = hashlib.sha1(repr(key[3:4] + (sorted(key[4]) if key[4] is not None else None,) + key[5:]).encode()).hexdigest()
+        path = os.path.join(self.spillDir, f'{kind}{y}{m:02d}-{digest[:12]}.npz')
+        columns = {}
+        for i, name in enumerate(frame.columns):
+            col = frame[name].to_numpy()
+            columns[f'c{i}'] = col.astype(str) if col.dtype == object else col
+        np.savez(path, names=np.array([str(c) for c in frame.columns]), **columns)
+        return path
+
+    def _readSpill(self, path):
+        with np.load(path) as spill:
+            names = spill['names'].tolist()
+            frame = pd.DataFrame({name: spill[f'c{i}'] for i, name in enumerate(names)})
+        for name in names:
+            if frame[name].dtype.kind == 'U':
+                frame[name] = frame[name].astype(object)
+        os.remove(path)
+        return frame
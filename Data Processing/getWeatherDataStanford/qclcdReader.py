@@ -0,0 +1,153 @@
+# Streaming reader for the QCLCD text files inside the monthly zip archives.
+#
+# The member is read in blocks of bytes. Rows are filtered on their first
+# field (the WBAN) before anything is parsed: with the usual 5 digit WBAN the
+# test is vectorised over every line of the block, and only the rows of the
+# stations we keep are handed to pandas, which parses just the requested
+# columns. Results come back as DataFrame chunks with typed columns, so memory
+# is bounded by the selected stations and the block size, not by the national
+# file.
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import weatherDecode
+
+BLOCK_SIZE = 1 << 22  # bytes read from the archive at a time
+CHUNK_ROWS = 1 << 16  # kept rows per yielded chunk
+WBAN_WIDTH = 5
+
+# QCLCD measurement columns; with raw=False they are decoded to float32 by
+# weatherDecode ('M' and blanks become NaN, flags such as a trailing 's' are
+# dropped or, with quality=True, kept in a '<name>Quality' column). The sky
+# condition becomes the cover of its most covered layer, in oktas.
+NUMERIC_COLUMNS = {
+    'StationType', 'SkyCondition', 'Visibility', 'DryBulbFarenheit', 'DryBulbCelsius', 'WetBulbFarenheit', 'WetBulbCelsius',
+    'DewPointFarenheit', 'DewPointCelsius', 'RelativeHumidity', 'WindSpeed', 'WindDirection',
+    'ValueForWindCharacter', 'StationPressure', 'PressureTendency', 'PressureChange', 'SeaLevelPressure',
+    'HourlyPrecip', 'Altimeter',
+    # daily summaries
+    'Tmax', 'Tmin', 'Tavg', 'Depart', 'DewPoint', 'WetBulb', 'Heat', 'Cool', 'SnowFall', 'PrecipTotal',
+    'ResultSpeed', 'ResultDir', 'AvgSpeed', 'Max5Speed', 'Max5Dir', 'Max2Speed', 'Max2Dir',
+}
+
+
+def _keepLines(block, keys, delim):
+    """The lines of block (whole lines, each ending with a newline) whose first field is in keys."""
+    buf = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(buf == 10) + 1
+    starts = np.concatenate([[0], ends[:-1]])
+    # fixed width WBAN: WBAN_WIDTH digits followed by the delimiter
+    fixed = starts + WBAN_WIDTH < ends
+    digits = buf[np.minimum(starts[:, None] + np.arange(WBAN_WIDTH), len(buf) - 1)].astype(np.int64) - 48
+    fixed &= (buf[np.minimum(starts + WBAN_WIDTH, len(buf) - 1)] == ord(delim)) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    codes = digits @ (10 ** np.arange(WBAN_WIDTH - 1, -1, -1))
+    keep = fixed & np.isin(codes, keys['codes'])
+    # anything else is tested field by field
+    for i in np.flatnonzero(~fixed):
+        if block[starts[i]:ends[i]].split(delim.encode(), 1)[0].strip() in keys['fields']:
+            keep[i] = True
+    return [block[s:e] for s, e in zip(starts[keep], ends[keep])]
+
+
+def _lines(stream, keys, delim, blockSize):
+    rest = b''
+    while True:
+        with instrument.span('unzip'):
+            block = stream.read(blockSize)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b'\n') + 1
+        block, rest = block[:cut], block[cut:]
+        if block:
+            yield _filter(block, keys, delim)
+    if rest.strip():
+        yield _filter(rest + b'\n', keys, delim)
+
+
+def _filter(block, keys, delim):
+    if instrument.enabled():
+        rows = block.count(b'\n')
+        instrument.count('qclcd.rowsRead', rows)
+        if keys is None:
+            instrument.count('qclcd.rowsKept', rows)
+    if keys is None:
+        return [block]
+    with instrument.span('filter'):
+        lines = _keepLines(block, keys, delim)
+    instrument.count('qclcd.rowsKept', len(lines))
+    return lines
+
+
+def _parse(data, names, usecols, raw, quality):
+    with instrument.span('parse'):
+        return _parseFrame(data, names, usecols, raw, quality)
+
+
+def _parseFrame(data, names, usecols, raw, quality):
+    frame = pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=usecols, dtype=str,
+                        keep_default_na=False, encoding='latin-1')
+    for name in frame.columns:
+        frame[name] = frame[name].str.strip()
+        if raw:
+            continue
+        if name in ('Date', 'YearMonthDay'):
+            frame[name] = pd.to_numeric(frame[name], errors='coerce').fillna(0).astype(np.int32)
+        elif name == 'Time':
+            frame[name] = pd.to_numeric(frame[name], errors='coerce').fillna(0).astype(np.int16)
+    if raw:
+        return frame
+    return weatherDecode.decodeFrame(frame, [c for c in frame.columns if c in NUMERIC_COLUMNS], quality)
+
+
+def readChunks(stream, wbans=None, usecols=None, delim=',', raw=False, quality=False, chunkRows=CHUNK_ROWS,
+               blockSize=BLOCK_SIZE):
+    """Yield DataFrames of the rows of a QCLCD file (binary stream with a header line).
+
+    wbans : keep only the rows of these stations (strings or ints), None for all
+    usecols : column indices or names to parse, None for all
+    raw : keep every column as the original (stripped) strings
+    quality : add the weatherDecode flags of each measurement as '<name>Quality'
+    """
+    header = stream.readline().decode('latin-1').strip()
+    names = [name.strip() for name in header.split(delim)]
+    if usecols is not None:
+        usecols = sorted({names.index(c) if isinstance(c, str) else int(c) for c in usecols})
+    keys = None
+    if wbans is not None:
+        fields = {str(w).strip() for w in wbans}
+        keys = {'fields': {f.encode() for f in fields},
+                'codes': np.array([int(f) for f in fields if f.isdigit() and len(f) <= WBAN_WIDTH], dtype=np.int64)}
+        keys['fields'] |= {f.lstrip(b'0') for f in keys['fields']}
+
+    pending, count, empty = [], 0, True
+    for lines in _lines(stream, keys, delim, blockSize):
+        pending.extend(lines)
+        count += len(lines) if keys is not None else sum(l.count(b'\n') for l in lines)
+        if count >= chunkRows:
+            yield _parse(b''.join(pending), names, usecols, raw, quality)
+            pending, count, empty = [], 0, False
+    if pending:
+        yield _parse(b''.join(pending), names, usecols, raw, quality)
+    elif empty:
+        yield pd.DataFrame(columns=names if usecols is None else [names[i] for i in usecols])
+
+
+def readFrame(stream, wbans=None, usecols=None, delim=',', raw=False, quality=False, **kwargs):
+    """All the selected rows as one DataFrame."""
+    return concat(readChunks(stream, wbans, usecols, delim, raw, quality, **kwargs))
+
+
+def concat(chunks):
+    chunks = list(chunks)
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+
+def zippedChunks(filePath, innerFile, wbans=None, usecols=None, delim=',', raw=False, quality=False, **kwargs):
+    with zipfile.ZipFile(filePath, 'r') as zf:
+        with zf.open(innerFile) as stream:
+            yield from readChunks(stream, wbans, usecols, delim, raw, quality, **kwargs)
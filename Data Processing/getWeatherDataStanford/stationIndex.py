@@ -0,0 +1,128 @@
+# Spatial index over the weather stations of one monthly stationYYYYMM.txt file.
+#
+# The station coordinates are converted once; a query then computes the
+# haversine distance from a whole array of locations to every station at once
+# (in blocks of rows, to bound memory) instead of one (zip, station) pair at a
+# time. When scikit-learn is installed a BallTree with the haversine metric is
+# used instead, which avoids the full distance matrix altogether.
+import numpy as np
+
+try:
+    from sklearn.neighbors import BallTree
+except ImportError:
+    BallTree = None
+
+EARTH_RADIUS_KM = 6367  # as WeatherData.distLatLon
+LAT_COL = 9  # latitude and longitude columns of the station file
+LON_COL = 10
+BLOCK_SIZE = 1024  # query locations per distance block
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in km; the arguments (in degrees) broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class StationIndex(object):
+    def __init__(self, rows, useTree=None):
+        # station file rows (the header already skipped); stations without a
+        # usable location are left out of the index
+        lat = np.array([_toFloat(r[LAT_COL]) if len(r) > LON_COL else np.nan for r in rows])
+        lon = np.array([_toFloat(r[LON_COL]) if len(r) > LON_COL else np.nan for r in rows])
+        keep = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        self.rows = [rows[i] for i in keep]
+        self.lat = lat[keep]
+        self.lon = lon[keep]
+        self.xyz = _unitVectors(self.lat, self.lon)
+        if useTree is None:
+            useTree = BallTree is not None
+        self.tree = None
+        if useTree and len(self.rows) > 0:
+            self.tree = BallTree(np.radians(np.column_stack([self.lat, self.lon])), metric='haversine')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _halfChord(self, lat, lon):
+        # squared half chord (the haversine "a") to every station, (1 - p.q) / 2
+        # for unit vectors p and q: one matrix product for the whole block, and
+        # monotone in the distance, so ranking and radius tests skip the arcsin
+        return np.maximum(0.5 - 0.5 * (_unitVectors(lat, lon) @ self.xyz.T), 0)
+
+    def distances(self, lat, lon):
+        """(locations x stations) matrix of distances in km."""
+        return haversine(np.asarray(lat, dtype=float)[:, None], np.asarray(lon, dtype=float)[:, None],
+                         self.lat[None, :], self.lon[None, :])
+
+    def nearest(self, lat, lon, n):
+        """Indices and distances (locations x n) of the n closest stations, closest first."""
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        n = min(n, len(self))
+        if n == 0:
+            return np.empty((len(lat), 0), dtype=np.intp), np.empty((len(lat), 0))
+        if self.tree is not None:
+            dist, idx = self.tree.query(np.radians(np.column_stack([lat, lon])), k=n)
+            return idx, dist * EARTH_RADIUS_KM
+        idx = np.empty((len(lat), n), dtype=np.intp)
+        dist = np.empty((len(lat), n))
+        for start in range(0, len(lat), BLOCK_SIZE):
+            a = self._halfChord(lat[start:start + BLOCK_SIZE], lon[start:start + BLOCK_SIZE])
+            part = np.argpartition(a, n - 1, axis=1)[:, :n] if n < len(self) else np.argsort(a, axis=1)
+            partA = np.take_along_axis(a, part, axis=1)
+            order = np.argsort(partA, axis=1, kind='stable')
+            block = np.take_along_axis(part, order, axis=1)
+            idx[start:start + len(a)] = block
+            dist[start:start + len(a)] = haversine(lat[start:start + len(a), None], lon[start:start + len(a), None],
+                                                   self.lat[block], self.lon[block])
+        return idx, dist
+
+    def within(self, lat, lon, km):
+        """For each location, the indices and distances of the stations within km, closest first."""
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        if self.tree is not None:
+            idx, dist = self.tree.query_radius(np.radians(np.column_stack([lat, lon])), r=km / EARTH_RADIUS_KM,
+                                               return_distance=True, sort_results=True)
+            return [(i, d * EARTH_RADIUS_KM) for i, d in zip(idx, dist)]
+        # candidates with a little slack for rounding, then the exact distance decides
+        limit = np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2) ** 2 + 1e-12
+        out = []
+        for start in range(0, len(lat), BLOCK_SIZE):
+            a = self._halfChord(lat[start:start + BLOCK_SIZE], lon[start:start + BLOCK_SIZE])
+            rows, cols = np.nonzero(a <= limit)
+            bounds = np.searchsorted(rows, np.arange(len(a) + 1))
+            for r in range(len(a)):
+                i = cols[bounds[r]:bounds[r + 1]]
+                d = haversine(lat[start + r], lon[start + r], self.lat[i], self.lon[i])
+                order = np.argsort(d, kind='stable')
+                keep = d[order] <= km
+                out.append((i[order][keep], d[order][keep]))
+        return out
+
+    def query(self, lat, lon, n=3, preferredDistKm=30):
+        """Station rows, each prefixed with WBAN and distance, for every location.
+
+        n > 0 gives the n closest stations, n == 0 every station within preferredDistKm.
+        """
+        if n > 0:
+            idx, dist = self.nearest(lat, lon, n)
+            matches = zip(idx, dist)
+        else:
+            matches = self.within(lat, lon, preferredDistKm)
+        return [[[self.rows[i][0], float(d)] + self.rows[i][1:] for i, d in zip(ii, dd)] for ii, dd in matches]
+
+
+def _unitVectors(lat, lon):
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _toFloat(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
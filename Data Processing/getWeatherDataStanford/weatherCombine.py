@@ -0,0 +1,220 @@
+# Combining the observations of several weather stations into one series per site.
+#
+# A month of QCLCD data is held as a WeatherStack: a (time x station x feature)
+# float32 array with NaN where a station reported nothing, the sorted int64
+# timestamps (minutes since 1970) of its rows and the WBAN of each station.
+# As in the original stackHourlyWeatherData, hourly reports are binned to the
+# hour they fall in (HHMM floored to HH00) and averaged within the bin, and only
+# plain numbers are values: flagged ('12s', 'T', 'VR', ...) and missing fields
+# are NaN. Sites are combined all at once: a (station x site) weight matrix
+# turns the stack into a (time x site x feature) array in two tensor products,
+# the stations without a value being left out of each mean. The weights are
+# equal (the plain mean of the original combineStacks) unless distances are
+# given. The combined series cover every hour (or day) from the first to the
+# last time of the stack; blanks are NaN, and can be filled by linear
+# interpolation across the gaps no longer than maxGap.
+import numpy as np
+import pandas as pd
+
+import instrument
+import weatherDecode
+
+# (output column, QCLCD column, its index in the rows of the file)
+# the subsets and column names of the original weatherMonth and stack*WeatherData
+HOURLY_FEATURES = [('Tmean', 'DryBulbFarenheit', 10), ('DewPoint', 'DewPointFarenheit', 18),
+                   ('Pressure', 'StationPressure', 30), ('WindSpeed', 'WindSpeed', 24),
+                   ('RH', 'RelativeHumidity', 22), ('HourlyPrecip', 'HourlyPrecip', 40)]
+DAILY_FEATURES = [('Tmax', 'Tmax', 2), ('Tmin', 'Tmin', 4), ('Tmean', 'Tavg', 6)]
+KEYS = {True: [('WBAN', 0), ('Date', 1), ('Time', 2)], False: [('WBAN', 0), ('YearMonthDay', 1)]}
+
+MAX_GAP = {True: 6 * 60, False: 3 * 1440}  # a sensible longest gap to interpolate, in minutes
+STEP = {True: 60, False: 1440}  # minutes between the rows of the combined series
+MIN_DIST_KM = 1.0  # closer stations weigh as much as one at this distance
+
+
+def features(hourly):
+    return HOURLY_FEATURES if hourly else DAILY_FEATURES
+
+
+def usecols(hourly):
+    """The columns of the QCLCD file a stack is built from."""
+    return [name for name, _ in KEYS[hourly]] + [source for _, source, _ in features(hourly)]
+
+
+class WeatherStack(object):
+    def __init__(self, times, wbans, columns, values, hourly):
+        self.times = times  # (time,) int64 minutes since 1970
+        self.wbans = list(wbans)  # (station,)
+        self.columns = list(columns)  # (feature,) output column names
+        self.values = values  # (time x station x feature) float32
+        self.hourly = hourly
+
+    def __len__(self):
+        return len(self.times)
+
+
+def timestamps(date, time=None):
+    """int64 minutes since 1970 of YYYYMMDD dates and, for hourly data, HHMM times floored to the hour."""
+    date = np.asarray(date, dtype=np.int64)
+    months = (date // 10000 - 1970) * 12 + (date // 100) % 100 - 1
+    minutes = (months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + date % 100 - 1) * 1440
+    if time is not None:
+        time = np.asarray(time, dtype=np.int64)
+        minutes = minutes + (time // 100) * 60
+    return minutes
+
+
+def stackFrame(frame, hourly=True):
+    """WeatherStack of a reader frame (WBAN, Date/YearMonthDay, Time and the decoded feature columns).
+
+    With the '<column>Quality' flag columns of quality=True, flagged values are dropped.
+    """
+    feats = features(hourly)
+    if hourly:
+        times = timestamps(frame['Date'], frame['Time'])
+    else:
+        times = timestamps(frame['YearMonthDay'])
+    values = np.column_stack([_strict(frame, source) for _, source, _ in feats]) \
+        if len(frame) else np.empty((0, len(feats)), dtype=np.float32)
+    with instrument.span('stack', rows=len(frame)):
+        return _stack(times, np.asarray(frame['WBAN'], dtype=str), values, [name for name, _, _ in feats], hourly)
+
+
+def _strict(frame, source):
+    values = np.asarray(frame[source], dtype=np.float32)
+    quality = source + 'Quality'
+    if quality in frame.columns:
+        values = np.where(np.asarray(frame[quality]) == 0, values, np.float32(np.nan))
+    return values
+
+
+def stackRows(rows, hourly=True):
+    """WeatherStack of full rows of a QCLCD file, as returned by hourlyData and dailyData."""
+    feats = features(hourly)
+    columns = KEYS[hourly] + [(source, i) for _, source, i in feats]
+    frame = pd.DataFrame([[row[i] for _, i in columns] for row in rows], columns=[name for name, _ in columns],
+                         dtype=object)
+    for name, _ in KEYS[hourly]:
+        frame[name] = frame[name].astype(str).str.strip()
+    for name in ('Date', 'YearMonthDay', 'Time'):
+        if name in frame.columns:
+            frame[name] = pd.to_numeric(frame[name], errors='coerce').fillna(0).astype(np.int64)
+    frame = weatherDecode.decodeFrame(frame, [source for _, source, _ in feats], quality=True)
+    return stackFrame(frame, hourly)
+
+
+def _stack(times, wbans, values, columns, hourly):
+    # mean of the reports of each station within each time bin
+    uniqueTimes, ti = np.unique(times, return_inverse=True)
+    uniqueWbans, si = np.unique(wbans, return_inverse=True)
+    shape = (len(uniqueTimes), len(uniqueWbans), values.shape[1])
+    flat = (ti * len(uniqueWbans) + si).reshape(-1)
+    cells = shape[0] * shape[1]
+    mean = np.empty((cells, shape[2]), dtype=np.float32)
+    for f in range(shape[2]):
+        valid = ~np.isnan(values[:, f])
+        sums = np.bincount(flat, weights=np.where(valid, values[:, f], 0), minlength=cells)
+        counts = np.bincount(flat, weights=valid, minlength=cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean[:, f] = sums / counts
+    return WeatherStack(uniqueTimes, uniqueWbans.tolist(), columns, mean.reshape(shape), hourly)
+
+
+def concat(stacks):
+    """One stack of several (e.g. monthly) stacks of the same kind."""
+    stacks = [s for s in stacks if len(s.wbans)]
+    if not stacks:
+        return None
+    wbans = sorted(set(w for s in stacks for w in s.wbans))
+    index = {w: i for i, w in enumerate(wbans)}
+    first = stacks[0]
+    times = np.concatenate([s.times for s in stacks])
+    values = np.full((len(times), len(wbans), len(first.columns)), np.nan, dtype=np.float32)
+    start = 0
+    for s in stacks:
+        values[start:start + len(s), [index[w] for w in s.wbans]] = s.values
+        start += len(s)
+    order = np.argsort(times, kind='stable')
+    return WeatherStack(times[order], wbans, first.columns, values[order], first.hourly)
+
+
+def weightMatrix(stack, sites):
+    """(station x site) weights: sites is a list of [(wban, distance km or None), ...] per site.
+
+    A station weighs 1, or the inverse of its distance when one is given.
+    """
+    index = {w: i for i, w in enumerate(stack.wbans)}
+    W = np.zeros((len(stack.wbans), len(sites)), dtype=np.float64)
+    for j, stations in enumerate(sites):
+        for wban, dist in stations:
+            if wban in index:
+                W[index[wban], j] = 1.0 if dist is None else 1.0 / max(float(dist), MIN_DIST_KM)
+    return W
+
+
+def combine(stack, W):
+    """(time x site x feature) weighted means over the stations with a value."""
+    valid = ~np.isnan(stack.values)
+    num = np.einsum('tsf,sz->tzf', np.where(valid, stack.values, 0), W)
+    den = np.einsum('tsf,sz->tzf', valid.astype(np.float64), W)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (num / den).astype(np.float32)
+
+
+def fullRange(stack, values):
+    """The times of every hour (or day) from the first to the last of the stack, and values (time x ...) on them."""
+    if len(stack) == 0:
+        return stack.times, values
+    step = STEP[stack.hourly]
+    times = np.arange(stack.times[0], stack.times[-1] + step, step, dtype=np.int64)
+    full = np.full((len(times),) + values.shape[1:], np.nan, dtype=values.dtype)
+    full[(stack.times - stack.times[0]) // step] = values
+    return times, full
+
+
+def interpolate(times, values, maxGap):
+    """Fill the NaN of values (time x ...) linearly in time where the surrounding reports are at most maxGap apart."""
+    shape = values.shape
+    v = values.reshape(len(times), -1).copy()
+    if len(times) == 0:
+        return values
+    valid = ~np.isnan(v)
+    steps = np.arange(len(times))[:, None]
+    prev = np.maximum.accumulate(np.where(valid, steps, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(valid, steps, len(times))[::-1], axis=0)[::-1]
+    fill = ~valid & (prev >= 0) & (nxt < len(times))
+    prev, nxt = np.where(fill, prev, 0), np.where(fill, nxt, 0)
+    span = times[nxt] - times[prev]
+    fill &= span <= maxGap
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = (times[:, None] - times[prev]) / span
+        before = np.take_along_axis(v, prev, axis=0)
+        after = np.take_along_axis(v, nxt, axis=0)
+        v[fill] = (before + frac * (after - before))[fill]
+    return v.reshape(shape)
+
+
+def frames(stack, sites, addValues=None, removeBlanks=True, maxGap=None):
+    """One DataFrame per site (indexed by date, every hour or day of the stack) of the combined stations of stack.
+
+    sites : [(wban, distance km or None), ...] per site; None distances weigh the stations equally
+    addValues : [(column, value), ...] per site, appended as constant columns
+    removeBlanks : drop the rows without a Tmean
+    maxGap : first fill the gaps of at most maxGap minutes by linear interpolation (none by default)
+    """
+    with instrument.span('combine', sites=len(sites)):
+        W = weightMatrix(stack, sites)
+        times, combined = fullRange(stack, combine(stack, W))
+    if maxGap:
+        with instrument.span('interpolate'):
+            combined = interpolate(times, combined, maxGap)
+    dates = pd.DatetimeIndex(times.astype('datetime64[m]'), name='date')
+    out = []
+    for j in range(len(sites)):
+        values = combined[:, j]
+        rows = ~np.isnan(values[:, stack.columns.index('Tmean')]) if removeBlanks else slice(None)
+        frame = pd.DataFrame(values[rows], index=dates[rows], columns=stack.columns)
+        for name, value in (addValues[j] if addValues else []):
+            frame[name] = value
+        out.append(frame)
+    return out
@@ -0,0 +1,159 @@
+# Incremental loader for the local_weather table of import_weather_data_mysql.sql.
+#
+# Rows are upserted on the (zip5, date) unique key in large transactions, so a
+# month can be loaded again without duplicates. Each loaded (zip5, month) is
+# recorded, also when it had no rows; a month that had ended (with the same 7
+# day grace period as the archive downloads) when it was loaded is complete and
+# skipped by later runs, and rows of a partly loaded month that are not newer
+# than what is already stored are not sent again, until the month is final: its
+# archive may have been revised, so the whole month is upserted once more.
+# SQLite is the built-in backend.
+import csv
+import datetime
+import io
+import sqlite3
+
+# column order of the weatherDump CSV, as in the LOAD DATA statement
+COLUMNS = ['date', 'TemperatureF', 'DewpointF', 'Pressure', 'WindSpeed', 'Humidity', 'HourlyPrecip', 'zip5']
+BATCH_SIZE = 50000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS local_weather (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  zip5 INTEGER NOT NULL,
+  date TEXT NOT NULL,
+  TemperatureF REAL DEFAULT NULL,
+  DewpointF REAL DEFAULT NULL,
+  Pressure REAL DEFAULT NULL,
+  WindSpeed REAL DEFAULT NULL,
+  Humidity REAL DEFAULT NULL,
+  Clouds TEXT DEFAULT NULL,
+  HourlyPrecip REAL DEFAULT NULL,
+  SolarRadiation REAL DEFAULT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS zip_date_idx ON local_weather (zip5, date);
+CREATE INDEX IF NOT EXISTS date_idx ON local_weather (date);
+CREATE TABLE IF NOT EXISTS loaded_months (
+  zip5 INTEGER NOT NULL,
+  month TEXT NOT NULL,
+  rows INTEGER NOT NULL,
+  lastDate TEXT,
+  loadedAt TEXT NOT NULL,
+  complete INTEGER NOT NULL,
+  PRIMARY KEY (zip5, month)
+);
+'''
+
+
+def monthKey(y, m):
+    return f'{y}-{m:02d}'
+
+
+def monthEnded(y, m, now=None):
+    """True once the archive of the month is final (7 days into the next month)."""
+    postDate = datetime.datetime(y + m // 12, m % 12 + 1, 7)
+    return (now or datetime.datetime.now()) >= postDate
+
+
+def _value(v):
+    if v is None:
+        return None
+    v = str(v).strip()
+    if v == '' or v.lower() == 'nan':
+        return None
+    return v
+
+
+class WeatherDb(object):
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        # bulk loading: a crash may lose the last batches, which the next run reloads
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        cols = COLUMNS[1:-1]
+        self.upsertSql = (f'INSERT INTO local_weather (zip5, date, {", ".join(cols)}) '
+                          f'VALUES (?, ?, {", ".join("?" * len(cols))}) '
+                          f'ON CONFLICT (zip5, date) DO UPDATE SET '
+                          + ', '.join(f'{c} = excluded.{c}' for c in cols))
+
+    def close(self):
+        self.conn.close()
+
+    def isComplete(self, zip5, y, m):
+        row = self.conn.execute('SELECT complete FROM loaded_months WHERE zip5 = ? AND month = ?',
+                                (int(zip5), monthKey(y, m))).fetchone()
+        return row is not None and bool(row[0])
+
+    def pendingZips(self, zips, y, m):
+        """The zips whose month y/m still needs loading."""
+        return [z for z in zips if not self.isComplete(z, y, m)]
+
+    def lastDates(self, y, m):
+        """{zip5: last loaded date} of the month."""
+        return dict(self.conn.execute('SELECT zip5, lastDate FROM loaded_months WHERE month = ?', (monthKey(y, m),)))
+
+    def completeZips(self, y, m):
+        """The zips whose month y/m was loaded once it had ended."""
+        return {z for z, in self.conn.execute('SELECT zip5 FROM loaded_months WHERE month = ? AND complete = 1',
+                                              (monthKey(y, m),))}
+
+    def monthRows(self, zip5, y, m):
+        """Rows of zip5 stored for month y/m."""
+        return self.conn.execute('SELECT COUNT(*) FROM local_weather WHERE zip5 = ? AND date >= ? AND date < ?',
+                                 (int(zip5), monthKey(y, m), monthKey(y + m // 12, m % 12 + 1))).fetchone()[0]
+
+    def loadMonth(self, y, m, rows, batchSize=BATCH_SIZE, now=None, zips=()):
+        """Upsert the rows (sequences in COLUMNS order) of month y/m; returns the number sent.
+
+        zips : the zips the rows were produced for; those without any row are
+               recorded too, so that an ended month is not fetched again
+        """
+        complete = monthEnded(y, m, now)
+        stored = last = self.lastDates(y, m)
+        if complete:
+            # the final archive may revise the hours loaded before it was final
+            final = self.completeZips(y, m)
+            last = {z: d for z, d in stored.items() if z in final}
+        newest, seen = {}, set(int(z) for z in zips)
+        sent = 0
+        batch = []
+        for row in rows:
+            date, zip5 = _value(row[0]), int(row[-1])
+            seen.add(zip5)
+            if zip5 in last and last[zip5] is not None and date <= last[zip5]:
+                continue  # loaded by an earlier run
+            batch.append((zip5, date) + tuple(_value(v) for v in row[1:-1]))
+            if date > newest.get(zip5, ''):
+                newest[zip5] = date
+            if len(batch) >= batchSize:
+                sent += self._write(batch)
+                batch = []
+        sent += self._write(batch)
+
+        loadedAt = (now or datetime.datetime.now()).isoformat(sep=' ', timespec='seconds')
+        with self.conn:
+            for zip5 in seen:
+                lastDate = max(newest.get(zip5, ''), stored.get(zip5) or '') or None
+                self.conn.execute(
+                    'INSERT INTO loaded_months (zip5, month, rows, lastDate, loadedAt, complete) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (zip5, month) DO UPDATE SET rows = excluded.rows, lastDate = excluded.lastDate, '
+                    'loadedAt = excluded.loadedAt, complete = excluded.complete',
+                    (zip5, monthKey(y, m), self.monthRows(zip5, y, m), lastDate, loadedAt, int(complete)))
+        return sent
+
+    def _write(self, batch):
+        if batch:
+            with self.conn:  # one transaction per batch
+                self.conn.executemany(self.upsertSql, batch)
+        return len(batch)
+
+    def loadCsv(self, f, y, m, skip=0, **kwargs):
+        """loadMonth from weatherDump CSV text (a file object or a string)."""
+        if isinstance(f, str):
+            f = io.StringIO(f)
+        reader = csv.reader(f)
+        for _ in range(skip):
+            next(reader, None)
+        return self.loadMonth(y, m, (row for row in reader if row), **kwargs)
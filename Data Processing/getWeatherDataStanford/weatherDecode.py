@@ -0,0 +1,90 @@
+# Vectorised decoding of QCLCD value columns.
+#
+# A QCLCD measurement is a number, possibly followed by a flag ('s' suspect,
+# 'V' variable, '*' marker), or a code instead of a number: 'M' missing,
+# 'T' trace (precipitation), blank. decode turns a whole column of such strings
+# into float32 values and a uint8 mask of the flags met without a try/except
+# per cell: the column is factorised (hashed in C), the few distinct strings are
+# decoded with pandas string operations and the results are gathered back.
+import numpy as np
+import pandas as pd
+
+MISSING = 1  # 'M'
+BLANK = 2  # empty field
+SUSPECT = 4  # trailing 's'
+VARIABLE = 8  # trailing 'V', or 'VR' wind direction
+STAR = 16  # '*'
+TRACE = 32  # 'T', decoded as 0
+INVALID = 64  # anything else that is not a number
+
+# cloud cover of the sky condition layers, in oktas
+SKY_COVER = {'CLR': 0, 'SKC': 0, 'FEW': 2, 'SCT': 4, 'BKN': 7, 'OVC': 8, 'VV': 8}
+SKY_PATTERN = r'\b(' + '|'.join(SKY_COVER) + r')(?::?\d*)'
+
+
+def _factorize(values):
+    """Codes of the values and their distinct (stripped) strings; missing values are blank."""
+    values = values.to_numpy(dtype=object) if isinstance(values, pd.Series) else np.asarray(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    s = pd.Series(uniques, dtype=object)
+    if len(s) and isinstance(uniques[0], bytes):
+        s = s.str.decode('latin-1')
+    # code -1 (None or NaN) picks the blank appended at the end
+    s = pd.concat([s.astype(str).str.strip(), pd.Series([''])], ignore_index=True)
+    return codes, s
+
+
+def _decodeStrings(s):
+    flags = np.zeros(len(s), dtype=np.uint8)
+    flags[(s == '').to_numpy()] |= BLANK
+    flags[(s == 'M').to_numpy()] |= MISSING
+    trace = (s == 'T').to_numpy()
+    flags[trace] |= TRACE
+    flags[(s == 'VR').to_numpy() | s.str.endswith('V').to_numpy()] |= VARIABLE
+    flags[s.str.endswith('s').to_numpy()] |= SUSPECT
+    flags[s.str.contains('*', regex=False).to_numpy()] |= STAR
+
+    number = s.str.rstrip('sV*').str.lstrip('*')
+    out = pd.to_numeric(number, errors='coerce').to_numpy(dtype=np.float32)
+    out[trace] = 0
+    flags[np.isnan(out) & (flags & (MISSING | BLANK | TRACE | VARIABLE) == 0)] |= INVALID
+    return out, flags
+
+
+def decode(values):
+    """float32 values and uint8 quality flags of a column of QCLCD strings (str, bytes or Series)."""
+    codes, s = _factorize(values)
+    out, flags = _decodeStrings(s)
+    return out[codes], flags[codes]
+
+
+def _skyStrings(s):
+    flags = np.zeros(len(s), dtype=np.uint8)
+    flags[(s == '').to_numpy()] |= BLANK
+    flags[(s == 'M').to_numpy()] |= MISSING
+    flags[s.str.endswith('s').to_numpy()] |= SUSPECT
+    layers = s.str.extractall(SKY_PATTERN)[0]
+    cover = np.full(len(s), np.nan, dtype=np.float32)
+    if len(layers):
+        worst = layers.map(SKY_COVER).groupby(level=0).max()
+        cover[worst.index.to_numpy()] = worst.to_numpy()
+    flags[np.isnan(cover) & (flags & (MISSING | BLANK) == 0)] |= INVALID
+    return cover, flags
+
+
+def skyCover(values):
+    """Cover of the most covered layer of each sky condition, in oktas (NaN when none), and flags."""
+    codes, s = _factorize(values)
+    cover, flags = _skyStrings(s)
+    return cover[codes], flags[codes]
+
+
+def decodeFrame(frame, columns, quality=False):
+    """frame with the given string columns decoded to float32 (and '<name>Quality' flag columns)."""
+    frame = frame.copy()
+    for name in columns:
+        values, flags = skyCover(frame[name]) if name == 'SkyCondition' else decode(frame[name])
+        frame[name] = values
+        if quality:
+            frame[name + 'Quality'] = flags
+    return frame
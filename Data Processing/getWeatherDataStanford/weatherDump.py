@@ -2,8 +2,77 @@ import sys
 import getopt
 import csv
 import datetime
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dateutil import rrule
 import WeatherData as weather
+import weatherDb
+import instrument
+
+_wd = None  # the WeatherData of this (worker) process
+_profile = None  # the instrument.Profile of a worker process, sent back with each month
+
+
+def initWorker(dataDir, baseUrl, fetchWorkers, cacheBytes, profile=False):
+    global _wd, _profile
+    _wd = weather.WeatherData(dataDir, baseUrl=baseUrl, fetchWorkers=fetchWorkers, cacheBytes=cacheBytes)
+    if profile:
+        _profile = instrument.enable()
+
+
+def dumpMonth(mDate, zips, n, prefDist):
+    """Combined weather of every zip for one month.
+
+    Returns (csv header, csv rows, [(zip5, row count)], profile data of a worker process or None).
+    """
+    global _profile
+    wd = _wd
+    with instrument.span('month', month=f'{mDate.year}-{mDate.month:02d}', zips=len(zips)):
+        stations = wd.stationLists(zips, mDate.year, mDate.month, n=n, preferredDistKm=prefDist)
+        monthStack = wd.weatherMonth(zips, mDate.year, mDate.month, hourly=True, n=n, preferredDistKm=prefDist,
+                                     stackData=True)
+
+        # Step 4: Average all contemporaneous observations for each zip code
+        combined = wd.combineZips(monthStack, stations, removeBlanks=True)
+        header, parts, counts = None, [], []
+        with instrument.span('csv'):
+            for zip5 in zips:
+                flat = combined[int(zip5)]
+                if header is None:
+                    header = flat.iloc[:0].to_csv()
+                parts.append(flat.to_csv(header=False))
+                counts.append((zip5, len(flat)))
+    profileData = None
+    if _profile is not None:
+        profileData = _profile.dump()
+        _profile = instrument.enable()  # start afresh for the next month
+    return header, ''.join(parts), counts, profileData
+
+
+def monthResults(tasks, jobs, inFlight, initArgs, profile=False):
+    """Yield (month, dumpMonth result) in the order of tasks.
+
+    With jobs > 1 the months are processed by a pool of processes, with at most
+    inFlight months submitted (and their results held) at any time; with
+    profile, every worker records its own instrument profile and returns it
+    with each month.
+    """
+    if jobs <= 1:
+        initWorker(*initArgs)
+        for task in tasks:
+            yield task[0], dumpMonth(*task)
+        return
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=initArgs + (profile,)) as pool:
+        pending = deque((task[0], pool.submit(dumpMonth, *task)) for task in itertools.islice(tasks, inFlight))
+        while pending:
+            mDate, future = pending.popleft()
+            result = future.result()
+            for task in itertools.islice(tasks, 1):
+                pending.append((task[0], pool.submit(dumpMonth, *task)))
+            yield mDate, result
+
 
 if __name__ == '__main__':
     cfgFile = None
@@ -12,14 +81,23 @@ if __name__ == '__main__':
     prefDist = 30
     query = False
     queryZip = None
+    baseUrl = None
+    fetchWorkers = 4
+    cacheMb = 256
+    jobs = 1
+    inFlight = None
+    dbFile = None
+    profilePath = None
     
     instruction = '''Usage:
-    python %s -i <inputfile> -o <outputfile> -n <stations per location> -d <preferred distance km>
+    python %s -i <inputfile> [-o <outputfile>] [-s <sqlite file>] -n <stations per location> -d <preferred distance km>
+              [-u <archive base url>] [-w <download workers>] [-c <month cache MB>]
+              [-j <month workers>] [-m <max months in flight>] [-p <profile .json or .trace.json>]
     OR
     python %s -q <zipcode> -n <stations per location> -d <preferred distance km>''' % tuple([sys.argv[0]]*2)
     
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hq:n:d:i:o:", ["inputfile=", "outputfile=", "distance="])
+        opts, args = getopt.getopt(sys.argv[1:], "hq:n:d:i:o:s:u:w:c:j:m:p:", ["inputfile=", "outputfile=", "distance="])
     except getopt.GetoptError:
         print(instruction)
         sys.exit(2)
@@ -39,18 +117,35 @@ if __name__ == '__main__':
         elif opt == '-q':
             query = True
             queryZip = arg
+        elif opt == '-u':
+            baseUrl = arg
+        elif opt == '-w':
+            fetchWorkers = int(arg)
+        elif opt == '-c':
+            cacheMb = int(arg)
+        elif opt == '-j':
+            jobs = int(arg)
+        elif opt == '-m':
+            inFlight = int(arg)
+        elif opt == '-s':
+            dbFile = arg
+        elif opt == '-p':
+            profilePath = arg
 
-    if not query and (cfgFile is None or outFile is None):
+    if not query and (cfgFile is None or (outFile is None and dbFile is None)):
         print(instruction)
         sys.exit()
 
+    targets = [f'file "{outFile}"'] if outFile else []
+    targets += [f'database "{dbFile}"'] if dbFile else []
     print(f'''
-    Config file "{cfgFile}" will be processed to file "{outFile}".
+    Config file "{cfgFile}" will be processed to {' and '.join(targets)}.
     Using {n} stations per location and a preferred distance of {prefDist} km.
     ''')
 
     startTime = datetime.datetime.now()
-    wd = weather.WeatherData('weather')
+    profile = instrument.enable() if profilePath is not None else None
+    wd = weather.WeatherData('weather', baseUrl=baseUrl, fetchWorkers=fetchWorkers, cacheBytes=cacheMb << 20)
 
     if query:
         sList = wd.stationList(queryZip, 2013, 3, n=n, preferredDistKm=prefDist)
@@ -100,21 +195,50 @@ if __name__ == '__main__':
         zips = [dr[0] for dr in dateRange if dr[1] <= mDate and dr[2] >= mDate]
         monthCfg[mDate] = zips
 
-    # Step 3: Loop over every month to pull all data for nearby stations
-    with open(outFile, 'w', encoding='utf-8') as outFile:
+    # Download every monthly archive up front, concurrently
+    wd.prefetchMonths(minStart, maxEnd)
+
+    # Step 3: Process the months (in parallel with -j) and write them in order
+    db = weatherDb.WeatherDb(dbFile) if dbFile is not None else None
+    tasks = []
+    for key in sorted(monthCfg.keys()):
+        zips = monthCfg[key]
+        if db is not None and outFile is None:
+            zips = db.pendingZips(zips, key.year, key.month)  # complete months are not fetched again
+        if zips:
+            tasks.append((key, zips, n, prefDist))
+    initArgs = ('weather', baseUrl, fetchWorkers, cacheMb << 20)
+    out = open(outFile, 'w', encoding='utf-8') if outFile is not None else None
+    try:
         firstRow = True
-        for key in sorted(monthCfg.keys()):
-            print(f'Working on month {key}')
-            zips = monthCfg[key]
-            monthStack = wd.weatherMonth(zips, key.year, key.month, hourly=True, n=n, preferredDistKm=prefDist, stackData=True)
+        for key, (header, rows, counts, profileData) in monthResults(tasks, jobs, inFlight or 2 * jobs, initArgs,
+                                                                             profile is not None):
+            if profileData is not None:
+                profile.merge(profileData)
+            print(f'Month {key}')
+            for zip5, count in counts:
+                print(f'  Writing {zip5}. {count} rows.')
+            if out is not None:
+                with instrument.span('write'):
+                    # Write headers only on the first row
+                    if firstRow and header is not None:
+                        out.write(header)
+                        firstRow = False
+                    out.write(rows)
+            if db is not None:
+                with instrument.span('db.load', month=f'{key.year}-{key.month:02d}'):
+                    loaded = db.loadCsv(rows, key.year, key.month, zips=[zip5 for zip5, _ in counts])
+                instrument.count('db.rowsSent', loaded)
+                print(f'  Loaded {loaded} new rows into {dbFile}')
+    finally:
+        if out is not None:
+            out.close()
+        if db is not None:
+            db.close()
 
-            # Step 4: Average all contemporaneous observations for each zip code
-            for zip5 in zips:
-                zipStations = [x[0] for x in wd.stationList(zip5, key.year, key.month, n=n, preferredDistKm=prefDist)]
-                flat = wd.combineStacks(monthStack, wbans=zipStations, addValues=[('zip5', zip5)])
-                print(f'  Writing {zip5}. {len(flat)} rows.')
-                # Write headers only on the first row
-                flat.to_csv(outFile, header=firstRow)
-                firstRow = False
-
-        print('Elapsed time: ', datetime.datetime.now() - startTime)
+    if jobs <= 1:
+        print('Month cache: ', _wd.MONTH_CACHE.stats())
+    print('Elapsed time: ', datetime.datetime.now() - startTime)
+    if profile is not None:
+        print('\n'.join(profile.report()))
+        print(f'Profile written to {profile.save(profilePath)}')
@@ -0,0 +1,203 @@
+# Concurrent, resumable download of the monthly QCLCD archives.
+#
+# Each worker thread keeps its own keep-alive connection per host, so a range of
+# months is fetched over a bounded set of pooled connections. Archives are
+# streamed to "<name>.part" next to their destination, and the ETag (or else the
+# Last-Modified date) of the response is saved to "<name>.part.validator". An
+# interrupted download resumes from the size of the part file with an HTTP
+# Range request made conditional on that validator (If-Range): if NOAA has
+# refreshed the archive meanwhile, the server answers with the whole new file
+# and the download starts over instead of appending to the old prefix. Once the
+# size (and the checksum, when one is known) has been verified and the zip
+# directory can be read, the part file is atomically renamed into place.
+# close() (or leaving a with block) closes the pooled connections.
+import hashlib
+import http.client
+import os
+import threading
+import urllib.parse
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+CHUNK_SIZE = 1 << 16
+MAX_REDIRECTS = 5
+VALIDATOR_SUFFIX = '.validator'
+
+
+class FetchError(IOError):
+    pass
+
+
+class ArchiveFetcher(object):
+    def __init__(self, baseUrl, dataDir, workers=4, retries=3, timeout=60, checksums=None):
+        self.baseUrl = baseUrl if baseUrl.endswith('/') else baseUrl + '/'
+        self.dataDir = dataDir
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self.checksums = checksums or {}  # file name -> sha256 hex digest
+        self.bytesDownloaded = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []  # of every thread, for close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+        return False
+
+    def close(self):
+        """Close the pooled connections of every thread (new ones are opened as needed)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def _connection(self, scheme, netloc):
+        pool = getattr(self._local, 'connections', None)
+        if pool is None:
+            pool = self._local.connections = {}
+        conn = pool.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = pool[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _dropConnection(self, scheme, netloc):
+        conn = getattr(self._local, 'connections', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def _get(self, url, headers):
+        for _ in range(MAX_REDIRECTS):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                self._dropConnection(parts.scheme, parts.netloc)
+                raise
+            if resp.status in (301, 302, 303, 307, 308):
+                resp.read()
+                url = urllib.parse.urljoin(url, resp.getheader('Location'))
+                continue
+            return parts, resp
+        raise FetchError(f'Too many redirects for {url}')
+
+    def _download(self, url, partFile):
+        validatorFile = partFile + VALIDATOR_SUFFIX
+        offset = os.path.getsize(partFile) if os.path.isfile(partFile) else 0
+        validator = None
+        if offset and os.path.isfile(validatorFile):
+            with open(validatorFile) as f:
+                validator = f.read().strip() or None
+        # without the validator of the part file there is no telling whether it is a prefix of the current archive
+        headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if validator else {}
+        if not validator:
+            offset = 0
+        parts, resp = self._get(url, headers)
+        try:
+            if resp.status == 416 and offset:
+                # the part file already holds the whole archive
+                resp.read()
+                total = resp.getheader('Content-Range', '').rpartition('/')[2]
+                return int(total) if total.isdigit() else None
+            if resp.status == 206 and offset:
+                mode = 'ab'
+                total = int(resp.getheader('Content-Range').rpartition('/')[2])
+            elif resp.status == 200:
+                # a fresh download, or the archive changed (or no range support): start over
+                mode, offset = 'wb', 0
+                length = resp.getheader('Content-Length')
+                total = int(length) if length is not None else None
+                with open(validatorFile, 'w') as f:
+                    f.write(resp.getheader('ETag') or resp.getheader('Last-Modified') or '')
+            else:
+                resp.read()
+                raise FetchError(f'{url}: HTTP {resp.status} {resp.reason}')
+            with open(partFile, mode) as f:
+                while True:
+                    block = resp.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    f.write(block)
+                    with self._lock:
+                        self.bytesDownloaded += len(block)
+                    instrument.count('fetch.bytes', len(block))
+            return total
+        except (http.client.HTTPException, OSError):
+            self._dropConnection(parts.scheme, parts.netloc)
+            raise
+
+    def _verify(self, fileName, partFile, total):
+        size = os.path.getsize(partFile)
+        if total is not None and size != total:
+            raise FetchError(f'{fileName}: got {size} bytes, expected {total}')
+        expected = self.checksums.get(fileName)
+        if expected is not None:
+            sha = hashlib.sha256()
+            with open(partFile, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            if sha.hexdigest() != expected.lower():
+                raise FetchError(f'{fileName}: sha256 {sha.hexdigest()} does not match {expected}')
+        try:
+            with zipfile.ZipFile(partFile) as zf:
+                zf.namelist()
+        except zipfile.BadZipFile:
+            raise FetchError(f'{fileName}: not a valid zip archive')
+
+    def fetch(self, fileName):
+        """Download baseUrl/fileName into dataDir and return its path."""
+        url = self.baseUrl + fileName
+        filePath = os.path.join(self.dataDir, fileName)
+        partFile = filePath + '.part'
+        os.makedirs(self.dataDir, exist_ok=True)
+        for attempt in range(self.retries + 1):
+            try:
+                with instrument.span('fetch', file=fileName, attempt=attempt):
+                    total = self._download(url, partFile)
+                break
+            except (http.client.HTTPException, OSError) as e:
+                if isinstance(e, FetchError) or attempt == self.retries:
+                    raise
+                print(f'{fileName}: {e}. Resuming ({attempt + 1}/{self.retries})')
+        try:
+            with instrument.span('verify', file=fileName):
+                self._verify(fileName, partFile, total)
+        except FetchError:
+            os.remove(partFile)  # do not resume from a bad file
+            self._removeValidator(partFile)
+            raise
+        os.replace(partFile, filePath)
+        self._removeValidator(partFile)
+        return filePath
+
+    def _removeValidator(self, partFile):
+        if os.path.isfile(partFile + VALIDATOR_SUFFIX):
+            os.remove(partFile + VALIDATOR_SUFFIX)
+
+    def fetchAll(self, fileNames):
+        """Download several archives concurrently; returns {fileName: path or exception}."""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {name: pool.submit(self.fetch, name) for name in fileNames}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = e
+        self.close()  # the connections of the pool's threads, which are gone
+        return results
@@ -0,0 +1,95 @@
+# Compact, persistent form of the zip code -> (lat, lon) map.
+#
+# The merged map is kept as a sorted int32 array of zip codes and a float32
+# (zips x 2) array of coordinates, saved as .npy files next to a JSON
+# fingerprint (size and modification time) of the source files it was built
+# from. Loading memory-maps the arrays, so a process that looks up a handful of
+# zips only reads the pages it touches; lookups are binary searches.
+import json
+import os
+
+import numpy as np
+
+CACHE_NAME = 'zip5Cache'
+
+
+class ZipCache(object):
+    def __init__(self, zips, latLon):
+        self.zips = zips
+        self.latLon = latLon
+
+    @classmethod
+    def fromMap(cls, zipMap):
+        zips = np.array(sorted(zipMap), dtype=np.int32)
+        latLon = np.array([zipMap[z] for z in zips.tolist()], dtype=np.float32).reshape(-1, 2)
+        return cls(zips, latLon)
+
+    def __len__(self):
+        return len(self.zips)
+
+    def _find(self, zip5):
+        i = int(np.searchsorted(self.zips, zip5))
+        return i if i < len(self.zips) and self.zips[i] == zip5 else -1
+
+    def __contains__(self, zip5):
+        return self._find(int(zip5)) >= 0
+
+    def __getitem__(self, zip5):
+        i = self._find(int(zip5))
+        if i < 0:
+            raise KeyError(zip5)
+        return float(self.latLon[i, 0]), float(self.latLon[i, 1])
+
+    def get(self, zip5, default=None):
+        try:
+            return self[zip5]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self.zips.tolist())
+
+    def lookup(self, zips):
+        """(len(zips) x 2) float64 lat/lon of an array of zip codes; KeyError on the first unknown one."""
+        zips = np.asarray(zips, dtype=np.int64).ravel()
+        i = np.minimum(np.searchsorted(self.zips, zips), max(len(self.zips) - 1, 0))
+        found = self.zips[i] == zips if len(self.zips) else np.zeros(len(zips), dtype=bool)
+        if not found.all():
+            raise KeyError(int(zips[np.argmin(found)]))
+        return self.latLon[i].astype(np.float64)
+
+    def save(self, cacheDir, sources):
+        os.makedirs(cacheDir, exist_ok=True)
+        base = os.path.join(cacheDir, CACHE_NAME)
+        for name, arr in (('zips', self.zips), ('latLon', self.latLon)):
+            tmp = f'{base}.{name}.tmp.npy'
+            np.save(tmp, arr)
+            os.replace(tmp, f'{base}.{name}.npy')
+        # the fingerprint is written last: it is what marks the arrays as valid
+        tmp = base + '.json.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(fingerprint(sources), f)
+        os.replace(tmp, base + '.json')
+
+    @classmethod
+    def load(cls, cacheDir, sources):
+        """The cached map, or None when it is missing or any source file has changed."""
+        base = os.path.join(cacheDir, CACHE_NAME)
+        try:
+            with open(base + '.json', 'r', encoding='utf-8') as f:
+                if json.load(f) != fingerprint(sources):
+                    return None
+            return cls(np.load(base + '.zips.npy', mmap_mode='r'), np.load(base + '.latLon.npy', mmap_mode='r'))
+        except (OSError, ValueError):
+            return None
+
+
+def fingerprint(sources):
+    out = []
+    for path in sources:
+        try:
+            st = os.stat(path)
+            out.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+        except OSError:
+            out.append([os.path.basename(path), None, None])
+    return out
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import join
+import loader
+
+
+class JoinTest(unittest.TestCase):
+
+    def test_encode(self):
+        t = join.encode([16, 2016, 2017], [1, 2, 12], [31, 1, 31], [24, 0, 23], [0, 53, 0])
+        self.assertEqual(t[0], t[1] - 53)
+        hour, day, month, year = join.decode(t)
+        np.testing.assert_array_equal(hour, [24, 1, 23])  # 00:53 is in the hour ending at 01:00
+        np.testing.assert_array_equal(day, [31, 1, 31])
+        np.testing.assert_array_equal(month, [1, 2, 12])
+        np.testing.assert_array_equal(year, [2016, 2016, 2017])
+
+    def test_asof(self):
+        right = np.array([0, 53, 113, 173, 300])
+        left = np.array([0, 60, 120, 180, 240, 400])
+        np.testing.assert_array_equal(join.asof(left, right, tolerance=10), [0, 1, 2, 3, -1, -1])
+        np.testing.assert_array_equal(join.asof(left, right, tolerance=0), [0, -1, -1, -1, -1, -1])
+        np.testing.assert_array_equal(join.asof(left, right, tolerance=100, direction="backward"), [0, 1, 2, 3, 3, 4])
+        ia, ib = join.match([5, 113, 0, 300], right)
+        np.testing.assert_array_equal(ia, [1, 2, 3])
+        np.testing.assert_array_equal(ib, [2, 0, 4])
+
+    def test_join(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            weather = os.path.join(tmp, "weather.csv")
+            solar = os.path.join(tmp, "solar.csv")
+            with open(weather, "w") as f:
+                f.write("Date,Time," + ",".join(loader.WEATHER_FEATURES) + "\n")
+                for day, time in [(1, 2353), (2, 53), (2, 153), (2, 253), (2, 453)]:
+                    f.write(f"2016-02-{day:02d},{time}," + ",".join(str(time + i) for i in range(8)) + "\n")
+            with open(solar, "w") as f:
+                f.write('"Month","Day","Year","Hr","Inverter_hr_mean"\n')
+                for hr in [3, 0, 1, 2, 4, 5]:
+                    f.write(f'"2","2","16","{hr}",{hr * 10}\n')
+            rows = join.join(loader.load(weather, cache=False), loader.load(solar, cache=False), tolerance=10)
+            # 04:00 has no report within 10 minutes
+            np.testing.assert_array_equal(rows[:, :4], [[24, 1, 2, 2016], [1, 2, 2, 2016], [2, 2, 2, 2016],
+                                                        [3, 2, 2, 2016], [5, 2, 2, 2016]])
+            np.testing.assert_array_equal(rows[:, 4], [2353, 53, 153, 253, 453])
+            np.testing.assert_array_equal(rows[:, -1], [0, 10, 20, 30, 50])
+
+            parts = join.split(rows, keep_night=False)
+            self.assertEqual(sum(len(p) for p in parts), 4)
+            path = os.path.join(tmp, "weather_train.csv")
+            join.write(parts[0], path)
+            self.assertEqual(loader.load(path, cache=False).columns, loader.COLUMNS[13])
+
+
+if __name__ == "__main__":
+    unittest.main()
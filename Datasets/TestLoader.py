@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import loader
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cacheDir, loader.CACHE_DIR = loader.CACHE_DIR, os.path.join(self.tmp.name, ".cache")
+        self.parse, self.parsed = loader.parse, 0
+
+        def counting_parse(*args, **kwargs):
+            self.parsed += 1
+            return self.parse(*args, **kwargs)
+        loader.parse = counting_parse
+
+        self.path = os.path.join(self.tmp.name, "weather_train.csv")
+        with open(self.path, "w") as f:
+            f.write("12;1;1.85;6.97;6.9;98.24;10.92;29.18;29.97;449.25\n")
+            f.write("9;0;10;3.96;-0.61;70.2;17.96;29.12;29.91;3165.5\n")
+
+    def tearDown(self):
+        loader.CACHE_DIR, loader.parse = self.cacheDir, self.parse
+        self.tmp.cleanup()
+
+    def test_headerless(self):
+        ds = loader.load(self.path)
+        self.assertEqual(ds.columns, loader.COLUMNS[10])
+        self.assertEqual(ds.data.dtype, np.float32)
+        np.testing.assert_allclose(ds["Solar energy"], [449.25, 3165.5])
+        np.testing.assert_allclose(ds[["Hour", "Visibility"]], [[12, 1.85], [9, 10]])
+
+    def test_header(self):
+        path = os.path.join(self.tmp.name, "solar-output_hourly.csv")
+        with open(path, "w") as f:
+            f.write('"Month","Day","Year","Hr","Inverter_hr_mean"\n"1","1","17","0",0\n"1","1","17","12",41.5\n')
+        ds = loader.load(path)
+        self.assertEqual(ds.columns, ["Month", "Day", "Year", "Hr", "Inverter_hr_mean"])
+        np.testing.assert_allclose(ds["Inverter_hr_mean"], [0, 41.5])
+
+    def test_cache(self):
+        loader.load(self.path)
+        ds = loader.load(self.path)
+        self.assertIsInstance(ds.data, np.memmap)
+        self.assertEqual(self.parsed, 1)
+
+        # a new mtime alone is caught by the hash
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        loader.load(self.path)
+        self.assertEqual(self.parsed, 1)
+
+        with open(self.path, "a") as f:
+            f.write("10;0;9;3;-1;70;17;29;29;3000\n")
+        self.assertEqual(len(loader.load(self.path)), 3)
+        self.assertEqual(self.parsed, 2)
+        self.assertEqual(sorted(os.path.splitext(name)[1] for name in os.listdir(loader.CACHE_DIR)), [".json", ".npy"])
+
+    def test_concurrentWrites(self):
+        # every writer has a temporary file of its own
+        with mock.patch("os.replace", side_effect=os.replace) as replace:
+            loader.load(self.path)
+            os.remove(loader.cache_path(self.path))
+            loader.load(self.path)
+        temporary = [call.args[0] for call in replace.call_args_list]
+        self.assertEqual(len(temporary), 4)
+        self.assertEqual(len(set(temporary)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Join hourly weather with the solar output into training sets.
+
+Timestamps are encoded as int64 minutes since 1970 and aligned with
+``np.searchsorted`` on the sorted weather timestamps: every solar hour takes
+the weather observation nearest to it, as long as it lies within a tolerance
+(METAR reports typically come a few minutes before the hour). The result is
+written in the layout of ``hourly/weather_{train,dev,test}.csv``: ``;``
+separated, no header, the columns of ``loader.COLUMNS[13]``.
+
+The weather hours follow the convention of the datasets, 1 to 24, where hour
+24 of a day is midnight of the next one; the solar output counts hours 0 to 23.
+
+    python join.py -w <weather file> -s <solar output csv> -o <output directory>
+                   [-t <tolerance minutes>] [-n] [-r <seed>]
+"""
+import getopt
+import os
+import sys
+
+import numpy as np
+
+import loader
+
+SOLAR_PATH = os.path.join(loader.DATASET_PATH, "hourly", "with_night-hours", "solar-output_hourly.csv")
+WEATHER_PATH = os.path.join(loader.DATASET_PATH, "hourly", "with_night-hours",
+                            "weather-inputs_illinois_chronological-order.xlsx")
+SPLITS = ("train", "dev", "test")
+
+
+def encode(year, month, day, hour=0, minute=0):
+    """int64 minutes since 1970-01-01 of each (year, month, day, hour, minute); two digit years are 20xx."""
+    year = np.asarray(year, dtype=np.int64)
+    year = np.where(year < 100, year + 2000, year)
+    months = (year - 1970) * 12 + np.asarray(month, dtype=np.int64) - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + np.asarray(day, dtype=np.int64) - 1
+    return days * 1440 + np.asarray(hour, dtype=np.int64) * 60 + np.asarray(minute, dtype=np.int64)
+
+
+def decode(minutes):
+    """Hour (1 to 24), day, month and year of each timestamp, in the convention of the datasets."""
+    minutes = np.asarray(minutes, dtype=np.int64) - 1  # midnight is hour 24 of the day before
+    day = (minutes // 1440).astype("datetime64[D]")
+    month = day.astype("datetime64[M]")
+    year = month.astype("datetime64[Y]")
+    return ((minutes % 1440) // 60 + 1,
+            (day - month.astype("datetime64[D]")).astype(np.int64) + 1,
+            (month - year.astype("datetime64[M]")).astype(np.int64) + 1,
+            year.astype(np.int64) + 1970)
+
+
+def match(a, b):
+    """Indices (ia, ib) of the equal values of a and of the sorted array b."""
+    a, b = np.asarray(a), np.asarray(b)
+    j = np.minimum(np.searchsorted(b, a), max(len(b) - 1, 0))
+    ia = np.flatnonzero(b[j] == a) if len(b) else np.array([], dtype=np.intp)
+    return ia, j[ia]
+
+
+def asof(left, right, tolerance=0, direction="nearest"):
+    """Index in the sorted array right of the match of each left value, -1 when none is within tolerance.
+
+    direction : "nearest", or "backward" for the last right value not after the left one
+    """
+    left, right = np.asarray(left), np.asarray(right)
+    if len(right) == 0:
+        return np.full(len(left), -1)
+    after = np.searchsorted(right, left, side="right")
+    before = np.maximum(after - 1, 0)
+    idx = before
+    if direction == "nearest":
+        after = np.minimum(after, len(right) - 1)
+        idx = np.where(np.abs(right[after] - left) < np.abs(left - right[before]), after, before)
+    elif direction != "backward":
+        raise ValueError(f"unknown direction {direction!r}")
+    ok = (np.abs(left - right[idx]) <= tolerance) & ((direction == "nearest") | (right[idx] <= left))
+    return np.where(ok, idx, -1)
+
+
+def weather_times(ds):
+    """Timestamps of a weather Dataset with Day, Month, Year and an hour (1-24) or QCLCD HHMM Time column."""
+    time = ds["Hour"] if "Hour" in ds.columns else ds["Time"]
+    time = np.asarray(time, dtype=np.int64)
+    hhmm = time.max(initial=0) > 24
+    hour, minute = (time // 100, time % 100) if hhmm else (time, 0)
+    return encode(ds["Year"], ds["Month"], ds["Day"], hour, minute)
+
+
+def join(weather, solar, tolerance=0, direction="nearest"):
+    """(rows x 13) float32 array of the solar hours with their weather, in the layout of COLUMNS[13]."""
+    w_times = weather_times(weather)
+    order = np.argsort(w_times, kind="stable")
+    w_times = w_times[order]
+    s_times = encode(solar["Year"], solar["Month"], solar["Day"], solar["Hr"])
+    idx = asof(s_times, w_times, tolerance, direction)
+    keep = np.flatnonzero(idx >= 0)
+    s_times = s_times[keep]
+    features = np.asarray(weather[loader.WEATHER_FEATURES])[order[idx[keep]]]
+    energy = np.asarray(solar["Inverter_hr_mean"])[keep]
+    rows = np.column_stack(decode(s_times) + (features, energy)).astype("float32")
+    return rows[np.argsort(s_times, kind="stable")]
+
+
+def split(rows, fractions=(0.8, 0.1, 0.1), seed=0, keep_night=False):
+    """Shuffled train, dev and test rows; without keep_night the hours without output are left out."""
+    if not keep_night:
+        rows = rows[rows[:, -1] > 0]
+    rows = rows[np.random.default_rng(seed).permutation(len(rows))]
+    bounds = (np.concatenate([[0], np.cumsum(fractions)]) / np.sum(fractions) * len(rows)).round().astype(int)
+    return [rows[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def write(rows, path):
+    np.savetxt(path, rows, fmt="%.6g", delimiter=";")
+
+
+def main(argv):
+    instruction = (f"Usage: python {sys.argv[0]} -w <weather file> -s <solar output csv> -o <output directory> "
+                   "[-t <tolerance minutes>] [-n] [-r <seed>]")
+    try:
+        opts, args = getopt.getopt(argv, "hw:s:o:t:nr:")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    weather_path, solar_path, out_dir, tolerance, keep_night, seed = WEATHER_PATH, SOLAR_PATH, None, 0, False, 0
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-w":
+            weather_path = arg
+        elif opt == "-s":
+            solar_path = arg
+        elif opt == "-o":
+            out_dir = arg
+        elif opt == "-t":
+            tolerance = int(arg)
+        elif opt == "-n":
+            keep_night = True
+        elif opt == "-r":
+            seed = int(arg)
+    if out_dir is None:
+        print(instruction)
+        sys.exit(2)
+
+    rows = join(loader.load(weather_path), loader.load(solar_path), tolerance)
+    print(f"{len(rows)} solar hours matched with weather")
+    os.makedirs(out_dir, exist_ok=True)
+    for name, part in zip(SPLITS, split(rows, seed=seed, keep_night=keep_night)):
+        write(part, os.path.join(out_dir, f"weather_{name}.csv"))
+        print(f"weather_{name}.csv: {len(part)} rows")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,212 @@
+"""Cached loader for the CSV and XLSX files of the Datasets/ tree.
+
+Each source (or each sheet of a workbook) is parsed once into a float32 ``.npy``
+file under ``Datasets/.cache`` together with a small JSON sidecar holding the
+column names and the fingerprint of the source. Later loads memory-map the
+``.npy`` file directly. A cache entry is rebuilt when the size and modification
+time of its source change and its SHA-1 no longer matches (so a checkout that
+only touches mtimes does not trigger a re-parse).
+
+    >>> train = load("hourly/weather_train.csv")
+    >>> train["Solar energy"], train[["Hour", "Temperature"]]
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+DATASET_PATH = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(DATASET_PATH, ".cache")
+
+WEATHER_FEATURES = ["Cloud coverage", "Visibility", "Temperature", "Dew point", "Relative humidity",
+                    "Wind speed", "Station pressure", "Altimeter"]
+# Column names of the header-less files, by number of columns
+COLUMNS = {
+    13: ["Hour", "Day", "Month", "Year"] + WEATHER_FEATURES + ["Solar energy"],
+    10: ["Hour"] + WEATHER_FEATURES + ["Solar energy"],
+    9: WEATHER_FEATURES + ["Solar energy"],
+    4: ["Date", "Day", "Month", "Year"],
+    3: ["Day", "Month", "Year"],
+}
+DATE_COLUMNS = ("Date", "Timestamp")
+
+
+class Dataset:
+    """A float32 (rows x columns) array with named columns."""
+
+    def __init__(self, data, columns):
+        self.data = data
+        self.columns = list(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.data[:, self._index[key]]
+        return self.data[:, [self._index[name] for name in key]]
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def to_frame(self):
+        return pd.DataFrame(np.asarray(self.data), columns=self.columns)
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cache_path(path, sheet=None):
+    """Location of the cache entry of a source file (and sheet)."""
+    rel = os.path.relpath(os.path.abspath(path), DATASET_PATH)
+    name = rel.replace(os.sep, "__").replace("..", "_")
+    if sheet is not None:
+        name += f"__{sheet}"
+    return os.path.join(CACHE_DIR, name + ".npy")
+
+
+def _named(df):
+    """Give header-less frames their column names, or generic ones."""
+    names = COLUMNS.get(df.shape[1], [f"col{i}" for i in range(df.shape[1])])
+    return df.set_axis(names, axis=1)
+
+
+def _is_header(values):
+    """True when a first row holds names rather than numbers or dates."""
+    for value in values:
+        if isinstance(value, str):
+            try:
+                float(value.strip().strip('"'))
+            except ValueError:
+                return True
+    return False
+
+
+def _to_float32(df):
+    """Numeric float32 array and column names; dates are expanded to Day, Month, Year."""
+    df = df.dropna(axis=1, how="all")
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        if str(name).startswith(DATE_COLUMNS) and not pd.api.types.is_numeric_dtype(col):
+            col = pd.to_datetime(col, errors="coerce", format="mixed")
+        if pd.api.types.is_datetime64_any_dtype(col):
+            for part in ("Day", "Month", "Year"):
+                if part not in df.columns:
+                    columns[part] = getattr(col.dt, part.lower())
+            continue
+        columns[str(name).strip()] = pd.to_numeric(col, errors="coerce")
+    out = pd.DataFrame(columns)
+    return out.to_numpy(dtype="float32"), list(out.columns)
+
+
+def parse(path, sheet=None):
+    """Parse a source file (the slow path) into a float32 array and column names."""
+    if path.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(path, sheet_name=0 if sheet is None else sheet, header=None)
+        if _is_header(df.iloc[0].tolist()):
+            df = df.iloc[1:].set_axis(df.iloc[0].tolist(), axis=1)
+        else:
+            df = _named(df)
+    else:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            first = f.readline().rstrip("\r\n")
+        sep = ";" if first.count(";") > first.count(",") else ","
+        if _is_header(first.split(sep)):
+            df = pd.read_csv(path, sep=sep, encoding="utf-8-sig")
+        else:
+            df = _named(pd.read_csv(path, sep=sep, header=None, encoding="utf-8-sig"))
+    return _to_float32(df)
+
+
+def _fresh(meta, path):
+    st = os.stat(path)
+    if meta["size"] == st.st_size and meta["mtime_ns"] == st.st_mtime_ns:
+        return True
+    return meta["size"] == st.st_size and meta["sha1"] == file_hash(path)
+
+
+def load(path, sheet=None, cache=True):
+    """Load a dataset file as a Dataset, through the binary cache.
+
+    path : absolute, or relative to the Datasets/ directory
+    sheet : sheet name or position for workbooks (the first sheet by default)
+    """
+    if not os.path.isabs(path) and not os.path.isfile(path):
+        path = os.path.join(DATASET_PATH, path)
+    if not cache:
+        return Dataset(*parse(path, sheet))
+
+    npyFile = cache_path(path, sheet)
+    metaFile = npyFile[:-4] + ".json"
+    if os.path.isfile(npyFile) and os.path.isfile(metaFile):
+        with open(metaFile, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if _fresh(meta, path):
+            st = os.stat(path)
+            if meta["mtime_ns"] != st.st_mtime_ns:
+                meta["mtime_ns"] = st.st_mtime_ns
+                _write_json(metaFile, meta)
+            return Dataset(np.load(npyFile, mmap_mode="r"), meta["columns"])
+
+    data, columns = parse(path, sheet)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _write_file(npyFile, "wb", lambda f: np.save(f, data))
+    st = os.stat(path)
+    _write_json(metaFile, {"source": os.path.relpath(path, DATASET_PATH), "sheet": sheet, "columns": columns,
+                           "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": file_hash(path)})
+    return Dataset(np.load(npyFile, mmap_mode="r"), columns)
+
+
+def _write_json(path, obj):
+    _write_file(path, "w", lambda f: json.dump(obj, f))
+
+
+def _write_file(path, mode, write):
+    """Write path through a temporary file of its own, so that concurrent writers never mix their output."""
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def sources(root=DATASET_PATH):
+    """Every CSV and XLSX file under root."""
+    for dirPath, dirNames, fileNames in os.walk(root):
+        dirNames[:] = [d for d in dirNames if not d.startswith(".")]
+        for fileName in sorted(fileNames):
+            if fileName.lower().endswith((".csv", ".xlsx")):
+                yield os.path.join(dirPath, fileName)
+
+
+def main(argv):
+    """Warm the cache for every source (or the given ones) and every sheet."""
+    for path in argv or sources():
+        sheets = [None]
+        if path.lower().endswith(".xlsx"):
+            sheets = pd.ExcelFile(path).sheet_names
+        for sheet in sheets:
+            start = time.time()
+            ds = load(path, sheet)
+            print(f"{os.path.relpath(path, DATASET_PATH)}{'' if sheet is None else ' [' + sheet + ']'}: "
+                  f"{ds.shape[0]} x {ds.shape[1]} in {time.time() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import evaluate
+import wlr
+
+WLR_PATH = wlr.DATASET_PATH
+
+
+class EvaluateTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        rows = 2000
+        self.keys = evaluate.make_keys(hour=rng.integers(1, 25, rows), month=rng.integers(1, 13, rows),
+                                       site=rng.choice(["94305", "10001", "60601"], rows))
+        self.y = np.where(rng.random(rows) < 0.2, 0, rng.gamma(2, 500, rows))
+        self.pred = self.y + rng.normal(scale=200, size=rows)
+
+    def test_groupedErrors(self):
+        frame = evaluate.grouped_errors(self.y, self.pred, self.keys, ("site", "season"))
+        self.assertEqual(len(frame), 12)
+        df = pd.DataFrame({"site": self.keys["site"], "season": self.keys["season"], "y": self.y,
+                           "se": (self.y - self.pred) ** 2})
+        df["ar"] = np.where(df.y != 0, np.abs(df.y - self.pred) / df.y.where(df.y != 0), np.nan)
+        expected = df.groupby(["site", "season"]).agg(n=("y", "size"), lms=("se", "mean"),
+                                                      median_se=("se", "median"), n_nonzero=("ar", "count"),
+                                                      mape=("ar", "mean"), median_ar=("ar", "median")).reset_index()
+        for column in ("site", "season"):
+            np.testing.assert_array_equal(frame[column].to_numpy(), expected[column].to_numpy())
+        for column in expected.columns[2:]:
+            np.testing.assert_allclose(frame[column].to_numpy(), expected[column].to_numpy(), rtol=1e-12)
+
+        total = evaluate.grouped_errors(self.y, self.pred, self.keys)
+        self.assertEqual(total["n"].tolist(), [len(self.y)])
+        self.assertAlmostEqual(total["lms"][0], np.mean((self.y - self.pred) ** 2))
+
+    def test_report(self):
+        predictions = {"good": self.pred, "zero": np.zeros_like(self.y)}
+        table = evaluate.report(self.y, predictions, self.keys, evaluate.GROUPINGS)
+        self.assertEqual(list(table.columns), ["model", "group_by", "hour", "month", "season"] + list(evaluate.METRICS))
+        counts = table.groupby(["group_by", "model"]).size()
+        self.assertEqual(counts[("hour,month", "good")], 24 * 12)
+        self.assertEqual(counts[("season", "zero")], 4)
+        self.assertTrue(table.loc[table.group_by == "all", "hour"].isna().all())
+        zero = table[(table.model == "zero") & (table.group_by == "month")]
+        np.testing.assert_allclose(zero["mape"], 1)
+        for model, group in table[table.group_by == "hour"].groupby("model"):
+            self.assertEqual(group["n"].sum(), len(self.y))
+
+    def test_hourFiles(self):
+        XTrain, yTrain = wlr.import_data(os.path.join(WLR_PATH, "weather_train.csv"))
+        XTest, yTest = wlr.import_data(os.path.join(WLR_PATH, "weather_test.csv"))
+        keys = evaluate.load_keys(os.path.join(WLR_PATH, "weather_test.csv"),
+                                  os.path.join(WLR_PATH, "weather_test_timeline.csv"))
+        self.assertNotIn("site", keys)
+        self.assertEqual(set(evaluate.load_keys(os.path.join(WLR_PATH, "weather_test.csv"),
+                                                os.path.join(WLR_PATH, "weather_test_timeline.csv"),
+                                                "94305")["site"]), {"94305"})
+        pred = wlr.WeightedLinearRegression(XTrain, yTrain).predict(XTest, wlr.BEST_TAU)
+        directory = tempfile.mkdtemp()
+        try:
+            for path in evaluate.write_hour_files(yTest, pred, keys, "wlr", os.path.join(directory, "hours")):
+                with open(path) as f, open(os.path.join(WLR_PATH, os.path.basename(path))) as reference:
+                    self.assertEqual(f.read().split(), reference.read().split())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_mainGroupings(self):
+        with self.assertRaises(SystemExit) as raised:
+            evaluate.main(["-g", "site"])
+        self.assertEqual(raised.exception.code, 2)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "report.csv")
+            evaluate.main(["-s", "94305", "-g", "site;hour", "-o", path])
+            table = pd.read_csv(path, dtype={"site": object})
+            self.assertEqual(set(table.loc[table.group_by == "site", "site"]), {"94305"})
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+"""Prediction errors of the solar energy models, grouped by hour, month, season and site.
+
+Replaces the hand-written filters at the end of ``weighted_linear_regression.m``
+(one ``find(yTest(I)~=0 & hours(I)==h)`` per hour) and the error lines of
+``solar-1.R``. Every row of the test set carries its keys (hour, month, season,
+site, ...), each combination of keys is numbered once, and every error of every
+group is then a ``np.bincount`` over the group numbers; medians come from one
+sort by (group, error). The errors of several models over several groupings
+(e.g. per hour, per month and per hour and month) are one call and one tidy
+table, with a row per model and group:
+
+    model  group_by    hour  month  n  lms  median_se  mae  n_nonzero  mape  median_ar
+
+``lms`` is the averaged LMS (squared) error of the .m script, ``mape`` the
+absolute relative error averaged over the hours with output (y != 0) and
+``median_ar`` its median. Key columns that a grouping does not use are empty.
+
+``write_hour_files`` writes the ``error_<model>_<h>hour.csv`` files of the .m
+script (hour, day, month, year and absolute relative error of the hours with
+output, in date order).
+
+    python evaluate.py [-d <dataset directory>] [-s <site>] [-g <groupings>] [-o <report csv>] [-e <hour files directory>]
+
+evaluates WLR and PCA + WLR on the test set of the Weighted Linear Regression
+folder. Groupings are separated by ";" and their keys by ",", the default is
+"all;hour;month;season;hour,month". A dataset holds one site: -s names it, so
+that reports of several datasets can be grouped by site once concatenated.
+"""
+import getopt
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "Weighted Linear Regression"))
+sys.path.insert(0, os.path.join(ROOT, "Principal Components Analysis"))
+import wlr
+import pca
+
+# meteorological seasons of the northern hemisphere
+SEASONS = {12: "winter", 1: "winter", 2: "winter", 3: "spring", 4: "spring", 5: "spring",
+           6: "summer", 7: "summer", 8: "summer", 9: "autumn", 10: "autumn", 11: "autumn"}
+KEYS = ("hour", "month", "season", "site", "day", "year")
+METRICS = ("n", "lms", "median_se", "mae", "n_nonzero", "mape", "median_ar")
+GROUPINGS = ((), ("hour",), ("month",), ("season",), ("hour", "month"))
+HOURS = (8, 12, 16)  # the hour files of the .m script
+# PCA5/weighted_linear_regression.m: 5 components of all the splits, then WLR with tau = 3
+PCA_K = 5
+PCA_TAU = 3
+
+
+def make_keys(hour=None, month=None, site=None, day=None, year=None):
+    """The keys of each row, as a dict of arrays; the season is derived from the month."""
+    keys = {name: np.asarray(value) for name, value in
+            (("hour", hour), ("month", month), ("site", site), ("day", day), ("year", year)) if value is not None}
+    if "month" in keys:
+        keys["season"] = np.array([SEASONS[m] for m in keys["month"].astype(int)], dtype=object)
+    return keys
+
+
+def load_keys(data_file, timeline_file, site=None):
+    """Keys of a weather_*.csv file (hour in the first column) and its Day;Month;Year timeline.
+
+    The rows have a site key only when the site of the file is given.
+    """
+    hour = np.loadtxt(data_file, delimiter=";", usecols=0, ndmin=1)
+    day, month, year = np.loadtxt(timeline_file, delimiter=";", ndmin=2).T
+    sites = None if site is None else np.full(len(hour), site, dtype=object)
+    return make_keys(hour.astype(int), month.astype(int), sites, day.astype(int), year.astype(int))
+
+
+def group_codes(keys, by):
+    """Number of each row's group (combination of the keys in by) and the key values of each group."""
+    rows = len(next(iter(keys.values())))
+    if not by:
+        return np.zeros(rows, dtype=np.int64), {}
+    levels, inverses = [], []
+    for name in by:
+        level, inverse = np.unique(keys[name], return_inverse=True)
+        levels.append(level)
+        inverses.append(inverse.ravel())
+    combined = np.ravel_multi_index(inverses, [len(level) for level in levels])
+    used, codes = np.unique(combined, return_inverse=True)
+    positions = np.unravel_index(used, [len(level) for level in levels])
+    return codes.ravel(), {name: level[position] for name, level, position in zip(by, levels, positions)}
+
+
+def grouped_median(codes, values, groups):
+    """Median of values within each of the groups (NaN for an empty group)."""
+    counts = np.bincount(codes, minlength=groups)
+    ordered = values[np.lexsort((values, codes))]
+    starts = np.cumsum(counts) - counts
+    median = np.full(groups, np.nan)
+    full = counts > 0
+    low = starts[full] + (counts[full] - 1) // 2
+    high = starts[full] + counts[full] // 2
+    median[full] = (ordered[low] + ordered[high]) / 2
+    return median
+
+
+def grouped_errors(y, pred, keys, by=()):
+    """Errors of pred against y for each group of the keys in by, as a DataFrame."""
+    y, pred = np.asarray(y, dtype="float64"), np.asarray(pred, dtype="float64")
+    codes, values = group_codes(keys, by)
+    groups = int(codes.max()) + 1 if len(codes) else 0
+    n = np.bincount(codes, minlength=groups)
+    se = (y - pred) ** 2
+    ae = np.abs(y - pred)
+    nonzero = y != 0
+    ar = ae[nonzero] / np.abs(y[nonzero])
+    n_nonzero = np.bincount(codes[nonzero], minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frame = pd.DataFrame(values)
+        frame["n"] = n
+        frame["lms"] = np.bincount(codes, se, groups) / n
+        frame["median_se"] = grouped_median(codes, se, groups)
+        frame["mae"] = np.bincount(codes, ae, groups) / n
+        frame["n_nonzero"] = n_nonzero
+        frame["mape"] = np.bincount(codes[nonzero], ar, groups) / n_nonzero
+        frame["median_ar"] = grouped_median(codes[nonzero], ar, groups)
+    return frame
+
+
+def report(y, predictions, keys, groupings=GROUPINGS):
+    """Tidy table of the errors of every model ({name: pred}) for every grouping of the keys."""
+    names = list(predictions)
+    y = np.asarray(y)
+    # the models are one more key of the stacked predictions
+    stacked = {name: np.tile(np.asarray(value), len(names)) for name, value in keys.items()}
+    stacked["model"] = np.repeat(np.arange(len(names)), len(y))
+    y_all = np.tile(y, len(names))
+    pred_all = np.concatenate([np.asarray(predictions[name], dtype="float64").ravel() for name in names])
+    frames = []
+    for by in groupings:
+        frame = grouped_errors(y_all, pred_all, stacked, ("model",) + tuple(by))
+        frame["model"] = np.asarray(names, dtype=object)[frame["model"].to_numpy()]
+        frame.insert(1, "group_by", ",".join(by) or "all")
+        frames.append(frame)
+    columns = ["model", "group_by"] + [name for name in KEYS if any(name in by for by in groupings)] + list(METRICS)
+    table = pd.concat(frames, ignore_index=True).reindex(columns=columns)
+    for name in ("hour", "month", "day", "year"):
+        if name in table and pd.api.types.is_numeric_dtype(table[name]):
+            table[name] = table[name].astype("Int64")  # integers, empty outside the groupings using them
+    return table
+
+
+def hour_errors(y, pred, keys, hour):
+    """(hour, day, month, year, absolute relative error) of the rows of the hour with output, in date order."""
+    y, pred = np.asarray(y, dtype="float64"), np.asarray(pred, dtype="float64")
+    order = np.lexsort((keys["day"], keys["month"], keys["year"]))
+    rows = order[(y[order] != 0) & (keys["hour"][order] == hour)]
+    ar = np.abs(y[rows] - pred[rows]) / y[rows]
+    return np.column_stack([keys["hour"][rows], keys["day"][rows], keys["month"][rows], keys["year"][rows], ar])
+
+
+def write_hour_files(y, pred, keys, model, directory=".", hours=HOURS):
+    """Write error_<model>_<h>hour.csv for each hour h, as csvwrite of the .m script; returns the paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for hour in hours:
+        path = os.path.join(directory, f"error_{model}_{hour}hour.csv")
+        np.savetxt(path, hour_errors(y, pred, keys, hour), fmt=["%d", "%d", "%d", "%d", "%.5g"], delimiter=",")
+        paths.append(path)
+    return paths
+
+
+def parse_groupings(text):
+    return tuple(() if grouping in ("", "all") else tuple(grouping.split(",")) for grouping in text.split(";"))
+
+
+def main(argv):
+    instruction = (f"Usage: python {sys.argv[0]} [-d <dataset directory>] [-s <site>] [-g <groupings>] "
+                   "[-o <report csv>] [-e <hour files directory>]")
+    try:
+        opts, args = getopt.getopt(argv, "hd:s:g:o:e:")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    dataset_path, site, groupings, report_path, hour_directory = wlr.DATASET_PATH, None, GROUPINGS, None, None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-d":
+            dataset_path = arg
+        elif opt == "-s":
+            site = arg
+        elif opt == "-g":
+            groupings = parse_groupings(arg)
+        elif opt == "-o":
+            report_path = arg
+        elif opt == "-e":
+            hour_directory = arg
+    keys = load_keys(os.path.join(dataset_path, "weather_test.csv"),
+                     os.path.join(dataset_path, "weather_test_timeline.csv"), site)
+    missing = sorted({name for by in groupings for name in by} - set(keys))
+    if missing:
+        print(f"Cannot group by {', '.join(missing)}: the test rows have the keys {', '.join(keys)}"
+              + (" (give the site with -s)" if "site" in missing else ""))
+        print(instruction)
+        sys.exit(2)
+
+    XTrain, yTrain = wlr.import_data(os.path.join(dataset_path, "weather_train.csv"))
+    XDev, _ = wlr.import_data(os.path.join(dataset_path, "weather_dev.csv"))
+    XTest, yTest = wlr.import_data(os.path.join(dataset_path, "weather_test.csv"))
+    projection = pca.PCA().fit(np.vstack([XTrain, XDev, XTest]))
+    predictions = {
+        "wlr": wlr.WeightedLinearRegression(XTrain, yTrain).predict(XTest, wlr.BEST_TAU),
+        f"pca{PCA_K}": wlr.WeightedLinearRegression(projection.transform(XTrain, PCA_K), yTrain).predict(
+            projection.transform(XTest, PCA_K), PCA_TAU),
+    }
+
+    start = time.time()
+    table = report(yTest, predictions, keys, groupings)
+    print(f"{len(table)} groups of {len(predictions)} models in {(time.time() - start) * 1000:.1f} ms")
+    with pd.option_context("display.max_rows", 200, "display.width", 160):
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    if report_path:
+        table.to_csv(report_path, index=False)
+    if hour_directory:
+        for model, pred in predictions.items():
+            for path in write_hour_files(yTest, pred, keys, model, hour_directory):
+                print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import service
+import pca
+import predict
+import wlr
+
+
+def lstmPredictor(rng, features=3, units=4, lookback=5):
+    layers = [("LSTM", {"kernel": rng.normal(size=(features, 4 * units)).astype("float32"),
+                        "recurrent_kernel": rng.normal(size=(units, 4 * units)).astype("float32"),
+                        "bias": np.zeros(4 * units, dtype="float32"), "return_sequences": False}),
+              ("Dense", {"kernel": rng.normal(size=(units, 1)).astype("float32"),
+                         "bias": np.zeros(1, dtype="float32"), "activation": "linear"})]
+    return predict.LstmPredictor(layers, np.zeros(features, dtype="float32"), np.ones(features, dtype="float32"),
+                                 lookback)
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+class ServiceTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(400, 8)) * 3 + 10
+        self.y = self.X @ rng.normal(size=8) + rng.normal(size=400)
+        self.Xq = rng.normal(size=(60, 8)) * 3 + 10
+        self.models = {"wlr": service.wlr_model(self.X, self.y),
+                       "pca_wlr": service.pca_wlr_model(self.X, self.y, pca.PCA().fit(self.X), k=4),
+                       "lstm": service.lstm_model(lstmPredictor(rng))}
+        self.windows = rng.random(size=(30, 5, 3))
+
+    async def test_coalescing(self):
+        batcher = service.MicroBatcher(self.models["wlr"], window=0.05, max_batch=1000).start()
+        try:
+            preds = await asyncio.gather(*[batcher.predict(self.Xq[i:i + 3]) for i in range(0, 60, 3)])
+        finally:
+            await batcher.stop()
+        np.testing.assert_allclose(np.concatenate(preds), self.models["wlr"].predict(self.Xq), rtol=1e-9)
+        metrics = batcher.metrics()
+        self.assertEqual((metrics["requests"], metrics["rows"]), (20, 60))
+        self.assertEqual(metrics["batches"], 1)
+        self.assertEqual(metrics["max_queued_rows"], 60)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(metrics["batch_rows_histogram"], {"<=64": 1})
+
+    def test_exactByDefault(self):
+        exact = wlr.WeightedLinearRegression(self.X, self.y).predict(self.Xq, wlr.BEST_TAU)
+        np.testing.assert_array_equal(self.models["wlr"].predict(self.Xq), exact)
+        local = service.wlr_model(self.X, self.y, local=True).predict(self.Xq)
+        np.testing.assert_allclose(local, exact, rtol=1e-4)
+
+    async def test_failures(self):
+        def fragile(X):
+            if (X[:, 0] < 0).any():
+                raise RuntimeError("negative input")
+            return X.sum(axis=1)
+
+        batcher = service.MicroBatcher(service.Model("fragile", (2,), fragile), window=0.05).start()
+        try:
+            with self.assertRaises(ValueError):
+                await batcher.predict([[1, np.nan]])
+            inputs = [[[1, 2]], [[-1, 2]], [[3, 4], [5, 6]]]
+            results = await asyncio.gather(*[batcher.predict(X) for X in inputs], return_exceptions=True)
+        finally:
+            await batcher.stop()
+        np.testing.assert_array_equal(results[0], [3])
+        self.assertIsInstance(results[1], RuntimeError)
+        np.testing.assert_array_equal(results[2], [7, 11])
+        metrics = batcher.metrics()
+        self.assertEqual((metrics["requests"], metrics["batches"], metrics["errors"]), (3, 1, 1))
+
+        forecast = service.ForecastService({"fragile": service.Model("fragile", (2,), fragile)}, window=0)
+        await forecast.start(port=0)
+        try:
+            status, reply = await forecast.handle("POST", "/predict/fragile", json.dumps({"inputs": [[-1, 2]]}))
+            self.assertEqual(status, 500)
+            self.assertIn("negative input", reply["error"])
+            status, _ = await forecast.handle("POST", "/predict/fragile", '{"inputs": [[Infinity, 2]]}')
+            self.assertEqual(status, 400)
+        finally:
+            await forecast.stop()
+
+    async def test_maxBatch(self):
+        batcher = service.MicroBatcher(self.models["lstm"], window=0.05, max_batch=8).start()
+        try:
+            preds = await asyncio.gather(*[batcher.predict(self.windows[i:i + 3]) for i in range(0, 30, 3)])
+            with self.assertRaises(ValueError):
+                await batcher.predict(self.Xq)
+        finally:
+            await batcher.stop()
+        np.testing.assert_allclose(np.concatenate(preds), self.models["lstm"].predict(self.windows), rtol=1e-5)
+        self.assertEqual(batcher.metrics()["batches"], 5)
+
+    async def test_http(self):
+        forecast = service.ForecastService(self.models, window=0.02)
+        await forecast.start(port=0)
+        try:
+            connections = [await asyncio.open_connection("127.0.0.1", forecast.port) for _ in range(4)]
+            replies = await asyncio.gather(*[request(r, w, "POST", "/predict/pca_wlr",
+                                                     {"inputs": self.Xq[i::4].tolist()})
+                                             for i, (r, w) in enumerate(connections)])
+            expected = self.models["pca_wlr"].predict(self.Xq)
+            for i, (status, reply) in enumerate(replies):
+                self.assertEqual(status, 200)
+                np.testing.assert_allclose(reply["predictions"], expected[i::4], rtol=1e-9)
+
+            reader, writer = connections[0]
+            status, reply = await request(reader, writer, "POST", "/predict/wlr", {"inputs": self.Xq[0].tolist()})
+            self.assertEqual(len(reply["predictions"]), 1)
+            self.assertEqual((await request(reader, writer, "POST", "/predict/wlr", {"inputs": [[1, 2]]}))[0], 400)
+            self.assertEqual((await request(reader, writer, "POST", "/predict/gbm", {"inputs": []}))[0], 404)
+            self.assertEqual((await request(reader, writer, "GET", "/models"))[1]["lstm"]["row_shape"], [5, 3])
+            status, metrics = await request(reader, writer, "GET", "/metrics")
+            self.assertEqual(metrics["models"]["pca_wlr"]["requests"], 4)
+            self.assertLess(metrics["models"]["pca_wlr"]["batches"], 4)
+            for _, writer in connections:
+                writer.close()
+        finally:
+            await forecast.stop()
+
+    async def test_unixSocket(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "forecast.sock")
+        forecast = service.ForecastService(self.models)
+        await forecast.start(path=path)
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            status, reply = await request(reader, writer, "POST", "/predict/lstm", {"inputs": self.windows.tolist()})
+            self.assertEqual(status, 200)
+            np.testing.assert_allclose(reply["predictions"], self.models["lstm"].predict(self.windows), rtol=1e-5)
+            self.assertEqual(await request(reader, writer, "GET", "/health"), (200, {"status": "ok"}))
+            writer.close()
+        finally:
+            await forecast.stop()
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
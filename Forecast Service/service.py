@@ -0,0 +1,383 @@
+"""Local forecast service for many sites at once.
+
+The fitted models stay in memory (the PCA projection, the WLR training set and
+its neighbour index, the LSTM weights) and are served over HTTP, on a TCP port
+or a Unix socket. Requests for the same model that arrive within ``window``
+seconds of each other (or until ``max_batch`` rows are waiting) are coalesced
+into one micro-batch: their rows are stacked, predicted by one vectorised call
+and the predictions handed back to each request. A job asking for hundreds of
+zip codes therefore pays the per-call overhead once per batch, not per site.
+
+    POST /predict/<model>   {"inputs": [row, ...]}  ->  {"predictions": [...]}
+    GET  /models            the served models and the shape of one input row
+    GET  /metrics           queue depth, batch sizes and latency of every model
+    GET  /health
+
+A row of the "wlr" and "pca_wlr" models is the 8 weather features of
+``weather_*.csv``; a row of the "lstm" model is a (lookback x 12) window of the
+chronological inputs. The WLR models are exact unless -l is given, which fits
+each query on its neighbours only (``predict_local``, within ``KERNEL_TOL`` of
+the kernel weight).
+
+A request with non-finite inputs is refused before it joins a batch. If a batch
+still fails, its requests are predicted one by one, so that only the ones at
+fault get an error.
+
+    python service.py [-p <port> | -u <unix socket path>] [-w <window ms>] [-b <max batch rows>] [-k <PCA dimensions>] [-l]
+"""
+import asyncio
+import collections
+import getopt
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for folder in ("Principal Components Analysis", "Weighted Linear Regression", "Recurrent Neural Network"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+import pca
+import predict
+import wlr
+
+PORT = 8642
+WINDOW = 0.005  # seconds a batch waits for more requests after its first one
+MAX_BATCH = 4096  # rows
+PCA_K = 6
+LATENCY_SAMPLES = 1024  # requests the latency percentiles are computed over
+MAX_BODY = 64 << 20
+
+
+class Model:
+    """A resident model: predict() maps a (rows x *shape) array to one prediction per row."""
+
+    def __init__(self, name, shape, predict_fn):
+        self.name = name
+        self.shape = tuple(shape)
+        self.predict = predict_fn
+
+
+def wlr_predict(model, tau, local=False):
+    """Exact WLR predictions, or with local, the truncated kernel of predict_local."""
+    if not local:
+        return lambda Xq: model.predict(Xq, tau)
+    model.build_index()
+    return lambda Xq: model.predict_local(Xq, tau)[0]
+
+
+def wlr_model(X, y, tau=wlr.BEST_TAU, name="wlr", local=False):
+    """Locally weighted regression on the training rows."""
+    return Model(name, (X.shape[1],), wlr_predict(wlr.WeightedLinearRegression(X, y), tau, local))
+
+
+def pca_wlr_model(X, y, projection, k=PCA_K, tau=wlr.BEST_TAU, name="pca_wlr", local=False):
+    """WLR on the first k principal components of the inputs."""
+    fn = wlr_predict(wlr.WeightedLinearRegression(projection.transform(X, k), y), tau, local)
+    return Model(name, (X.shape[1],), lambda Xq: fn(projection.transform(Xq, k)))
+
+
+def lstm_model(predictor, name="lstm"):
+    return Model(name, (predictor.lookback, len(predictor.min_val)), predictor.predict)
+
+
+def load_models(k=PCA_K, local=False):
+    """The models of the repository that have been trained (or can be fitted at start up)."""
+    X, y = wlr.import_data(os.path.join(wlr.DATASET_PATH, "weather_train.csv"))
+    projection = pca.PCA.load() if os.path.isfile(pca.MODEL_PATH) else pca.PCA().fit(X)
+    models = [wlr_model(X, y, local=local), pca_wlr_model(X, y, projection, k, local=local)]
+    if os.path.isfile(predict.MODEL_PATH + ".npz"):
+        models.append(lstm_model(predict.LstmPredictor.load()))
+    return {model.name: model for model in models}
+
+
+class MicroBatcher:
+    """Coalesces concurrent predict requests of one model into vectorised batches.
+
+    A batch starts with the first waiting request and takes every request that
+    arrives within window seconds, up to max_batch rows (a larger request makes
+    a batch on its own). One batch is predicted at a time, in a worker thread,
+    while the next one fills up. When the batched call raises, each request of
+    the batch is retried on its own.
+    """
+
+    def __init__(self, model, window=WINDOW, max_batch=MAX_BATCH):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = collections.deque()  # (rows, future, arrival time)
+        self.queued_rows = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_queue_rows = 0
+        self.batch_sizes = collections.Counter()  # rows per batch, by power of two bucket
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.predict_seconds = 0.0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def predict(self, X):
+        """Predictions for the rows of X (shaped rows x model.shape)."""
+        X = np.asarray(X, dtype="float64")
+        if X.shape[1:] != self.model.shape:
+            raise ValueError(f"{self.model.name} expects rows of shape {list(self.model.shape)}, "
+                             f"got {list(X.shape[1:])}")
+        if not np.isfinite(X).all():
+            raise ValueError(f"{self.model.name} inputs must be finite")
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((X, future, time.perf_counter()))
+        self.queued_rows += len(X)
+        self.max_queue_rows = max(self.max_queue_rows, self.queued_rows)
+        self.wakeup.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            deadline = loop.time() + self.window
+            while self.queued_rows < self.max_batch and loop.time() < deadline:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+            batch, rows = [], 0
+            while self.queue and (not batch or rows + len(self.queue[0][0]) <= self.max_batch):
+                item = self.queue.popleft()
+                batch.append(item)
+                rows += len(item[0])
+            self.queued_rows -= rows
+            await self._predict(loop, batch, rows)
+
+    async def _predict(self, loop, batch, rows):
+        X = batch[0][0] if len(batch) == 1 else np.concatenate([item[0] for item in batch])
+        tic = time.perf_counter()
+        try:
+            pred = await loop.run_in_executor(None, self.model.predict, X)
+            results, start = [], 0
+            for Xr, _, _ in batch:
+                results.append(pred[start:start + len(Xr)])
+                start += len(Xr)
+        except Exception as e:
+            # a single bad request must not fail the others
+            results = [e] if len(batch) == 1 else [await self._predict_alone(loop, item[0]) for item in batch]
+        done = time.perf_counter()
+        self.predict_seconds += done - tic
+        self.batches += 1
+        self.requests += len(batch)
+        self.rows += rows
+        self.batch_sizes[1 << max(rows - 1, 0).bit_length()] += 1
+        for (_, future, arrival), result in zip(batch, results):
+            if isinstance(result, Exception):
+                self.errors += 1
+                if not future.done():
+                    future.set_exception(result)
+                continue
+            if not future.done():
+                future.set_result(result)
+            self.latencies.append(done - arrival)
+
+    async def _predict_alone(self, loop, X):
+        try:
+            return await loop.run_in_executor(None, self.model.predict, X)
+        except Exception as e:
+            return e
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1000
+        return {"queue_depth": len(self.queue), "queued_rows": self.queued_rows, "max_queued_rows": self.max_queue_rows,
+                "requests": self.requests, "rows": self.rows, "batches": self.batches, "errors": self.errors,
+                "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+                "mean_batch_requests": self.requests / self.batches if self.batches else 0.0,
+                "batch_rows_histogram": {f"<={size}": n for size, n in sorted(self.batch_sizes.items())},
+                "predict_seconds": self.predict_seconds,
+                "latency_ms": {"p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                               "p99": float(np.percentile(latencies, 99)) if len(latencies) else None}}
+
+
+class ForecastService:
+    """HTTP front end of one MicroBatcher per model."""
+
+    def __init__(self, models, window=WINDOW, max_batch=MAX_BATCH):
+        self.models = models
+        self.window = window
+        self.max_batch = max_batch
+        self.batchers = {}
+        self.server = None
+        self.started = time.time()
+
+    async def start(self, port=None, host="127.0.0.1", path=None):
+        """Listen on the Unix socket path, or on host:port (port 0 picks a free one)."""
+        self.batchers = {name: MicroBatcher(model, self.window, self.max_batch).start()
+                         for name, model in self.models.items()}
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._connection, path=path)
+        else:
+            self.server = await asyncio.start_server(self._connection, host, PORT if port is None else port)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.stop()
+
+    def metrics(self):
+        return {"uptime_s": time.time() - self.started, "window_ms": self.window * 1000, "max_batch": self.max_batch,
+                "models": {name: batcher.metrics() for name, batcher in self.batchers.items()}}
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self.handle(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:  # malformed request
+            writer.write(response(400, {"error": str(e)}, False))
+        finally:
+            writer.close()
+
+    async def handle(self, method, target, body):
+        """(HTTP status, JSON payload) of a request."""
+        path = target.split("?", 1)[0].rstrip("/")
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if method == "GET" and path == "/models":
+            return 200, {name: {"row_shape": list(model.shape)} for name, model in self.models.items()}
+        if path.startswith("/predict/"):
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            name = path[len("/predict/"):]
+            if name not in self.batchers:
+                return 404, {"error": f"unknown model {name!r}", "models": sorted(self.batchers)}
+            try:
+                X = np.asarray(json.loads(body)["inputs"], dtype="float64")
+                if X.ndim == len(self.models[name].shape):
+                    X = X[None]  # a single row
+                pred = await self.batchers[name].predict(X)
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                return 500, {"error": f"{type(e).__name__}: {e}"}
+            return 200, {"predictions": np.asarray(pred, dtype="float64").tolist()}
+        return 404, {"error": f"no route for {method} {path}"}
+
+
+async def read_request(reader):
+    """(method, target, lower-cased headers, body) of the next HTTP/1.1 request, None at end of stream."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise ValueError(f"bad request line {line[:80]!r}")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError(f"body of {length} bytes is too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+async def serve(models, port=None, path=None, window=WINDOW, max_batch=MAX_BATCH):
+    service = ForecastService(models, window, max_batch)
+    await service.start(port, path=path)
+    print(f"Serving {', '.join(models)} on {path or f'http://127.0.0.1:{service.port}'} "
+          f"(window {window * 1000:.1f} ms, batches of up to {max_batch} rows)")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv):
+    instruction = (f"Usage: python {sys.argv[0]} [-p <port> | -u <unix socket path>] [-w <window ms>] "
+                   "[-b <max batch rows>] [-k <PCA dimensions>] [-l]")
+    try:
+        opts, args = getopt.getopt(argv, "hp:u:w:b:k:l")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    port, path, window, max_batch, k, local = PORT, None, WINDOW, MAX_BATCH, PCA_K, False
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-p":
+            port = int(arg)
+        elif opt == "-u":
+            path = arg
+        elif opt == "-w":
+            window = float(arg) / 1000
+        elif opt == "-b":
+            max_batch = int(arg)
+        elif opt == "-k":
+            k = int(arg)
+        elif opt == "-l":
+            local = True
+
+    start = time.time()
+    models = load_models(k, local)
+    print(f"Loaded {len(models)} models in {time.time() - start:.2f} s")
+    try:
+        asyncio.run(serve(models, port, path, window, max_batch))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import pca
+
+
+class PcaTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(500, 5)) @ rng.normal(size=(5, 5)) * [1, 10, 0.1, 3, 30] + [0, 5, 60, 29, 1]
+
+    def test_fit(self):
+        model = pca.PCA().fit(self.X)
+        X_norm = (self.X - self.X.mean(0)) / self.X.std(0)
+        Sig = X_norm.T @ X_norm / len(self.X)
+        np.testing.assert_allclose(Sig @ model.components, model.components * model.eigenvalues, atol=1e-10)
+        self.assertTrue((np.diff(np.abs(model.eigenvalues)) <= 0).all())
+        self.assertAlmostEqual(model.explained_variance_ratio().sum(), 1)
+
+    def test_partialFit(self):
+        model = pca.PCA().fit(self.X)
+        online = pca.PCA()
+        for batch in np.array_split(self.X, [1, 2, 50, 51, 300]):
+            online.partial_fit(batch)
+            self.assertEqual(online.components.shape, (5, 5))
+        np.testing.assert_allclose(online.mu, model.mu)
+        np.testing.assert_allclose(online.sigma, model.sigma)
+        np.testing.assert_allclose(online.eigenvalues, model.eigenvalues)
+        np.testing.assert_allclose(np.abs(online.components), np.abs(model.components), atol=1e-8)
+
+        streamed = pca.PCA().fit_batches(np.array_split(self.X, 9))
+        np.testing.assert_allclose(streamed.eigenvalues, model.eigenvalues)
+
+    def test_saveLoad(self):
+        model = pca.PCA().fit(self.X)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "model.npz")
+            model.save(path)
+            loaded = pca.PCA.load(path)
+        self.assertEqual(loaded.n_samples, len(self.X))
+        for k in range(1, 6):
+            np.testing.assert_array_equal(loaded.transform(self.X, k), model.transform(self.X, k))
+        np.testing.assert_allclose(model.transform(self.X, 2), self.X @ model.components[:, :2])
+
+    def test_transformBatches(self):
+        model = pca.PCA().fit(self.X)
+        whole = model.transform(self.X, 3, normalize=True)
+        batched = np.vstack(list(model.transform_batches(self.X, 3, normalize=True, batch_size=64)))
+        np.testing.assert_allclose(batched, whole)
+        batched = np.vstack(list(model.transform_batches(iter(np.array_split(self.X, 7)), 3, normalize=True)))
+        np.testing.assert_allclose(batched, whole)
+
+
+if __name__ == '__main__':
+    unittest.main()
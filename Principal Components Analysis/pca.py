@@ -0,0 +1,163 @@
+"""Principal Component Analysis.
+
+Python counterpart of ``pca.m``. The PCA*/ scripts refit mean, standard
+deviation, covariance and a full eigendecomposition every run, once per k.
+Here the decomposition is fitted once and saved with all its components to a
+``.npz`` artifact; any k from 1..n is then a slice of the stored components.
+
+The model only keeps the number of rows, the mean and the co-moment matrix of
+the data it has seen, so new hourly rows can be folded in with ``partial_fit``
+at a cost proportional to the new rows, without the full history in memory.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets", "hourly", "without_time-line")
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pca_model.npz")
+
+# Rows projected at a time by transform_batches
+BATCH_SIZE = 65536
+
+
+class PCA:
+    """Principal components of the normalised data, sorted by decreasing eigenvalue.
+
+    mu, sigma : mean and standard deviation (normalised by m) of each input
+    components : eigenvectors of the empirical covariance of the normalised data, one per column
+    eigenvalues : the matching eigenvalues
+    n_samples, comoment : number of rows seen and sum of the outer products of
+        their deviations from mu, from which the above are updated
+    """
+
+    def __init__(self, mu=None, sigma=None, components=None, eigenvalues=None, n_samples=0, comoment=None):
+        self.mu = mu
+        self.sigma = sigma
+        self.components = components
+        self.eigenvalues = eigenvalues
+        self.n_samples = n_samples
+        self.comoment = comoment
+
+    def fit(self, X):
+        self.n_samples = 0
+        self.comoment = None
+        return self.partial_fit(X)
+
+    def fit_batches(self, batches):
+        """Fit on an iterable of row batches, one batch in memory at a time."""
+        self.n_samples = 0
+        self.comoment = None
+        for batch in batches:
+            self.partial_fit(batch, update=False)
+        self._update_components()
+        return self
+
+    def partial_fit(self, X, update=True):
+        """Fold a batch of new rows into the model.
+
+        The mean and co-moment of the batch are merged with the running ones
+        (Chan et al. pairwise update). With update=False the components are left
+        as they are until the next update, to save the eigendecomposition when
+        several batches arrive at once.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype="float64"))
+        m = X.shape[0]
+        if m == 0:
+            return self
+        batch_mu = X.mean(axis=0)
+        deviation = X - batch_mu
+        batch_comoment = deviation.T @ deviation
+        if self.n_samples == 0:
+            self.mu = batch_mu
+            self.comoment = batch_comoment
+        else:
+            total = self.n_samples + m
+            delta = batch_mu - self.mu
+            self.mu = self.mu + delta * (m / total)
+            self.comoment = self.comoment + batch_comoment + np.outer(delta, delta) * (self.n_samples * m / total)
+        self.n_samples += m
+        if update:
+            self._update_components()
+        return self
+
+    def _update_components(self):
+        # Normalize the data: standard deviation normalised by m, as std(X,1)
+        self.sigma = np.sqrt(np.diag(self.comoment) / self.n_samples)
+        s = np.where(self.sigma > 0, self.sigma, 1.0)
+
+        # Empirical covariance matrix of the normalised data
+        Sig = self.comoment / self.n_samples / np.outer(s, s)
+
+        # Compute the eigenvectors of Sig, sorted by decreasing eigenvalue
+        D, V = np.linalg.eigh(Sig)
+        I = np.argsort(-np.abs(D), kind="stable")
+        self.eigenvalues = D[I]
+        self.components = V[:, I]
+
+    def save(self, path=MODEL_PATH):
+        np.savez(path, mu=self.mu, sigma=self.sigma, components=self.components, eigenvalues=self.eigenvalues,
+                 n_samples=self.n_samples, comoment=self.comoment)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path) as model:
+            return cls(model["mu"], model["sigma"], model["components"], model["eigenvalues"],
+                       int(model["n_samples"]), model["comoment"])
+
+    def explained_variance_ratio(self):
+        eig = np.abs(self.eigenvalues)
+        return eig / eig.sum()
+
+    def transform(self, X, k, normalize=False):
+        """k-dimensional representation of X.
+
+        Like pca.m, the raw inputs are projected on the components; pass
+        normalize=True to project the normalised inputs instead.
+        """
+        X = np.asarray(X)
+        if normalize:
+            X = (X - self.mu) / self.sigma
+        return X @ self.components[:, :k]
+
+    def transform_batches(self, X, k, normalize=False, batch_size=BATCH_SIZE):
+        """Project X batch by batch.
+
+        X is either an array (e.g. a np.memmap) read batch_size rows at a time,
+        or any iterable of row batches.
+        """
+        batches = X
+        if hasattr(X, "shape"):
+            batches = (X[start:start + batch_size] for start in range(0, X.shape[0], batch_size))
+        for batch in batches:
+            yield self.transform(batch, k, normalize)
+
+
+def main():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Weighted Linear Regression"))
+    import wlr
+
+    XTrain, yTrain = wlr.import_data(os.path.join(DATASET_PATH, "weather_train.csv"))
+    XDev, yDev = wlr.import_data(os.path.join(DATASET_PATH, "weather_dev.csv"))
+
+    # Apply PCA over the whole data set, once
+    if os.path.isfile(MODEL_PATH):
+        model = PCA.load(MODEL_PATH)
+    else:
+        XTest, _ = wlr.import_data(os.path.join(DATASET_PATH, "weather_test.csv"))
+        model = PCA().fit(np.vstack([XTrain, XDev, XTest]))
+        model.save(MODEL_PATH)
+
+    # Compare the dimensions of the compressed data set
+    for k in range(1, XTrain.shape[1] + 1):
+        start = time.time()
+        devError, _ = wlr.WeightedLinearRegression(model.transform(XTrain, k), yTrain).sweep(
+            model.transform(XDev, k), yDev, wlr.TAU)
+        best = int(np.argmin(devError))
+        print(f"k = {k}: best tau = {wlr.TAU[best]}, dev LMS error {devError[best]:.2f} "
+              f"({time.time() - start:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+
+try:
+    import boosting
+except ImportError:  # scikit-learn is not installed
+    boosting = None
+
+
+@unittest.skipIf(boosting is None, "scikit-learn is not installed")
+class BoostingTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.uniform(0, 1, (3000, 8))
+        self.y = 1000 * np.clip(self.X[:, 0] - 0.3, 0, None) * (1 - self.X[:, 1]) + rng.normal(0, 20, 3000)
+        self.y[rng.random(3000) < 0.02] += 5000  # outliers
+
+    def test_earlyStopping(self):
+        train, dev = slice(0, 2400), slice(2400, None)
+        model, history = boosting.fit_boosting(self.X[train], self.y[train], (self.X[dev], self.y[dev]),
+                                               learning_rate=0.5, max_trees=400, step=5, patience=4, threads=2)
+        errors = np.array([e for _, e in history])
+        self.assertEqual(model.n_iter_, int(np.argmin(errors)) + 1)
+        self.assertLess(len(history), 400)
+        self.assertGreaterEqual(len(history) - model.n_iter_, 4 * 5)  # stopped after 4 steps without improvement
+        self.assertAlmostEqual(boosting.deviance("laplace", self.y[dev], model.predict(self.X[dev])), errors.min())
+
+        # the kept dev predictions and the trimmed model are those of plain fits
+        full = boosting.boosting_model(learning_rate=0.5, trees=len(history)).fit(self.X[train], self.y[train])
+        staged = [boosting.deviance("laplace", self.y[dev], pred) for pred in full.staged_predict(self.X[dev])]
+        np.testing.assert_allclose(errors, staged, rtol=1e-12)
+        best = boosting.boosting_model(learning_rate=0.5, trees=model.n_iter_).fit(self.X[train], self.y[train])
+        np.testing.assert_array_equal(model.predict(self.X[dev]), best.predict(self.X[dev]))
+
+    def test_publicFallback(self):
+        train, dev = slice(0, 2400), slice(2400, None)
+        args = self.X[train], self.y[train], (self.X[dev], self.y[dev])
+        kwargs = dict(learning_rate=0.5, max_trees=400, step=5, patience=4, threads=2)
+        model, history = boosting.fit_boosting(*args, **kwargs)
+        has_internals, boosting.has_internals = boosting.has_internals, lambda model: False
+        try:
+            public, public_history = boosting.fit_boosting(*args, **kwargs)
+        finally:
+            boosting.has_internals = has_internals
+        np.testing.assert_allclose([e for _, e in public_history], [e for _, e in history], rtol=1e-12)
+        np.testing.assert_array_equal(public.predict(self.X[dev]), model.predict(self.X[dev]))
+
+    def test_laplace(self):
+        clean = self.y < 3000
+        errors = {}
+        for family in ("laplace", "gaussian"):
+            model, _ = boosting.fit_boosting(self.X, self.y, family=family, learning_rate=0.2, max_trees=100)
+            errors[family] = np.median(np.abs(model.predict(self.X[clean]) - self.y[clean]))
+        self.assertLess(errors["laplace"], errors["gaussian"])
+
+    def test_forest(self):
+        model = boosting.fit_forest(self.X, self.y, trees=20, bag_fraction=0.5, threads=2)
+        self.assertEqual(len(model.estimators_), 20)
+        self.assertEqual(model.max_samples, 0.5)
+        self.assertEqual(int(np.argmax(model.feature_importances_)), 0)
+
+    def test_deviance(self):
+        y, pred = np.array([0.0, 2.0, 4.0]), np.array([1.0, 2.0, 2.0])
+        self.assertEqual(boosting.deviance("laplace", y, pred), 1.0)
+        self.assertAlmostEqual(boosting.deviance("gaussian", y, pred), 5 / 3)
+        with self.assertRaises(ValueError):
+            boosting.deviance("bernoulli", y, pred)
+
+
+if __name__ == "__main__":
+    unittest.main()
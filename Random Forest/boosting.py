@@ -0,0 +1,228 @@
+"""Boosted trees and random forests on the hourly weather sets.
+
+Python counterpart of the ``gbm.step`` calls of ``solar-1.R``, on the arrays of
+``Datasets/loader.py`` (the same ``weather_{train,dev,test}.csv`` files and the
+8 weather features, ``gbm.x = 5:12``). The boosted trees are those of
+scikit-learn's ``HistGradientBoostingRegressor``: the features are binned into
+at most 255 histogram bins once, and the split search runs over the bins on
+every core. ``family`` keeps the gbm names: "laplace" fits the absolute error,
+"gaussian" the squared error, "poisson" the Poisson deviance. A gbm tree
+complexity of k (k splits) is a tree of k + 1 leaves.
+
+Instead of gbm.step's cross validation, trees are added ``step`` at a time and
+scored on the dev set; training stops once the dev error has not improved for
+``patience`` steps and the model is cut back to the best number of trees. The
+dev predictions are kept between steps, so that each step only runs the dev set
+through its new trees. Both rely on internals of scikit-learn's boosting; with
+a version that lacks them, every step runs ``staged_predict`` over all the
+trees and the best number of trees is fitted again.
+
+gbm's bag fraction (fitting each tree on a random share of the rows) has no
+counterpart in the histogram boosting; the random forest takes it as the share
+of rows each tree is grown on.
+
+    python boosting.py [-m boost|forest] [-f <family>] [-l <learning rate>] [-c <tree complexity>]
+                       [-n <max trees>] [-b <bag fraction>] [-j <threads>] [-d <dataset directory>]
+"""
+import getopt
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from threadpoolctl import threadpool_limits
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets"))
+import loader
+
+DATASET_PATH = os.path.join(loader.DATASET_PATH, "hourly")
+FEATURES = loader.WEATHER_FEATURES
+TARGET = "Solar energy"
+# gbm family -> loss of HistGradientBoostingRegressor
+LOSSES = {"laplace": "absolute_error", "gaussian": "squared_error", "poisson": "poisson"}
+# gbm.step settings of solar-1.R
+FAMILY = "laplace"
+TREE_COMPLEXITY = 15
+LEARNING_RATE = 0.5
+BAG_FRACTION = 0.65
+MAX_TREES = 2000
+FOREST_TREES = 500
+STEP = 10  # trees added between two scores on the dev set
+PATIENCE = 10  # steps without improvement of the dev error before stopping
+MAX_BINS = 255
+
+
+def import_data(file_path):
+    """Weather features and solar energy of a weather_*.csv file."""
+    ds = loader.load(file_path)
+    return np.asarray(ds[FEATURES]), np.asarray(ds[TARGET])
+
+
+def import_splits(dataset_path=DATASET_PATH):
+    return [import_data(os.path.join(dataset_path, f"weather_{name}.csv")) for name in ("train", "dev", "test")]
+
+
+def deviance(family, y, pred):
+    """Mean loss of the family, as gbm's calc.deviance(calc.mean=TRUE)."""
+    y, pred = np.asarray(y, dtype="float64"), np.asarray(pred, dtype="float64")
+    if family == "laplace":
+        return np.mean(np.abs(y - pred))
+    if family == "gaussian":
+        return np.mean((y - pred) ** 2)
+    if family == "poisson":
+        pred = np.maximum(pred, 1e-12)
+        return 2 * np.mean(np.where(y > 0, y * np.log(np.maximum(y, 1e-12) / pred), 0) - (y - pred))
+    raise ValueError(f"unknown family {family!r}")
+
+
+def boosting_model(family=FAMILY, tree_complexity=TREE_COMPLEXITY, learning_rate=LEARNING_RATE, trees=MAX_TREES,
+                   max_bins=MAX_BINS, seed=0, **kwargs):
+    return HistGradientBoostingRegressor(loss=LOSSES[family], learning_rate=learning_rate, max_iter=trees,
+                                         max_leaf_nodes=tree_complexity + 1, max_depth=None, max_bins=max_bins,
+                                         early_stopping=False, random_state=seed, **kwargs)
+
+
+def has_internals(model):
+    """Whether the fitted model has the scikit-learn internals used by added_raw_predictions and trim_trees."""
+    return (isinstance(getattr(model, "_predictors", None), list) and hasattr(model, "_baseline_prediction")
+            and hasattr(model, "_staged_raw_predict") and hasattr(getattr(model, "_loss", None), "link")
+            and isinstance(getattr(type(model), "n_iter_", None), property))
+
+
+def added_raw_predictions(model, X, start):
+    """Raw predictions of X by each tree of the model from the start-th on, without the baseline.
+
+    Runs the boosting's own staged prediction over those trees only.
+    """
+    predictors, baseline = model._predictors, model._baseline_prediction
+    model._predictors, model._baseline_prediction = predictors[start:], np.zeros_like(baseline)
+    try:
+        for raw in model._staged_raw_predict(X):
+            yield raw.ravel()
+    finally:
+        model._predictors, model._baseline_prediction = predictors, baseline
+
+
+def trim_trees(model, trees):
+    """Keep the first trees of a fitted boosting model (the later ones only depend on them)."""
+    model._predictors = model._predictors[:trees]
+    model.set_params(max_iter=trees)
+    return model
+
+
+def fit_boosting(X, y, dev=None, family=FAMILY, tree_complexity=TREE_COMPLEXITY, learning_rate=LEARNING_RATE,
+                 max_trees=MAX_TREES, step=STEP, patience=PATIENCE, max_bins=MAX_BINS, threads=None, seed=0):
+    """Boosted trees fitted on (X, y), with early stopping on dev = (X_dev, y_dev) when given.
+
+    Returns the model and the dev error after each number of trees, as a list
+    of (trees, error).
+    """
+    with threadpool_limits(threads):
+        if dev is None:
+            return boosting_model(family, tree_complexity, learning_rate, max_trees, max_bins, seed).fit(X, y), []
+        X_dev, y_dev = dev
+        model = boosting_model(family, tree_complexity, learning_rate, step, max_bins, seed, warm_start=True)
+        history, best, best_trees, waited = [], np.inf, 0, 0
+        raw, incremental = None, None
+        while True:
+            model.fit(X, y)
+            if incremental is None:
+                incremental = has_internals(model)
+            if incremental:
+                # from the raw dev predictions of the last step
+                if raw is None:
+                    raw = np.zeros(len(X_dev)) + model._baseline_prediction.ravel()
+                staged = []
+                for added in added_raw_predictions(model, X_dev, len(history)):
+                    staged.append(model._loss.link.inverse(raw + added))
+                raw = raw + added
+            else:
+                staged = itertools.islice(model.staged_predict(X_dev), len(history), None)
+            # score every number of trees added by this step
+            for pred in staged:
+                history.append((len(history) + 1, deviance(family, y_dev, pred)))
+                if history[-1][1] < best:
+                    best, best_trees = history[-1][1], len(history)
+            waited = (model.n_iter_ - best_trees) // step
+            if waited >= patience or model.n_iter_ >= max_trees:
+                break
+            model.set_params(max_iter=min(model.n_iter_ + step, max_trees))
+        if best_trees < model.n_iter_ and incremental:
+            trim_trees(model, best_trees)
+        elif best_trees < model.n_iter_:
+            # the trees are deterministic: refitting the best number gives the same first trees
+            model = boosting_model(family, tree_complexity, learning_rate, best_trees, max_bins, seed).fit(X, y)
+    return model, history
+
+
+def fit_forest(X, y, trees=FOREST_TREES, bag_fraction=BAG_FRACTION, min_samples_leaf=5, max_features=1 / 3, threads=-1,
+               seed=0):
+    """Random forest whose trees are each grown on a bag_fraction share of the rows, on threads cores (-1: all)."""
+    model = RandomForestRegressor(n_estimators=trees, max_samples=bag_fraction, min_samples_leaf=min_samples_leaf,
+                                  max_features=max_features, n_jobs=threads, random_state=seed)
+    return model.fit(X, y)
+
+
+def report(name, family, y, pred):
+    """The errors of solar-1.R: the deviance and, on the hours with output, MAPE and squared error."""
+    day = y > 0
+    print(f"{name}: deviance {deviance(family, y, pred):.2f}, MSE {np.mean((y - pred) ** 2):.0f}, "
+          f"median SE {np.median((y - pred) ** 2):.0f}; daylight hours: "
+          f"MAPE {np.mean(np.abs((y[day] - pred[day]) / y[day])):.3f}, "
+          f"correlation {np.corrcoef(y[day], pred[day])[0, 1]:.3f}")
+
+
+def main(argv):
+    instruction = (f"Usage: python {sys.argv[0]} [-m boost|forest] [-f <family>] [-l <learning rate>] "
+                   "[-c <tree complexity>] [-n <max trees>] [-b <bag fraction>] [-j <threads>] [-d <dataset directory>]")
+    try:
+        opts, args = getopt.getopt(argv, "hm:f:l:c:n:b:j:d:")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    method, family, learning_rate, tree_complexity, max_trees, bag_fraction, threads, dataset_path = \
+        "boost", FAMILY, LEARNING_RATE, TREE_COMPLEXITY, None, BAG_FRACTION, None, DATASET_PATH
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-m":
+            method = arg
+        elif opt == "-f":
+            family = arg
+        elif opt == "-l":
+            learning_rate = float(arg)
+        elif opt == "-c":
+            tree_complexity = int(arg)
+        elif opt == "-n":
+            max_trees = int(arg)
+        elif opt == "-b":
+            bag_fraction = float(arg)
+        elif opt == "-j":
+            threads = int(arg)
+        elif opt == "-d":
+            dataset_path = arg
+    if method not in ("boost", "forest") or family not in LOSSES:
+        print(instruction)
+        sys.exit(2)
+
+    (X_train, y_train), (X_dev, y_dev), (X_test, y_test) = import_splits(dataset_path)
+    start = time.time()
+    if method == "boost":
+        model, history = fit_boosting(X_train, y_train, (X_dev, y_dev), family, tree_complexity, learning_rate,
+                                      max_trees or MAX_TREES, threads=threads)
+        print(f"{model.n_iter_} trees (best of {len(history)} scored on the dev set) in {time.time() - start:.2f} s")
+    else:
+        model = fit_forest(X_train, y_train, max_trees or FOREST_TREES, bag_fraction, threads=threads or -1)
+        print(f"{len(model.estimators_)} trees in {time.time() - start:.2f} s")
+        for name, importance in sorted(zip(FEATURES, model.feature_importances_), key=lambda item: -item[1]):
+            print(f"  {name}: {100 * importance:.1f}%")
+    report("dev", family, y_dev, model.predict(X_dev))
+    report("test", family, y_test, model.predict(X_test))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
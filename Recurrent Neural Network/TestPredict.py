@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import predict
+
+
+def reference_lstm(x, kernel, recurrent_kernel, bias):
+    """One sequence, one step at a time."""
+    units = recurrent_kernel.shape[0]
+    h, c, hs = np.zeros(units), np.zeros(units), []
+    for xt in x:
+        z = xt @ kernel + h @ recurrent_kernel + bias
+        i, f, g, o = (z[k * units:(k + 1) * units] for k in range(4))
+        c = 1 / (1 + np.exp(-f)) * c + 1 / (1 + np.exp(-i)) * np.tanh(g)
+        h = 1 / (1 + np.exp(-o)) * np.tanh(c)
+        hs.append(h)
+    return np.array(hs)
+
+
+class PredictTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.weights = [(rng.normal(size=(3, 16)) * 0.5, rng.normal(size=(4, 16)) * 0.5, rng.normal(size=16) * 0.1),
+                        (rng.normal(size=(4, 8)) * 0.5, rng.normal(size=(2, 8)) * 0.5, rng.normal(size=8) * 0.1)]
+        self.dense = (rng.normal(size=(2, 1)), np.array([0.3]))
+        self.min_val, self.max_val = np.array([0, -5, 10.]), np.array([24, 5, 30.])
+        self.X = rng.uniform(self.min_val, self.max_val, size=(7, 6, 3))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "model")
+        arrays = {"min_val": self.min_val, "max_val": self.max_val, "lookback": 6,
+                  "2/kernel": self.dense[0], "2/bias": self.dense[1], "2/activation": "relu"}
+        for i, (k, rk, b) in enumerate(self.weights):
+            arrays.update({f"{i}/kernel": k, f"{i}/recurrent_kernel": rk, f"{i}/bias": b,
+                           f"{i}/return_sequences": i == 0})
+        np.savez(self.path + ".npz", layers=np.array(["LSTM", "LSTM", "Dense"]), **arrays)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_predict(self):
+        predictor = predict.LstmPredictor.load(self.path)
+        self.assertEqual(predictor.lookback, 6)
+        expected = []
+        for x in (self.X - self.min_val) / (self.max_val - self.min_val):
+            for kernel, recurrent_kernel, bias in self.weights:
+                x = reference_lstm(x, kernel, recurrent_kernel, bias)
+            expected.append(max(x[-1] @ self.dense[0][:, 0] + self.dense[1][0], 0))
+        np.testing.assert_allclose(predictor.predict(self.X), expected, rtol=1e-4, atol=1e-5)
+
+    def test_latency(self):
+        p50, p99 = predict.latency(predict.LstmPredictor.load(self.path), self.X, batch_size=2, repeats=3)
+        self.assertLessEqual(p50, p99)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+import windows
+
+
+class WindowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.X = np.arange(40, dtype="float32").reshape(20, 2)
+        self.y = np.arange(20, dtype="float32") * 10
+
+    def test_makeWindows(self):
+        Xw, yw = windows.make_windows(self.X, self.y, lookback=4, horizon=2, stride=3)
+        self.assertTrue(np.shares_memory(Xw, self.X))
+        self.assertEqual(Xw.shape, (5, 4, 2))
+        self.assertEqual(len(yw), 5)
+        for i in range(len(Xw)):
+            np.testing.assert_array_equal(Xw[i], self.X[3 * i:3 * i + 4])
+            self.assertEqual(yw[i], self.y[3 * i + 3 + 2])
+
+        Xw, yw = windows.make_windows(self.X, self.y, lookback=5)
+        self.assertEqual(len(Xw), 16)
+        np.testing.assert_array_equal(yw, self.y[4:])
+        with self.assertRaises(ValueError):
+            windows.make_windows(self.X, self.y, lookback=20, horizon=1)
+
+    def test_batches(self):
+        Xw, yw = windows.make_windows(self.X, self.y, lookback=3)
+        batches = list(windows.window_batches(Xw, yw, batch_size=5))
+        self.assertEqual(len(batches), windows.steps_per_epoch(Xw, 5))
+        np.testing.assert_array_equal(np.concatenate([b[1] for b in batches]), yw)
+        shuffled = list(windows.window_batches(Xw, yw, batch_size=5, shuffle=True, seed=0))
+        np.testing.assert_array_equal(np.sort(np.concatenate([b[1] for b in shuffled])), yw)
+        for Xb, yb in shuffled:
+            np.testing.assert_array_equal(Xb[:, -1, 0], (yb / 10) * 2)
+
+    def test_indices(self):
+        Xw, yw = windows.make_windows(self.X, self.y, lookback=3)
+        fold = np.arange(4, 15)
+        for shuffle in (False, True):
+            batches = list(windows.window_batches(Xw, yw, batch_size=4, shuffle=shuffle, indices=fold))
+            self.assertEqual(len(batches), windows.steps_per_epoch(fold, 4))
+            np.testing.assert_array_equal(np.sort(np.concatenate([b[1] for b in batches])), yw[fold])
+
+    def test_gappedFolds(self):
+        Xw, _ = windows.make_windows(self.X, self.y, lookback=4, horizon=1, stride=2)
+        folds = list(windows.gapped_folds(len(Xw), 3, lookback=4, horizon=1, stride=2))
+        self.assertEqual([len(test) for _, test in folds], [3, 3, 2])
+        np.testing.assert_array_equal(np.concatenate([test for _, test in folds]), np.arange(len(Xw)))
+        for train, test in folds:
+            self.assertTrue(len(train))
+            for i in train:
+                rows = set(range(2 * i, 2 * i + 4 + 1))  # window and target rows
+                for j in test:
+                    self.assertFalse(rows & set(range(2 * j, 2 * j + 4 + 1)))
+        np.testing.assert_array_equal(folds[0][0], [5, 6, 7])
+
+    def test_chronologicalSplit(self):
+        self.assertEqual(windows.chronological_split(100), [(0, 80), (80, 90), (90, 100)])
+
+
+if __name__ == '__main__':
+    unittest.main()
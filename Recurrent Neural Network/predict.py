@@ -0,0 +1,137 @@
+"""Batch predictor for the LSTM exported by rnn.py.
+
+Loads the ``.npz`` artifact written by ``rnn.export_model`` (layer weights and
+input min/max) and runs the forward pass in NumPy, so an hourly forecast job
+pays neither the Keras import nor a graph build. The input projection of every
+time step is computed in one matrix product; only the recurrence is a loop over
+the lookback.
+
+    python predict.py [-m <model path>] [-b <batch size>] [-r <repeats>]
+scores the test windows and reports the p50/p99 latency per batch.
+"""
+import os
+import sys
+import time
+import getopt
+
+import numpy as np
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lstm_model")
+
+
+def sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": sigmoid,
+    "tanh": np.tanh,
+}
+
+
+def lstm(X, kernel, recurrent_kernel, bias, return_sequences):
+    """Keras LSTM layer (gates i, f, c, o; tanh and sigmoid activations)."""
+    batch, steps, _ = X.shape
+    units = recurrent_kernel.shape[0]
+    Z = (X.reshape(batch * steps, -1) @ kernel + bias).reshape(batch, steps, 4 * units)
+    h = np.zeros((batch, units), dtype=X.dtype)
+    c = np.zeros((batch, units), dtype=X.dtype)
+    out = np.empty((batch, steps, units), dtype=X.dtype) if return_sequences else None
+    for t in range(steps):
+        z = Z[:, t] + h @ recurrent_kernel
+        i = sigmoid(z[:, :units])
+        f = sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = sigmoid(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        if return_sequences:
+            out[:, t] = h
+    return out if return_sequences else h
+
+
+class LstmPredictor:
+    """Forward pass of an exported model; inputs are raw (batch x lookback x features) windows."""
+
+    def __init__(self, layers, min_val, max_val, lookback):
+        self.layers = layers
+        self.min_val = min_val
+        self.max_val = max_val
+        self.lookback = lookback
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path + ".npz") as artifact:
+            layers = []
+            for i, kind in enumerate(artifact["layers"]):
+                params = {key.split("/", 1)[1]: artifact[key][()] for key in artifact.files if key.startswith(f"{i}/")}
+                layers.append((str(kind), params))
+            return cls(layers, artifact["min_val"], artifact["max_val"], int(artifact["lookback"]))
+
+    def predict(self, X):
+        """Predicted energy for each window."""
+        out = ((np.asarray(X, dtype="float32") - self.min_val) / (self.max_val - self.min_val)).astype("float32")
+        for kind, params in self.layers:
+            if kind == "LSTM":
+                out = lstm(out, params["kernel"], params["recurrent_kernel"], params["bias"],
+                           bool(params["return_sequences"]))
+            else:
+                out = ACTIVATIONS[str(params["activation"])](out @ params["kernel"] + params["bias"])
+        return out[:, 0]
+
+
+def latency(predictor, Xw, batch_size=256, repeats=20):
+    """Median and 99th percentile time in milliseconds to score one batch of windows."""
+    times = []
+    for r in range(repeats):
+        for start in range(0, len(Xw), batch_size):
+            batch = Xw[start:start + batch_size]
+            tic = time.perf_counter()
+            predictor.predict(batch)
+            times.append(time.perf_counter() - tic)
+    times = np.array(times) * 1000
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+
+def main(argv):
+    instruction = f"Usage: python {sys.argv[0]} -m <model path> -b <batch size> -r <repeats>"
+    try:
+        opts, args = getopt.getopt(argv, "hm:b:r:")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    model_path, batch_size, repeats = MODEL_PATH, 256, 20
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-m":
+            model_path = arg
+        elif opt == "-b":
+            batch_size = int(arg)
+        elif opt == "-r":
+            repeats = int(arg)
+
+    tic = time.perf_counter()
+    predictor = LstmPredictor.load(model_path)
+    print(f"Loaded {model_path}.npz in {(time.perf_counter() - tic) * 1000:.1f} ms")
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets"))
+    import loader
+    import windows
+    data = loader.load(os.path.join("hourly", "with_night-hours",
+                                    "hourly_w-night_weather-dataset_chronological-order_w-night.xlsx"))[loader.COLUMNS[13]]
+    start, stop = windows.chronological_split(len(data))[2]
+    Xw, Yw = windows.make_windows(data[start:stop, :-1], data[start:stop, -1], predictor.lookback)
+
+    pred = predictor.predict(Xw)
+    print(f"Test MSE: {np.mean((pred - Yw) ** 2):.2f} over {len(Xw)} windows")
+    p50, p99 = latency(predictor, Xw, batch_size, repeats)
+    print(f"Batch of {batch_size}: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,19 +1,63 @@
 import os
+import sys
+import time
+import getopt
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from keras.models import Sequential
+from keras.models import Sequential, load_model as load_keras_model
 from keras.layers import Dense, Dropout, LSTM
 from keras.optimizers import Adam
-from sklearn.model_selection import KFold
+from keras.callbacks import Callback, EarlyStopping
 
-DATASET_PATH = "../Datasets/hourly/"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Datasets"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data Processing",
+                                "getWeatherDataStanford"))
+import loader
+import windows
+import instrument
+
+DATASET_PATH = os.path.join(loader.DATASET_PATH, "hourly")
+CHRONOLOGICAL_PATH = os.path.join(DATASET_PATH, "with_night-hours",
+                                  "hourly_w-night_weather-dataset_chronological-order_w-night.xlsx")
+LOOKBACK = 24  # hours of weather history per sequence
+HORIZON = 0    # predict the energy of the last hour of the sequence
+STRIDE = 1
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lstm_model")
+# (epochs, batch size, learning rate) stages: small batches first, then larger
+# batches with a proportionally larger step to keep the BLAS kernels busy
+STAGES = [(20, 64, 1e-3), (80, 256, 2e-3)]
+PATIENCE = 10
+# environment variables read by the BLAS/OpenMP and TensorFlow thread pools
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                    "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS")
 
 def normalize_data(data, min_val, max_val):
     return (data - min_val) / (max_val - min_val)
 
 def import_data(file_path):
-    df = pd.read_csv(file_path, sep=";", header=None)
-    return df.values.astype("float32")
+    return loader.load(file_path).data
+
+def import_series():
+    """Inputs and outputs of the chronological hourly data, in the weather_*.csv column order.
+
+    The inputs are scaled to [0, 1] with the min/max of the training split,
+    which are returned alongside so that they can be shipped with the model.
+    """
+    data = loader.load(CHRONOLOGICAL_PATH)[loader.COLUMNS[13]]
+    X, Y = data[:, :-1], data[:, -1]
+    start, stop = windows.chronological_split(len(X))[0]
+    min_val, max_val = X[start:stop].min(axis=0), X[start:stop].max(axis=0)
+    max_val = np.where(max_val > min_val, max_val, min_val + 1)  # constant columns
+    return normalize_data(X, min_val, max_val), Y, (min_val, max_val)
+
+def import_sequences(lookback=LOOKBACK, horizon=HORIZON, stride=STRIDE):
+    """Train, dev and test windows over the chronological hourly data, split in time, and the input min/max."""
+    X, Y, stats = import_series()
+    splits = [windows.make_windows(X[start:stop], Y[start:stop], lookback, horizon, stride)
+              for start, stop in windows.chronological_split(len(X))]
+    return splits, stats
 
 def build_lstm_model(input_shape, optimizer="adam"):
     model = Sequential([
@@ -25,23 +69,237 @@ def build_lstm_model(input_shape, optimizer="adam"):
     model.compile(loss="mean_squared_error", optimizer=optimizer)
     return model
 
-def train_and_evaluate(X_train, Y_train, X_test, Y_test, model):
-    model.fit(X_train, Y_train, epochs=100, batch_size=16, verbose=1)
+def export_model(model, stats, path=MODEL_PATH):
+    """Save the trained network and its normalisation statistics.
+
+    path.keras holds the Keras model (to resume training), path.npz the layer
+    weights and min/max read by predict.py, which runs without Keras.
+    """
+    model.save(path + ".keras")
+    arrays = {"min_val": stats[0], "max_val": stats[1], "lookback": model.input_shape[1]}
+    kinds = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "LSTM":
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            arrays.update({f"{len(kinds)}/kernel": kernel, f"{len(kinds)}/recurrent_kernel": recurrent_kernel,
+                           f"{len(kinds)}/bias": bias, f"{len(kinds)}/return_sequences": layer.return_sequences})
+        elif kind == "Dense":
+            kernel, bias = layer.get_weights()
+            arrays.update({f"{len(kinds)}/kernel": kernel, f"{len(kinds)}/bias": bias,
+                           f"{len(kinds)}/activation": layer.activation.__name__})
+        elif kind == "Dropout":
+            continue  # inactive at inference
+        else:
+            raise ValueError(f"Cannot export layer {layer.name} of type {kind}")
+        kinds.append(kind)
+    np.savez(path + ".npz", layers=np.array(kinds), **arrays)
+
+def load_model(path=MODEL_PATH):
+    """The Keras model saved by export_model and its (min_val, max_val)."""
+    with np.load(path + ".npz") as artifact:
+        stats = (artifact["min_val"], artifact["max_val"])
+    return load_keras_model(path + ".keras"), stats
+
+class TrainingConfig:
+    """How a model is fitted.
+
+    stages : list of (epochs, batch_size, learning_rate), run in order
+    patience : epochs without improvement of the dev loss before a stage stops;
+        the weights of the best dev epoch are restored at the end
+    min_delta : smallest decrease of the dev loss that counts as an improvement
+    max_epochs : cap on the total number of epochs over all stages
+    """
+
+    def __init__(self, stages=STAGES, patience=PATIENCE, min_delta=0.0, max_epochs=None, verbose=1):
+        self.stages = [tuple(stage) for stage in stages]
+        self.patience = patience
+        self.min_delta = min_delta
+        self.max_epochs = max_epochs
+        self.verbose = verbose
+
+class ThroughputLogger(Callback):
+    """Records wall-clock time and training samples/sec of every epoch."""
+
+    def __init__(self, samples, verbose=1):
+        super().__init__()
+        self.samples = samples
+        self.verbose = verbose
+        self.records = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.span = instrument.span("lstm.epoch", epoch=epoch + 1, samples=self.samples).__enter__()
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self.start
+        self.span.__exit__(None, None, None)
+        instrument.count("lstm.samples", self.samples)
+        record = dict(logs or {}, epoch=epoch + 1, seconds=seconds, samples_per_sec=self.samples / seconds)
+        self.records.append(record)
+        if self.verbose:
+            print(f"Epoch {epoch + 1}: {seconds:.2f} s, {record['samples_per_sec']:.0f} samples/s")
+
+def fit_model(model, Xw, Yw, config=None, dev=None, indices=None):
+    """Fit the model on the windows (or the given subset) following the config.
+
+    With a dev split (X_dev, Y_dev), every stage stops early once the dev loss
+    stops improving, and the best weights over all stages are restored.
+    Returns one row per epoch: stage, batch size, learning rate, losses,
+    seconds and samples/sec.
+    """
+    config = config or TrainingConfig()
+    samples = len(Xw) if indices is None else len(indices)
+    logger = ThroughputLogger(samples, config.verbose)
+    history = []
+    best, bestWeights, done = np.inf, None, 0
+    for stage, (epochs, batch_size, learning_rate) in enumerate(config.stages):
+        if config.max_epochs is not None:
+            epochs = min(epochs, config.max_epochs - done)
+        if epochs <= 0:
+            break
+        model.optimizer.learning_rate.assign(learning_rate)
+        callbacks = [logger]
+        validation = None
+        if dev is not None:
+            validation = dev
+            callbacks.append(EarlyStopping(monitor="val_loss", patience=config.patience,
+                                           min_delta=config.min_delta, restore_best_weights=True))
+        # feed the windows batch by batch instead of materialising every sequence
+        batches = windows.window_batches(Xw, Yw, batch_size, shuffle=True, repeat=True, indices=indices)
+        seen = len(logger.records)
+        model.fit(batches, steps_per_epoch=windows.steps_per_epoch(Xw if indices is None else indices, batch_size),
+                  initial_epoch=done, epochs=done + epochs, validation_data=validation,
+                  callbacks=callbacks, verbose=0)
+        for record in logger.records[seen:]:
+            history.append(dict(record, stage=stage, batch_size=batch_size, learning_rate=learning_rate))
+        done += len(logger.records) - seen
+
+        if dev is not None:
+            stageBest = min(r["val_loss"] for r in logger.records[seen:])
+            if stageBest < best - config.min_delta:
+                best, bestWeights = stageBest, model.get_weights()
+            elif bestWeights is not None:
+                # this stage did not beat the earlier ones: go back to their best weights
+                model.set_weights(bestWeights)
+                break
+    return pd.DataFrame(history)
+
+def train_and_evaluate(X_train, Y_train, X_test, Y_test, model, config=None, dev=None):
+    history = fit_model(model, X_train, Y_train, config, dev)
+    print(f"Trained {len(history)} epochs in {history['seconds'].sum():.1f} s, "
+          f"{history['samples_per_sec'].mean():.0f} samples/s on average")
     mse = model.evaluate(X_test, Y_test, verbose=0)
     print(f"Test MSE: {mse}")
     return mse
 
-def main():
-    train_data = import_data(os.path.join(DATASET_PATH, "weather_train.csv"))
-    X_train, Y_train = train_data[:, :-1], train_data[:, -1]
-    X_train = np.expand_dims(X_train, axis=1)  # Add time-step dimension
+def _limit_threads(threads):
+    """Pool initializer: cap the thread pools of one cross-validation worker."""
+    for var in THREAD_VARIABLES:
+        os.environ[var] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def run_fold(fold, train_idx, test_idx, lookback=LOOKBACK, horizon=HORIZON, stride=STRIDE, config=None):
+    """Train and evaluate one fold. The worker reads the windows from the memory-mapped dataset cache."""
+    start = time.time()
+    X, Y, _ = import_series()
+    Xw, Yw = windows.make_windows(X, Y, lookback, horizon, stride)
+    model = build_lstm_model(Xw.shape[1:])
+    history = fit_model(model, Xw, Yw, config, indices=train_idx)
+    train_time = time.time() - start
+    pred = model.predict(Xw[test_idx], batch_size=1024, verbose=0)[:, 0]
+    err = pred - Yw[test_idx]
+    return {"fold": fold, "train_windows": len(train_idx), "test_windows": len(test_idx),
+            "mse": float(np.mean(err ** 2)), "mae": float(np.mean(np.abs(err))),
+            "epochs": len(history), "samples_per_sec": float(history["samples_per_sec"].mean()),
+            "train_seconds": train_time, "total_seconds": time.time() - start}
+
+def cross_validate(n_splits=5, workers=None, threads=1, lookback=LOOKBACK, horizon=HORIZON, stride=STRIDE,
+                   config=None):
+    """K-fold cross validation of the LSTM, one fold per worker process.
+
+    workers * threads is kept within the number of cores, so that the folds
+    do not oversubscribe the CPU (a larger workers is clamped). The folds are
+    contiguous blocks of windows, and the training windows that share rows
+    with the test block of a fold are left out of it.
+    Returns one row per fold plus a mean row.
+    """
+    cores = max(1, (os.cpu_count() or 1) // threads)
+    workers = max(1, min(workers or n_splits, n_splits, cores))
+    X, Y, _ = import_series()
+    Xw, _ = windows.make_windows(X, Y, lookback, horizon, stride)
+    folds = windows.gapped_folds(len(Xw), n_splits, lookback, horizon, stride)
+
+    # the spawned workers inherit the limits before they import TensorFlow
+    saved = {var: os.environ.get(var) for var in THREAD_VARIABLES}
+    os.environ.update({var: str(threads) for var in THREAD_VARIABLES})
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_limit_threads, initargs=(threads,)) as pool:
+            futures = [pool.submit(run_fold, fold, train_idx, test_idx, lookback, horizon, stride, config)
+                       for fold, (train_idx, test_idx) in enumerate(folds)]
+            results = pd.DataFrame([f.result() for f in futures])
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+    mean = results.drop(columns="fold").mean().to_dict()
+    mean["fold"] = "mean"
+    return pd.concat([results, pd.DataFrame([mean])], ignore_index=True)
+
+def main(argv):
+    instruction = f"""Usage:
+    python {sys.argv[0]} -o <model path> [-p <profile .json or .trace.json>]
+      OR
+    python {sys.argv[0]} -k <folds> -j <workers> -t <threads per worker> -e <epochs>"""
+    try:
+        opts, args = getopt.getopt(argv, "hk:j:t:e:o:p:")
+    except getopt.GetoptError:
+        print(instruction)
+        sys.exit(2)
+
+    n_splits, workers, threads, epochs, model_path, profile_path = 0, None, 1, None, MODEL_PATH, None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(instruction)
+            sys.exit()
+        elif opt == "-k":
+            n_splits = int(arg)
+        elif opt == "-j":
+            workers = int(arg)
+        elif opt == "-t":
+            threads = int(arg)
+        elif opt == "-e":
+            epochs = int(arg)
+        elif opt == "-o":
+            model_path = arg
+        elif opt == "-p":
+            profile_path = arg
+
+    if n_splits > 1:
+        start = time.time()
+        config = TrainingConfig(max_epochs=epochs, verbose=0)
+        results = cross_validate(n_splits, workers, threads, config=config)
+        print(results.to_string(index=False))
+        print(f"Cross validation took {time.time() - start:.1f} s")
+        return
+
+    profile = instrument.enable() if profile_path is not None else None
+    with instrument.span("load"):
+        ((X_train, Y_train), dev, (X_test, Y_test)), stats = import_sequences()
 
-    test_data = import_data(os.path.join(DATASET_PATH, "weather_test.csv"))
-    X_test, Y_test = test_data[:, :-1], test_data[:, -1]
-    X_test = np.expand_dims(X_test, axis=1)
-    
     model = build_lstm_model(X_train.shape[1:])
-    train_and_evaluate(X_train, Y_train, X_test, Y_test, model)
+    train_and_evaluate(X_train, Y_train, X_test, Y_test, model, TrainingConfig(max_epochs=epochs), dev)
+    export_model(model, stats, model_path)
+    print(f"Model saved to {model_path}.keras and {model_path}.npz")
+    if profile is not None:
+        print("\n".join(profile.report()))
+        print(f"Profile written to {profile.save(profile_path)}")
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
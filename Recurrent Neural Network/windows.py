@@ -0,0 +1,87 @@
+"""Sliding windows over chronological data for the LSTM.
+
+The windows are strided views of the (time x features) array: building them
+copies nothing, and only the rows of the batch being fed to the model are
+gathered into a new array.
+
+Window i covers the rows [i*stride, i*stride + lookback) and is labelled with
+the target ``horizon`` steps after its last row (horizon=0 predicts the last
+hour of the window from its weather history).
+"""
+import numpy as np
+
+
+def sliding_windows(X, lookback, stride=1):
+    """(windows x lookback x features) view of the (time x features) array X."""
+    view = np.lib.stride_tricks.sliding_window_view(X, lookback, axis=0)
+    return view.transpose(0, 2, 1)[::stride]
+
+
+def make_windows(X, y, lookback, horizon=0, stride=1):
+    """Windows of X and their targets in y, both views of the original arrays."""
+    if len(X) != len(y):
+        raise ValueError(f"{len(X)} input rows but {len(y)} targets")
+    if len(X) < lookback + horizon:
+        raise ValueError(f"{len(X)} rows is too short for a lookback of {lookback} and a horizon of {horizon}")
+    Xw = sliding_windows(X[:len(X) - horizon], lookback, stride)
+    yw = y[lookback - 1 + horizon::stride][:len(Xw)]
+    return Xw, yw
+
+
+def chronological_split(n, fractions=(0.8, 0.1, 0.1)):
+    """Contiguous (start, stop) row ranges for train, dev and test."""
+    bounds = np.concatenate([[0], np.cumsum(fractions)]) / np.sum(fractions) * n
+    bounds = bounds.round().astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def gapped_folds(n, n_splits, lookback, horizon=0, stride=1):
+    """(train, test) window indices of k contiguous folds over n windows.
+
+    Windows closer than lookback + horizon rows share rows, so the training
+    windows that overlap a test window are left out of its fold.
+    """
+    gap = (lookback + horizon - 1) // stride
+    index = np.arange(n)
+    for test in np.array_split(index, n_splits):
+        train = index[(index < test[0] - gap) | (index > test[-1] + gap)]
+        yield train, test
+
+
+def window_batches(Xw, yw, batch_size=32, shuffle=False, seed=None, repeat=False, indices=None):
+    """Yield (inputs, targets) batches of windows.
+
+    In order, each batch is a slice of the views; shuffled, or restricted to the
+    given window indices (e.g. a cross-validation fold), only the rows of the
+    batch are gathered. With repeat=True the generator never ends, as expected
+    by Keras when steps_per_epoch is given.
+    """
+    rng = np.random.default_rng(seed)
+    while True:
+        order = indices
+        if shuffle:
+            order = rng.permutation(len(Xw) if indices is None else indices)
+        for start in range(0, len(Xw) if order is None else len(order), batch_size):
+            if order is None:
+                yield Xw[start:start + batch_size], yw[start:start + batch_size]
+            else:
+                idx = np.sort(order[start:start + batch_size])
+                yield Xw[idx], yw[idx]
+        if not repeat:
+            return
+
+
+def steps_per_epoch(Xw, batch_size=32):
+    """Number of batches in one pass over Xw (windows or window indices)."""
+    return -(-len(Xw) // batch_size)
+
+
+def as_tf_dataset(Xw, yw, batch_size=32, shuffle=False, seed=None):
+    """The same batches as a tf.data.Dataset, prefetched."""
+    import tensorflow as tf
+
+    signature = (tf.TensorSpec((None,) + Xw.shape[1:], tf.as_dtype(Xw.dtype)),
+                 tf.TensorSpec((None,) + yw.shape[1:], tf.as_dtype(yw.dtype)))
+    dataset = tf.data.Dataset.from_generator(
+        lambda: window_batches(Xw, yw, batch_size, shuffle, seed), output_signature=signature)
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,100 @@
+import unittest
+
+import numpy as np
+
+import wlr
+
+
+def solution(x, X, y, tau):
+    """Direct transcription of solution() in weighted_linear_regression.m."""
+    w = 1 / 2 * np.exp(-np.diag((X - x) @ (X - x).T) / (2 * tau ** 2))
+    W = np.diag(w)
+    return np.linalg.solve(X.T @ W @ X, X.T @ W @ y)
+
+
+class WlrTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.XTrain = rng.normal(size=(300, 4)) * [1, 3, 10, 0.5] + [0, 5, 60, 29]
+        self.yTrain = self.XTrain @ [2, -1, 0.5, 3] + np.sin(self.XTrain[:, 0]) + rng.normal(size=300)
+        self.XTest = rng.normal(size=(40, 4)) * [1, 3, 10, 0.5] + [0, 5, 60, 29]
+
+    def reference(self, tau):
+        X = np.hstack([np.ones((len(self.XTrain), 1)), self.XTrain])
+        Xq = np.hstack([np.ones((len(self.XTest), 1)), self.XTest])
+        return np.array([x @ solution(x, X, self.yTrain, tau) for x in Xq])
+
+    def test_matchesMatlabSolution(self):
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain)
+        for tau in (3, 10, 100):
+            np.testing.assert_allclose(model.predict(self.XTest, tau), self.reference(tau), rtol=1e-6, atol=1e-6)
+
+    def test_chunking(self):
+        whole = wlr.WeightedLinearRegression(self.XTrain, self.yTrain).predict(self.XTest, 4)
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain, memory_budget=1)
+        self.assertEqual(model.chunk_size(), 1)
+        np.testing.assert_allclose(model.predict(self.XTest, 4), whole)
+
+    def test_float32(self):
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain, dtype="float32")
+        pred = model.predict(self.XTest, 10)
+        self.assertEqual(pred.dtype, np.float32)
+        np.testing.assert_allclose(pred, self.reference(10), rtol=1e-3, atol=1e-2)
+
+    def test_sweep(self):
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain, memory_budget=50000)
+        yTest = self.XTest @ [2, -1, 0.5, 3]
+        taus = [3, 10, 100]
+        devError, pred = model.sweep(self.XTest, yTest, taus)
+        self.assertEqual(pred.shape, (3, len(self.XTest)))
+        for k, tau in enumerate(taus):
+            np.testing.assert_allclose(pred[k], model.predict(self.XTest, tau))
+            self.assertAlmostEqual(devError[k], wlr.lms_error(yTest, pred[k]))
+
+    def test_predictLocal(self):
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain)
+        full = model.predict(self.XTest, 4)
+        pred, bound = model.predict_local(self.XTest, 4, k=len(self.XTrain))
+        np.testing.assert_allclose(pred, full)
+        self.assertFalse(bound.any())
+
+        pred, bound = model.predict_local(self.XTest, 4, tol=1e-12)
+        np.testing.assert_allclose(pred, full, rtol=1e-6)
+        self.assertTrue((bound < 1e-6).all())
+
+        pred, bound = model.predict_local(self.XTest, 4, k=20, dense_fraction=1)
+        self.assertTrue(((bound > 0) & (bound <= 1)).all())
+
+        # small neighbourhoods never need the dense distances
+        model.sq_distances = lambda Xq: self.fail("dense distances")
+        for kwargs in ({"k": 20}, {"radius": 3}, {}):
+            model.predict_local(self.XTest, 1, dense_fraction=1, **kwargs)
+
+    def test_localTolerance(self):
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain)
+        full = model.predict(self.XTest, 1)
+        pred, bound = model.predict_local(self.XTest, 1, dense_fraction=1)
+        self.assertTrue(bound.any())
+        self.assertTrue((bound <= wlr.KERNEL_TOL).all())
+        np.testing.assert_allclose(pred, full, rtol=1e-4)
+
+        # wide neighbourhoods are solved exactly on the whole training set
+        pred, bound = model.predict_local(self.XTest, 100)
+        np.testing.assert_allclose(pred, model.predict(self.XTest, 100))
+        self.assertFalse(bound.any())
+
+    def test_bruteForceNeighbours(self):
+        model = wlr.WeightedLinearRegression(self.XTrain, self.yTrain)
+        indexed = model.predict_local(self.XTest, 4, radius=8)
+        cKDTree, wlr.cKDTree = wlr.cKDTree, None
+        try:
+            brute = wlr.WeightedLinearRegression(self.XTrain, self.yTrain).predict_local(self.XTest, 4, radius=8)
+        finally:
+            wlr.cKDTree = cKDTree
+        np.testing.assert_allclose(brute[0], indexed[0])
+        np.testing.assert_allclose(brute[1], indexed[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
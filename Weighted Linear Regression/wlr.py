@@ -0,0 +1,326 @@
+"""Locally weighted linear regression.
+
+Python port of ``solution(x,X,y,tau)`` from ``weighted_linear_regression.m``.
+The MATLAB version forms the m x m matrix ``(X-x)*(X-x)'`` and a dense
+``diag(w)`` for every query row. Here whole batches of query rows are solved at
+once: squared distances come from ``|q|^2 + |x|^2 - 2 q.x`` and the weighted
+normal equations ``X'WX`` from a single product of the weight block with the
+precomputed per-row outer products ``x_i x_i'``, so nothing larger than
+(batch x m) is ever allocated. The batch is chunked to fit a memory budget.
+
+For small bandwidths most training rows get a negligible weight, so
+``predict_local`` fits each query on its nearest rows only, found through a
+KD-tree over the training inputs (built once), and reports a bound on the share
+of kernel weight that was left out. By default the neighbourhood of a query is
+sized from that share (``KERNEL_TOL``) through the index; queries whose
+neighbourhood is too large to gather row by row are solved densely, as
+``predict`` does.
+"""
+import os
+import time
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # fall back to a brute force neighbour search
+    cKDTree = None
+
+DATASET_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Bandwidth parameters compared by the hold-out cross validation
+TAU = [3, 4, 5, 6, 10, 50, 100, 1000]
+# Bandwidth chosen on the dev set by weighted_linear_regression.m
+BEST_TAU = 4
+# Default memory budget for one chunk of query rows, in bytes
+MEMORY_BUDGET = 64 * 2**20
+# Default share of the total kernel weight that predict_local may leave out
+KERNEL_TOL = 1e-6
+# Share of the training rows above which a neighbourhood is solved densely
+DENSE_FRACTION = 0.02
+# Expected sample rows within the neighbourhood of a query at DENSE_FRACTION
+SCREEN_NEIGHBOURS = 32
+
+
+def import_data(file_path, dtype="float64"):
+    """Load a ``weather_*.csv`` file, returning the inputs (hour dropped) and the energy output."""
+    data = np.loadtxt(file_path, delimiter=";", dtype=dtype, ndmin=2)
+    return data[:, 1:-1], data[:, -1]
+
+
+class WeightedLinearRegression:
+    """Gaussian-kernel weighted least squares fitted independently for every query row.
+
+    X : training inputs, without the intercept term (m x n)
+    y : training outputs (m)
+    dtype : float64, or float32 to halve memory and bandwidth
+    memory_budget : upper bound in bytes on the working set of one query chunk
+    """
+
+    def __init__(self, X, y, dtype="float64", memory_budget=MEMORY_BUDGET):
+        self.dtype = np.dtype(dtype)
+        self.memory_budget = memory_budget
+        X = np.asarray(X, dtype=self.dtype)
+        # The prediction of an affine model does not change when the inputs are
+        # translated, so work around the training mean: it keeps the distance
+        # expansion and the normal equations well conditioned in float32.
+        self.mu = X.mean(axis=0)
+        self.X = self._design(X)
+        self.y = np.asarray(y, dtype=self.dtype)
+        m, n = self.X.shape
+        self.sq_norms = np.einsum("ij,ij->i", self.X, self.X)
+        # x_i x_i' and x_i y_i for every training row, so that X'WX and X'Wy
+        # for a whole chunk of queries are two matrix products with W
+        self.outer = (self.X[:, :, None] * self.X[:, None, :]).reshape(m, n * n)
+        self.xy = self.X * self.y[:, None]
+        self.index = None
+        self.screen = None  # (sample size, index over a sample of the rows)
+
+    def _design(self, X):
+        """Center the inputs and add the intercept term."""
+        X = np.asarray(X, dtype=self.dtype) - self.mu
+        return np.hstack([np.ones((X.shape[0], 1), dtype=self.dtype), X])
+
+    def chunk_size(self):
+        """Number of query rows per chunk that fits in the memory budget."""
+        m, n = self.X.shape
+        # distance and weight rows (m each) dominate, plus the n x n systems
+        per_row = self.dtype.itemsize * (2 * m + 2 * n * n + 3 * n)
+        return max(1, int(self.memory_budget // per_row))
+
+    def sq_distances(self, Xq):
+        """Squared euclidean distances between query rows (design form) and the training rows."""
+        d = Xq @ self.X.T
+        d *= -2
+        d += self.sq_norms[None, :]
+        d += np.einsum("ij,ij->i", Xq, Xq)[:, None]
+        np.maximum(d, 0, out=d)
+        return d
+
+    def _weights(self, d, tau, out=None):
+        # The solution only depends on the weights up to a common factor per
+        # query (which also absorbs the 1/2 of the MATLAB version), so shift by
+        # the closest training row: its weight is 1 and can never underflow.
+        w = np.subtract(d, d.min(axis=1, keepdims=True), out=out)
+        w *= -1.0 / (2.0 * tau ** 2)
+        return np.exp(w, out=w)
+
+    def _solve(self, Xq, w):
+        """Solve the weighted normal equations for every row of the weight block."""
+        n = self.X.shape[1]
+        A = (w @ self.outer).reshape(-1, n, n)
+        b = (w @ self.xy)[:, :, None]
+        try:
+            theta = np.linalg.solve(A, b)
+        except np.linalg.LinAlgError:
+            # MATLAB's backslash still returns an answer for a singular system
+            theta = np.linalg.pinv(A) @ b
+        return np.einsum("ij,ij->i", Xq, theta[:, :, 0])
+
+    def predict(self, Xq, tau):
+        """Predict the output of every query row with bandwidth tau."""
+        Xq = self._design(np.atleast_2d(Xq))
+        pred = np.empty(Xq.shape[0], dtype=self.dtype)
+        step = self.chunk_size()
+        for start in range(0, Xq.shape[0], step):
+            chunk = Xq[start:start + step]
+            d = self.sq_distances(chunk)
+            pred[start:start + step] = self._solve(chunk, self._weights(d, tau, out=d))
+        return pred
+
+    def sweep(self, Xq, yq, taus):
+        """Hold-out cross validation of several bandwidths on the same query rows.
+
+        The distance block of each query chunk is computed once and shared by
+        every tau; only the kernel weights and the weighted solves are redone.
+        Returns the LMS error for each tau and the (len(taus) x mq) predictions.
+        """
+        Xq = self._design(np.atleast_2d(Xq))
+        pred = np.empty((len(taus), Xq.shape[0]), dtype=self.dtype)
+        # the extra weight block shares the budget with the distance block
+        step = max(1, self.chunk_size() * 2 // 3)
+        for start in range(0, Xq.shape[0], step):
+            chunk = Xq[start:start + step]
+            d = self.sq_distances(chunk)
+            w = np.empty_like(d)
+            for k, tau in enumerate(taus):
+                pred[k, start:start + step] = self._solve(chunk, self._weights(d, tau, out=w))
+        devError = np.mean((np.asarray(yq, dtype=self.dtype)[None, :] - pred) ** 2, axis=1)
+        return devError, pred
+
+    def build_index(self):
+        """Build the neighbour index over the training inputs (once)."""
+        if self.index is None and cKDTree is not None:
+            self.index = cKDTree(self.X[:, 1:])
+        return self.index
+
+    def neighbours(self, Xq, k):
+        """The k training rows nearest to each query row (design form), closest first.
+
+        Returns the (b x k) indices and squared distances.
+        """
+        index = self.build_index()
+        if index is not None:
+            d, idx = index.query(Xq[:, 1:], k=k)
+            d, idx = np.atleast_2d(d) ** 2, np.atleast_2d(idx)
+            return idx.reshape(len(Xq), k), d.reshape(len(Xq), k).astype(self.dtype)
+        d = self.sq_distances(Xq)
+        idx = np.argpartition(d, k - 1, axis=1)[:, :k] if k < d.shape[1] else np.tile(np.arange(k), (len(Xq), 1))
+        d = np.take_along_axis(d, idx, axis=1)
+        order = np.argsort(d, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(d, order, axis=1)
+
+    def predict_local(self, Xq, tau, radius=None, k=None, tol=KERNEL_TOL, dense_fraction=DENSE_FRACTION):
+        """Predict with a truncated kernel: each query is fitted on its neighbours only.
+
+        radius : fit on the training rows within this distance of the query
+        k : fit on the k nearest training rows (within radius, if also given)
+        tol : without radius and k, keep the rows within the distance of the
+              query beyond which all the left out rows together weigh at most
+              tol of the total kernel weight
+        dense_fraction : queries whose neighbourhood holds more than this share
+              of the training rows are solved exactly on all of them (the
+              dense blocked path is faster than gathering large neighbourhoods)
+
+        At least n+1 rows (the size of the design) are always kept so that every
+        local system is determined. Returns the predictions and, per query, an
+        upper bound on the fraction of the total kernel weight that the
+        truncation left out (0 for the queries solved densely).
+        """
+        m, n = self.X.shape
+        Xq = self._design(np.atleast_2d(Xq))
+        pred = np.empty(Xq.shape[0], dtype=self.dtype)
+        bound = np.zeros(Xq.shape[0])
+        kMin = min(m, n)
+        step = self.chunk_size()
+        for start in range(0, Xq.shape[0], step):
+            chunk = Xq[start:start + step]
+            counts, r2, d = self._neighbourhoods(chunk, tau, radius, k, tol, dense_fraction)
+            counts = np.minimum(m, np.maximum(counts, kMin))
+            dense = counts > dense_fraction * m
+            if dense.any():
+                rows = np.flatnonzero(dense)
+                d = self.sq_distances(chunk[rows]) if d is None else d[rows]
+                pred[start + rows] = self._solve(chunk[rows], self._weights(d, tau, out=d))
+            local = np.flatnonzero(~dense)
+            while len(local):
+                kq = int(counts[local].max())
+                # the gathered (k x n) neighbour rows are the largest blocks now
+                sub = local[:max(1, int(self.memory_budget // (self.dtype.itemsize * kq * (2 * n + 4))))]
+                local = local[len(sub):]
+                pred[start + sub], bound[start + sub] = self._predict_neighbours(
+                    chunk[sub], tau, kq, None if r2 is None else r2[sub], kMin)
+        return pred, bound
+
+    def _neighbourhoods(self, Xq, tau, radius, k, tol, dense_fraction):
+        """Size of the neighbourhood of each query row (design form), and its squared radius (None for k alone).
+
+        The sizes come from the neighbour index; a size above dense_fraction of
+        the training rows is only known to be above it. Without an index they
+        come from the dense distances, which are returned as well (else None).
+        """
+        m = self.X.shape[0]
+        index = self.build_index()
+        d = None if index is not None else self.sq_distances(Xq)
+        r2 = None
+        if radius is not None:
+            r2 = np.full(len(Xq), float(radius) ** 2)
+        elif k is None:
+            # The nearest row weighs the most, so the (at most m) rows beyond
+            # r2 weigh at most tol / m of it each and tol of the total together.
+            d0 = index.query(Xq[:, 1:], k=1)[0] ** 2 if d is None else d.min(axis=1)
+            r2 = d0 + kernel_radius(tau, tol / m) ** 2
+        if k is not None:
+            return np.full(len(Xq), k), r2, d
+        if d is not None:
+            return np.count_nonzero(d <= r2[:, None], axis=1), r2, d
+        # Counting a large neighbourhood costs as much as the dense solve, so
+        # the queries with more than dense_fraction of a sample of the rows
+        # within r2 are settled first, by the distance to their nearest ones.
+        sample, rank = self.screen_index(dense_fraction)
+        kth = sample.query(Xq[:, 1:], k=[rank])[0][:, 0]
+        counts = np.full(len(Xq), m)
+        small = np.flatnonzero(kth ** 2 > r2)
+        if len(small):
+            counts[small] = index.query_ball_point(Xq[small, 1:], np.sqrt(r2[small]), return_length=True)
+        return counts, r2, d
+
+    def screen_index(self, dense_fraction):
+        """Index over a sample of the training rows and dense_fraction of its size."""
+        m = self.X.shape[0]
+        size = min(m, int(np.ceil(SCREEN_NEIGHBOURS / dense_fraction)))
+        if self.screen is None or self.screen[0] != size:
+            rows = np.random.default_rng(0).choice(m, size, replace=False) if size < m else slice(None)
+            self.screen = (size, cKDTree(self.X[rows, 1:]))
+        return self.screen[1], max(1, min(size, int(np.ceil(dense_fraction * size))))
+
+    def _predict_neighbours(self, Xq, tau, kq, r2, kMin):
+        idx, d = self.neighbours(Xq, kq)
+        keep = np.ones(d.shape, dtype=bool)
+        if r2 is not None:
+            keep[:, kMin:] = d[:, kMin:] <= r2[:, None]
+        w = self._weights(d, tau)
+        w[~keep] = 0
+        Xn = self.X[idx]
+        XnW = np.swapaxes(Xn * w[:, :, None], 1, 2)
+        A = XnW @ Xn
+        b = XnW @ self.y[idx][:, :, None]
+        try:
+            theta = np.linalg.solve(A, b)
+        except np.linalg.LinAlgError:
+            theta = np.linalg.pinv(A) @ b
+        return np.einsum("ij,ij->i", Xq, theta[:, :, 0]), self._truncation_bound(d, keep, w, tau)
+
+    def _truncation_bound(self, d, keep, w, tau):
+        # Every dropped row is at least as far as the first masked candidate
+        # (candidates are sorted), or else as the last candidate. Its relative
+        # weight is therefore at most exp(-(dCut - d0) / (2 tau^2)).
+        m = self.X.shape[0]
+        kept = keep.sum(axis=1)
+        nDropped = m - kept
+        firstMasked = np.minimum(kept, d.shape[1] - 1)
+        dCut = np.take_along_axis(d, firstMasked[:, None], axis=1)[:, 0]
+        wMax = np.exp(-(dCut - d[:, 0]) / (2.0 * tau ** 2))
+        dropped = nDropped * wMax
+        return np.where(nDropped > 0, dropped / (w.sum(axis=1) + dropped), 0.0)
+
+
+def kernel_radius(tau, tol=KERNEL_TOL):
+    """Distance beyond which the Gaussian weight drops below tol times its peak."""
+    return tau * np.sqrt(2.0 * np.log(1.0 / tol))
+
+
+def lms_error(y, pred):
+    """Averaged LMS error, as in the .m script."""
+    return np.mean((y - pred) ** 2)
+
+
+def main():
+    XTrain, yTrain = import_data(os.path.join(DATASET_PATH, "weather_train.csv"))
+    XDev, yDev = import_data(os.path.join(DATASET_PATH, "weather_dev.csv"))
+    XTest, yTest = import_data(os.path.join(DATASET_PATH, "weather_test.csv"))
+
+    model = WeightedLinearRegression(XTrain, yTrain)
+
+    # Hold out cross validation
+    start = time.time()
+    devError, _ = model.sweep(XDev, yDev, TAU)
+    print(f"Swept {len(TAU)} bandwidths in {time.time() - start:.2f} s")
+    for tau, err in zip(TAU, devError):
+        print(f"  tau = {tau}: dev LMS error {err:.2f}")
+
+    # Chosen model
+    start = time.time()
+    energyTestPred = model.predict(XTest, BEST_TAU)
+    print(f"tau = {BEST_TAU}: test LMS error {lms_error(yTest, energyTestPred):.2f} "
+          f"({len(yTest)} rows in {time.time() - start:.2f} s)")
+
+    start = time.time()
+    energyTestPred, bound = model.predict_local(XTest, BEST_TAU)
+    print(f"tau = {BEST_TAU}, truncated kernel: test LMS error "
+          f"{lms_error(yTest, energyTestPred):.2f}, dropped weight <= {bound.max():.2e} "
+          f"({len(yTest)} rows in {time.time() - start:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()